@@ -10,20 +10,40 @@ Design goals:
 from __future__ import annotations
 
 import argparse
+import contextlib
+import cProfile
+import email.utils
+import gzip
+import hashlib
+import heapq
+import http.client
+import http.server
+import io
 import json
+import os
+import pstats
+import random
+import signal
+import socket
 import sqlite3
 import string
 import sys
+import threading
 import time
+import traceback
+import tracemalloc
 import urllib.error
 import urllib.parse
 import urllib.request
+import zlib
 from collections import Counter
-from datetime import datetime, timezone
+from collections.abc import Callable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import UTC, date, datetime, timedelta
 from pathlib import Path
 from typing import Any
 
-API_BASE = "https://custard-calendar.chris-kaschner.workers.dev"
+API_BASE = os.environ.get("CUSTARD_API_BASE", "https://custard-calendar.chris-kaschner.workers.dev")
 USER_AGENT = "custard-backfill/1.0"
 
 ROOT = Path(__file__).resolve().parents[1]
@@ -35,14 +55,39 @@ STORES_PATH = DATA_DIR / "stores.json"
 WI_STORES_PATH = DATA_DIR / "stores_wi.json"
 REST_STORES_PATH = DATA_DIR / "stores_rest.json"
 SNAPSHOT_LOG = DATA_DIR / "snapshot_runs.ndjson"
-
+CALENDAR_PACK = DATA_DIR / "store_calendars.pack"
+EXPORT_DIR = DATA_DIR / "export"
+METRICS_DIR = DATA_DIR / "metrics"
+PROFILE_DIR = DATA_DIR / "profiles"
+ARCHIVE_DIR = DATA_DIR / "archive"
+SNAPSHOT_LOG_MAX_BYTES = 64 * 1024 * 1024
+
+# Pre-SQLite checkpoint files; imported into flavors.sqlite on first open.
 DISCOVER_STATE = STATE_DIR / "discover_state.json"
+ADAPTIVE_DISCOVER_STATE = STATE_DIR / "discover_adaptive_state.json"
 WI_STATE = STATE_DIR / "backfill_wi_state.json"
 REST_STATE = STATE_DIR / "backfill_rest_state.json"
 
+SCHEMA_VERSION = 5
+# Longest a backfill batch keeps the SQLite write lock (see stage_backfill).
+MAX_BATCH_SECONDS = 2.0
+
 
 def utc_now() -> str:
-    return datetime.now(timezone.utc).isoformat()
+    return datetime.now(UTC).isoformat()
+
+
+def use_data_dir(data_dir: Path) -> None:
+    """Point every data/state path at data_dir (benchmarks and scratch runs)."""
+    module = globals()
+    old = DATA_DIR
+    for name, value in list(module.items()):
+        if isinstance(value, Path) and value.is_relative_to(old):
+            module[name] = data_dir / value.relative_to(old)
+
+
+def display_path(path: Path) -> str:
+    return str(path.relative_to(ROOT)) if path.is_relative_to(ROOT) else str(path)
 
 
 def ensure_dirs() -> None:
@@ -51,14 +96,494 @@ def ensure_dirs() -> None:
     CALENDAR_DIR.mkdir(parents=True, exist_ok=True)
 
 
+# Histogram bucket bounds in seconds, shared by request, DB and export timings.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Metrics:
+    """Thread-safe counters and latency histograms for one stage run (Prometheus-style labels)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, stage: str = "") -> None:
+        with self._lock:
+            self.stage = stage
+            self.started_at = utc_now()
+            self._started = time.perf_counter()
+            self.counters: dict[tuple[str, tuple[tuple[str, str], ...]], float] = {}
+            self.histograms: dict[tuple[str, tuple[tuple[str, str], ...]], list[float]] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def observe(self, name: str, seconds: float, **labels: Any) -> None:
+        """Add one observation; a histogram is [bucket counts..., +Inf count, sum]."""
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = [0.0] * (len(LATENCY_BUCKETS) + 2)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    hist[i] += 1
+                    break
+            else:
+                hist[len(LATENCY_BUCKETS)] += 1
+            hist[-1] += seconds
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self) -> dict[str, Any]:
+        """The run as one JSON-able record (histogram buckets are per-bucket, not cumulative)."""
+        with self._lock:
+            counters = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(self.counters.items())]
+            histograms = [
+                {
+                    "name": n,
+                    "labels": dict(l),
+                    "count": int(sum(h[:-1])),
+                    "sum": round(h[-1], 6),
+                    "buckets": dict(zip([*map(str, LATENCY_BUCKETS), "+Inf"], map(int, h[:-1]))),
+                }
+                for (n, l), h in sorted(self.histograms.items())
+            ]
+        return {
+            "stage": self.stage,
+            "started_at": self.started_at,
+            "finished_at": utc_now(),
+            "seconds": round(time.perf_counter() - self._started, 3),
+            "counters": counters,
+            "histograms": histograms,
+        }
+
+    def prometheus(self, snapshot: dict[str, Any], prefix: str = "custard_backfill") -> str:
+        def series(name: str, labels: dict[str, str], value: float) -> str:
+            text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+            return f"{prefix}_{name}{{{text}}} {float(value)!r}"
+
+        stage = {"stage": snapshot["stage"]}
+        lines = [
+            f"# TYPE {prefix}_stage_seconds gauge",
+            series("stage_seconds", stage, snapshot["seconds"]),
+            f"# TYPE {prefix}_stage_finished_timestamp_seconds gauge",
+            series(
+                "stage_finished_timestamp_seconds", stage, datetime.fromisoformat(snapshot["finished_at"]).timestamp()
+            ),
+        ]
+        typed: set[str] = set()
+        for c in snapshot["counters"]:
+            if c["name"] not in typed:
+                typed.add(c["name"])
+                lines.append(f"# TYPE {prefix}_{c['name']} counter")
+            lines.append(series(c["name"], {**stage, **c["labels"]}, c["value"]))
+        for h in snapshot["histograms"]:
+            if h["name"] not in typed:
+                typed.add(h["name"])
+                lines.append(f"# TYPE {prefix}_{h['name']} histogram")
+            labels = {**stage, **h["labels"]}
+            cumulative = 0
+            for bound, count in h["buckets"].items():
+                cumulative += count
+                lines.append(series(h["name"] + "_bucket", {**labels, "le": bound}, cumulative))
+            lines.append(series(h["name"] + "_sum", labels, h["sum"]))
+            lines.append(series(h["name"] + "_count", labels, h["count"]))
+        return "\n".join(lines) + "\n"
+
+    def write(self, metrics_dir: Path) -> dict[str, Any]:
+        """Append this run to metrics.ndjson and replace the stage's .prom file."""
+        snapshot = self.snapshot()
+        metrics_dir.mkdir(parents=True, exist_ok=True)
+        with (metrics_dir / "metrics.ndjson").open("a", encoding="utf-8") as f:
+            f.write(json.dumps(snapshot, separators=(",", ":")) + "\n")
+        atomic_write_bytes(
+            metrics_dir / f"custard_backfill_{snapshot['stage']}.prom", self.prometheus(snapshot).encode("utf-8")
+        )
+        return snapshot
+
+
+METRICS = Metrics()
+
+# Set by the daemon on SIGTERM/SIGINT: stages stop starting new requests,
+# let in-flight ones land, checkpoint and return as if their budget ran out.
+# Rate-limit and retry waits give up at once instead of sleeping it out.
+SHUTDOWN = threading.Event()
+
+
+# Request times HttpClient keeps for its p50/p99 (reservoir-sampled).
+TIMING_SAMPLES = 4096
+
+
+class HttpClient:
+    """Keep-alive, gzip-accepting HTTP(S) client for the Worker API, one connection per thread."""
+
+    def __init__(self, base_url: str, user_agent: str = USER_AGENT) -> None:
+        parts = urllib.parse.urlsplit(base_url)
+        self.base_url = base_url
+        self.scheme = parts.scheme
+        self.host = parts.netloc
+        self.prefix = parts.path.rstrip("/")
+        self.user_agent = user_agent
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open: dict[http.client.HTTPConnection, threading.Thread] = {}
+        self.requests = 0
+        self.connections = 0
+        self.bytes_received = 0
+        # A uniform sample of request times, so a long-running daemon keeps
+        # a fixed amount of memory for the percentiles.
+        self.timings_ms: list[float] = []
+        self.max_timings = TIMING_SAMPLES
+        self.max_ms: float | None = None
+
+    def _connection(self, timeout: float) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            conn = cls(self.host, timeout=timeout)
+            self._local.conn = conn
+            with self._lock:
+                # Threads of a finished pool never reuse theirs; close them.
+                for stale in [c for c, thread in self._open.items() if not thread.is_alive()]:
+                    stale.close()
+                    del self._open[stale]
+                self._open[conn] = threading.current_thread()
+                self.connections += 1
+        elif conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        conn.timeout = timeout
+        return conn
+
+    def _drop(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+            with self._lock:
+                self._open.pop(conn, None)
+
+    def request(
+        self,
+        path: str,
+        params: dict[str, str] | None = None,
+        headers: dict[str, str] | None = None,
+        timeout: float = 30,
+    ) -> tuple[int, dict[str, str], bytes]:
+        """GET path and return (status, lowercased headers, decoded body); raises HTTPError for >= 400."""
+        target = self.prefix + path
+        if params:
+            target += "?" + urllib.parse.urlencode(params)
+        send_headers = {
+            "User-Agent": self.user_agent,
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip",
+        }
+        if headers:
+            send_headers.update(headers)
+
+        started = time.perf_counter()
+        for attempt in (1, 2):
+            reused = getattr(self._local, "conn", None) is not None
+            conn = self._connection(timeout)
+            try:
+                conn.request("GET", target, headers=send_headers)
+                response = conn.getresponse()
+                body = response.read()
+                break
+            except TimeoutError:
+                self._drop()
+                METRICS.inc("http_errors_total", endpoint=path, kind="timeout")
+                raise
+            except (http.client.HTTPException, OSError) as err:
+                self._drop()
+                # A keep-alive connection the server already closed fails on
+                # first use; retry once on a fresh connection.
+                if attempt == 1 and reused:
+                    continue
+                METRICS.inc("http_errors_total", endpoint=path, kind="connection")
+                raise urllib.error.URLError(err) from err
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        METRICS.observe("http_request_seconds", elapsed_ms / 1000.0, endpoint=path)
+        METRICS.inc("http_responses_total", endpoint=path, status=response.status)
+        METRICS.inc("http_wire_bytes_total", len(body), endpoint=path)
+
+        response_headers = {k.lower(): v for k, v in response.getheaders()}
+        if response.will_close:
+            self._drop()
+        if response_headers.get("content-encoding", "").lower() == "gzip":
+            body = gzip.decompress(body)
+
+        METRICS.inc("http_body_bytes_total", len(body), endpoint=path)
+        with self._lock:
+            self.requests += 1
+            self.bytes_received += len(body)
+            self.max_ms = max(self.max_ms or 0.0, elapsed_ms)
+            if len(self.timings_ms) < self.max_timings:
+                self.timings_ms.append(elapsed_ms)
+            else:
+                slot = random.randrange(self.requests)
+                if slot < self.max_timings:
+                    self.timings_ms[slot] = elapsed_ms
+
+        if response.status >= 400:
+            raise urllib.error.HTTPError(
+                f"{self.base_url}{path}", response.status, response.reason, response.msg, None
+            )
+        return response.status, response_headers, body
+
+    def get_json(self, path: str, params: dict[str, str] | None = None, timeout: float = 30) -> dict[str, Any]:
+        _, _, body = self.request(path, params, timeout=timeout)
+        return json.loads(body.decode("utf-8"))
+
+    def timing_summary(self) -> dict[str, Any]:
+        with self._lock:
+            timings = sorted(self.timings_ms)
+            requests = self.requests
+            connections = self.connections
+            received = self.bytes_received
+            max_ms = self.max_ms
+
+        def pct(q: float) -> float | None:
+            if not timings:
+                return None
+            return round(timings[min(len(timings) - 1, int(q * len(timings)))], 1)
+
+        return {
+            "requests": requests,
+            "connections_opened": connections,
+            "bytes_received": received,
+            "p50_ms": pct(0.50),
+            "p99_ms": pct(0.99),
+            "max_ms": round(max_ms, 1) if max_ms is not None else None,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            conns, self._open = list(self._open), {}
+        for conn in conns:
+            conn.close()
+        self._local = threading.local()
+
+
+_client: HttpClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> HttpClient:
+    """Shared client for API_BASE, created on first use."""
+    global _client
+    with _client_lock:
+        if _client is None or _client.base_url != API_BASE:
+            if _client is not None:
+                _client.close()
+            _client = HttpClient(API_BASE)
+        return _client
+
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value: str | None, now: float | None = None) -> float | None:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date)."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=UTC)
+    return max(0.0, when.timestamp() - (time.time() if now is None else now))
+
+
+class RateLimiter:
+    """Token bucket whose rate adapts to how the Worker is coping (AIMD)."""
+    # A burst of in-flight failures cuts the rate once, and Retry-After
+    # pauses the whole bucket, not just the thread that saw it.
+
+    def __init__(
+        self,
+        rate: float = 5.0,
+        min_rate: float = 0.5,
+        max_rate: float = float("inf"),
+        burst: float | None = None,
+        decrease: float = 0.5,
+    ) -> None:
+        self.rate = max(min_rate, min(rate, max_rate))
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.decrease = decrease
+        self.slow_start = True
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._last_cut = float("-inf")
+        self._lock = threading.Lock()
+        self.throttled = 0
+        self.waited_s = 0.0
+
+    def _capacity(self) -> float:
+        return self.burst if self.burst is not None else max(1.0, self.rate)
+
+    def acquire(self) -> None:
+        """Block until a request may be sent; raises URLError once SHUTDOWN is set."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity(), self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._paused_until and self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                delay = max(self._paused_until - now, (1.0 - self._tokens) / self.rate)
+                self.waited_s += delay
+            METRICS.inc("rate_limit_wait_seconds_total", delay)
+            if SHUTDOWN.wait(delay):
+                raise urllib.error.URLError("shutting down")
+
+    def on_success(self) -> None:
+        with self._lock:
+            step = 1.0 if self.slow_start else 1.0 / self.rate
+            self.rate = min(self.max_rate, self.rate + step)
+
+    def on_throttle(self, retry_after: float | None = None) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self.throttled += 1
+            self.slow_start = False
+            if now - self._last_cut >= 1.0:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self._last_cut = now
+                self._tokens = min(self._tokens, 0.0)
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+    def summary(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "rate": round(self.rate, 2),
+                "throttled": self.throttled,
+                "waited_s": round(self.waited_s, 2),
+            }
+
+
+class RetryPolicy:
+    """Jittered exponential backoff for transient failures (full jitter)."""
+
+    def __init__(self, retries: int = 4, base_delay: float = 0.5, max_delay: float = 30.0) -> None:
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self.retried = 0
+        self.gave_up = 0
+
+    def backoff(self, attempt: int, retry_after: float | None = None) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2**attempt)))
+        return max(delay, retry_after or 0.0)
+
+    def call(self, limiter: RateLimiter, fn: Callable[[], Any]) -> Any:
+        """Run fn under the limiter, retrying 429/5xx, timeouts and connection errors."""
+        attempt = 0
+        while True:
+            limiter.acquire()
+            try:
+                result = fn()
+            except urllib.error.HTTPError as err:
+                if err.code not in RETRYABLE_STATUSES:
+                    raise
+                retry_after = parse_retry_after(err.headers.get("Retry-After") if err.headers else None)
+                limiter.on_throttle(retry_after)
+                failure: Exception = err
+                reason = str(err.code)
+            except (urllib.error.URLError, TimeoutError) as err:
+                retry_after = None
+                limiter.on_throttle()
+                failure = err
+                reason = "timeout" if isinstance(err, TimeoutError) else "connection"
+            else:
+                limiter.on_success()
+                return result
+            with self._lock:
+                if attempt >= self.retries:
+                    self.gave_up += 1
+                    METRICS.inc("retries_exhausted_total", reason=reason)
+                    raise failure
+                self.retried += 1
+            METRICS.inc("retries_total", reason=reason)
+            if SHUTDOWN.wait(self.backoff(attempt, retry_after)):
+                raise failure
+            attempt += 1
+
+    def summary(self) -> dict[str, Any]:
+        with self._lock:
+            return {"retries": self.retried, "gave_up": self.gave_up}
+
+
+_limiter = RateLimiter()
+_retry = RetryPolicy()
+
+
+def configure_rate_limit(args: argparse.Namespace) -> None:
+    """Install a fresh limiter and retry policy from a stage's CLI flags."""
+    global _limiter, _retry
+    _limiter = RateLimiter(rate=args.rate, min_rate=args.min_rate, max_rate=args.max_rate or float("inf"))
+    _retry = RetryPolicy(retries=args.retries)
+
+
+def rate_limit_summary() -> dict[str, Any]:
+    return {**_limiter.summary(), **_retry.summary()}
+
+
+def reset_client() -> None:
+    """Close the shared client so the next request starts fresh counters."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+
+
 def get_json(path: str, params: dict[str, str] | None = None, timeout: int = 30) -> dict[str, Any]:
-    query = ""
-    if params:
-        query = "?" + urllib.parse.urlencode(params)
-    url = f"{API_BASE}{path}{query}"
-    req = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
-    with urllib.request.urlopen(req, timeout=timeout) as response:
-        return json.loads(response.read().decode("utf-8"))
+    return _retry.call(_limiter, lambda: get_client().get_json(path, params, timeout=timeout))
+
+
+def get_json_conditional(
+    path: str,
+    params: dict[str, str] | None = None,
+    validators: dict[str, Any] | None = None,
+    timeout: int = 30,
+) -> tuple[int, dict[str, str], dict[str, Any] | None]:
+    """GET with If-None-Match/If-Modified-Since; a 304 returns a None payload."""
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    status, response_headers, body = _retry.call(
+        _limiter, lambda: get_client().request(path, params, headers=headers, timeout=timeout)
+    )
+    if status == 304:
+        return status, response_headers, None
+    return status, response_headers, json.loads(body.decode("utf-8"))
+
+
+def payload_hash(payload: dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
 
 
 def read_json(path: Path, default: Any) -> Any:
@@ -67,12 +592,324 @@ def read_json(path: Path, default: Any) -> Any:
     return json.loads(path.read_text(encoding="utf-8"))
 
 
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    """Write via a temp file and rename, so readers never see a partial file."""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with tmp.open("wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
 def write_json(path: Path, data: Any) -> None:
-    path.write_text(json.dumps(data, indent=2, sort_keys=True), encoding="utf-8")
+    atomic_write_bytes(path, json.dumps(data, indent=2, sort_keys=True).encode("utf-8"))
+
+
+class Exporter:
+    """Per-store calendar files and the rotating snapshot log."""
+
+    def __init__(
+        self,
+        calendar_dir: Path,
+        log_path: Path,
+        max_log_bytes: int = SNAPSHOT_LOG_MAX_BYTES,
+        compress_rotated: bool = True,
+    ) -> None:
+        self.calendar_dir = calendar_dir
+        self.log_path = log_path
+        self.max_log_bytes = max_log_bytes
+        self.compress_rotated = compress_rotated
+        self._log: Any = None
+        self.calendars_written = 0
+        self.calendars_unchanged = 0
+
+    def write_calendar(self, slug: str, calendar: dict[str, Any]) -> bool:
+        with METRICS.timer("export_seconds", kind="calendar"):
+            return self._write_calendar(slug, calendar)
+
+    def _write_calendar(self, slug: str, calendar: dict[str, Any]) -> bool:
+        path = self.calendar_dir / f"{slug}.json"
+        if path.exists():
+            try:
+                current = json.loads(path.read_bytes())
+            except json.JSONDecodeError:
+                current = {}
+            if current.get("store") == calendar["store"] and current.get("flavors") == calendar["flavors"]:
+                self.calendars_unchanged += 1
+                return False
+        atomic_write_bytes(path, json.dumps(calendar, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+        self.calendars_written += 1
+        return True
+
+    def log_snapshot(self, record: dict[str, Any]) -> None:
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with METRICS.timer("export_seconds", kind="snapshot_log"):
+            if self._log is None:
+                self._log = self.log_path.open("a", encoding="utf-8", buffering=1 << 16)
+            if self._log.tell() > 0 and self._log.tell() + len(line) > self.max_log_bytes:
+                self._rotate()
+            self._log.write(line)
+
+    def _rotate(self) -> None:
+        self._log.close()
+        self._log = None
+        stamp = datetime.now(UTC).strftime("%Y%m%dT%H%M%S%f")
+        rotated = self.log_path.with_name(f"{self.log_path.stem}.{stamp}{self.log_path.suffix}")
+        os.replace(self.log_path, rotated)
+        if self.compress_rotated:
+            with rotated.open("rb") as src, gzip.open(rotated.with_name(rotated.name + ".gz"), "wb") as dst:
+                while chunk := src.read(1 << 20):
+                    dst.write(chunk)
+            rotated.unlink()
+        self._log = self.log_path.open("a", encoding="utf-8", buffering=1 << 16)
+
+    def flush(self) -> None:
+        if self._log is not None:
+            self._log.flush()
+
+    def close(self) -> None:
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def summary(self) -> dict[str, int]:
+        return {"calendars_written": self.calendars_written, "calendars_unchanged": self.calendars_unchanged}
+
+
+_exporter: Exporter | None = None
+
+
+def get_exporter() -> Exporter:
+    """Shared exporter for CALENDAR_DIR/SNAPSHOT_LOG, created on first use."""
+    global _exporter
+    if _exporter is None or (_exporter.calendar_dir, _exporter.log_path) != (CALENDAR_DIR, SNAPSHOT_LOG):
+        if _exporter is not None:
+            _exporter.close()
+        _exporter = Exporter(CALENDAR_DIR, SNAPSHOT_LOG)
+    return _exporter
+
+
+def write_calendar_pack(calendar_dir: Path, pack_path: Path) -> int:
+    """Pack every calendar into one file: a JSON index line of slug -> [offset, length], then the records."""
+    records: list[tuple[str, bytes]] = []
+    for path in sorted(calendar_dir.glob("*.json")):
+        data = json.loads(path.read_bytes())
+        records.append((path.stem, json.dumps(data, sort_keys=True, separators=(",", ":")).encode("utf-8")))
+    index: dict[str, list[int]] = {}
+    offset = 0
+    for slug, data in records:
+        index[slug] = [offset, len(data)]
+        offset += len(data)
+    header = json.dumps(index, separators=(",", ":")).encode("utf-8") + b"\n"
+    atomic_write_bytes(pack_path, header + b"".join(data for _, data in records))
+    return len(records)
+
+
+def read_packed_calendar(pack_path: Path, slug: str) -> dict[str, Any] | None:
+    with pack_path.open("rb") as f:
+        index = json.loads(f.readline())
+        if slug not in index:
+            return None
+        offset, length = index[slug]
+        f.seek(f.tell() + offset)
+        return json.loads(f.read(length))
+
+
+def content_name(stem: str, data: bytes) -> str:
+    """Immutable file name: stem plus the first 12 hex digits of sha256(data)."""
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}.json"
+
+
+def shard_key(slug: str, prefix_len: int) -> str:
+    return slug[:prefix_len].lower()
+
+
+def build_forecast_shards(
+    conn: sqlite3.Connection,
+    prefixes: set[str] | None,
+    prefix_len: int,
+    first_date: str,
+    last_date: str,
+) -> dict[str, dict[str, Any]]:
+    """Forecast shards for the given slug prefixes (None = all), keyed by prefix."""
+    shards: dict[str, dict[str, Any]] = {}
+    rows = conn.execute(
+        """
+        SELECT s.slug, s.name, s.city, s.state, f.flavor_date, f.title
+        FROM stores s
+        JOIN store_flavors f ON f.store_slug = s.slug
+        WHERE f.flavor_date BETWEEN ? AND ?
+        ORDER BY s.slug, f.flavor_date
+        """,
+        (first_date, last_date),
+    )
+    for slug, name, city, state, flavor_date, title in rows:
+        key = shard_key(slug, prefix_len)
+        if prefixes is not None and key not in prefixes:
+            continue
+        stores = shards.setdefault(key, {"date": first_date, "through": last_date, "stores": {}})["stores"]
+        if slug not in stores:
+            stores[slug] = {"name": name, "city": city, "state": state, "brand": brand_from_slug(slug), "flavors": []}
+        stores[slug]["flavors"].append({"date": flavor_date, "title": title})
+    return shards
+
+
+def build_store_index(conn: sqlite3.Connection) -> dict[str, Any]:
+    """Typeahead index: one [slug, name, city, state, brand] row per store, by slug."""
+    rows = conn.execute("SELECT slug, name, city, state FROM stores ORDER BY slug")
+    return {
+        "fields": ["slug", "name", "city", "state", "brand"],
+        "stores": [[slug, name, city, state, brand_from_slug(slug)] for slug, name, city, state in rows],
+    }
+
+
+def export_static(
+    conn: sqlite3.Connection,
+    export_dir: Path,
+    today: str,
+    days: int,
+    prefix_len: int,
+    full: bool = False,
+) -> dict[str, Any]:
+    """Write content-hashed forecast shards and the store index, listed in manifest.json."""
+    # Only stores with snapshots newer than the manifest's are rebuilt,
+    # unless the window (today, days, prefix_len) moved.
+    manifest_path = export_dir / "manifest.json"
+    previous = read_json(manifest_path, {})
+    last_date = (datetime.fromisoformat(today) + timedelta(days=days)).date().isoformat()
+    watermark = conn.execute("SELECT COALESCE(MAX(id), 0) FROM snapshots").fetchone()[0]
+
+    window = {"date": today, "days": days, "prefix_len": prefix_len}
+    rebuild_all = full or any(previous.get(k) != v for k, v in window.items())
+    shards_meta: dict[str, dict[str, Any]] = {} if rebuild_all else dict(previous.get("shards", {}))
+    if rebuild_all:
+        dirty = None
+    else:
+        rows = conn.execute(
+            "SELECT DISTINCT store_slug FROM snapshots WHERE id > ?", (previous.get("snapshot_watermark", 0),)
+        )
+        dirty = {shard_key(r[0], prefix_len) for r in rows}
+
+    (export_dir / "forecast").mkdir(parents=True, exist_ok=True)
+    written = 0
+    unchanged = 0
+    if dirty is None or dirty:
+        shards = build_forecast_shards(conn, dirty, prefix_len, today, last_date)
+        for key in sorted(dirty if dirty is not None else shards):
+            shard = shards.get(key)
+            if shard is None:
+                shards_meta.pop(key, None)
+                continue
+            data = json.dumps(shard, sort_keys=True, separators=(",", ":")).encode("utf-8")
+            name = "forecast/" + content_name(key or "_", data)
+            if shards_meta.get(key, {}).get("file") == name:
+                unchanged += 1
+                continue
+            if not (export_dir / name).exists():
+                atomic_write_bytes(export_dir / name, data)
+            shards_meta[key] = {"file": name, "stores": len(shard["stores"]), "bytes": len(data)}
+            written += 1
+
+    index = build_store_index(conn)
+    index_data = json.dumps(index, separators=(",", ":")).encode("utf-8")
+    index_name = content_name("stores", index_data)
+    if not (export_dir / index_name).exists():
+        atomic_write_bytes(export_dir / index_name, index_data)
+
+    # The generation before this one stays on disk (listed as "retained"),
+    # so a client still holding the previous manifest can fetch its files.
+    live = {index_name, *(m["file"] for m in shards_meta.values())}
+    previous_files = {m["file"] for m in [previous.get("stores_index"), *previous.get("shards", {}).values()] if m}
+    retained = previous_files - live if previous_files != live else set(previous.get("retained", []))
+    manifest = {
+        **window,
+        "through": last_date,
+        "snapshot_watermark": watermark,
+        "stores_index": {"file": index_name, "bytes": len(index_data)},
+        "shards": dict(sorted(shards_meta.items())),
+        "retained": sorted(retained),
+    }
+    if manifest != previous:
+        write_json(manifest_path, manifest)
+
+    # Drop files neither this generation nor the previous one references.
+    live |= retained
+    removed = 0
+    for path in [*export_dir.glob("stores.*.json"), *(export_dir / "forecast").glob("*.json")]:
+        if path.relative_to(export_dir).as_posix() not in live:
+            path.unlink()
+            removed += 1
+
+    return {
+        "date": today,
+        "through": last_date,
+        "full_rebuild": rebuild_all,
+        "shards": len(shards_meta),
+        "shards_written": written,
+        "shards_unchanged": unchanged,
+        "files_removed": removed,
+        "stores_indexed": len(index["stores"]),
+    }
 
 
-def init_db() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
+class KeepOpenConnection(sqlite3.Connection):
+    """The daemon's shared connection: close() only ends the transaction, shutdown() closes."""
+
+    def close(self) -> None:
+        self.rollback()
+
+    def shutdown(self) -> None:
+        super().close()
+
+
+STORE_FTS_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS store_fts USING fts5(
+    slug, name, city, content='stores', content_rowid='rowid', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS store_fts_ai AFTER INSERT ON stores BEGIN
+    INSERT INTO store_fts(rowid, slug, name, city) VALUES (new.rowid, new.slug, new.name, new.city);
+END;
+CREATE TRIGGER IF NOT EXISTS store_fts_ad AFTER DELETE ON stores BEGIN
+    INSERT INTO store_fts(store_fts, rowid, slug, name, city) VALUES ('delete', old.rowid, old.slug, old.name, old.city);
+END;
+CREATE TRIGGER IF NOT EXISTS store_fts_au AFTER UPDATE OF slug, name, city ON stores
+WHEN old.slug IS NOT new.slug OR old.name IS NOT new.name OR old.city IS NOT new.city BEGIN
+    INSERT INTO store_fts(store_fts, rowid, slug, name, city) VALUES ('delete', old.rowid, old.slug, old.name, old.city);
+    INSERT INTO store_fts(rowid, slug, name, city) VALUES (new.rowid, new.slug, new.name, new.city);
+END;
+"""
+
+
+def trigram_supported(conn: sqlite3.Connection) -> bool:
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.trigram_probe USING fts5(x, tokenize='trigram')")
+    except sqlite3.OperationalError:
+        return False
+    conn.execute("DROP TABLE temp.trigram_probe")
+    return True
+
+
+def store_fts_enabled(conn: sqlite3.Connection) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'store_fts_ai'").fetchone() is not None
+
+
+_shared_conn: KeepOpenConnection | None = None
+
+
+def init_db(factory: type[sqlite3.Connection] = sqlite3.Connection) -> sqlite3.Connection:
+    if _shared_conn is not None:
+        return _shared_conn
+    conn = sqlite3.connect(DB_PATH, factory=factory)
+    # Lets compact hand freed pages back to the filesystem without a full
+    # VACUUM. Only takes effect on a new file, so it must come before WAL.
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    # WAL lets readers (status) run during a backfill and turns each commit
+    # into an append instead of a rollback-journal rewrite; NORMAL only
+    # fsyncs at checkpoints, which is still durable against process crashes.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA busy_timeout=5000")
     conn.execute(
         """
         CREATE TABLE IF NOT EXISTS stores (
@@ -94,10 +931,158 @@ def init_db() -> sqlite3.Connection:
             description TEXT,
             first_seen_at TEXT,
             last_seen_at TEXT,
+            title_norm TEXT,
             PRIMARY KEY (store_slug, flavor_date)
         )
         """
     )
+    # Trigram FTS over the fields the Worker's /api/v1/stores?q= matches
+    # (slug, name, city): any substring of 3+ characters is an index lookup.
+    # Kept current by the triggers, like flavor_fts. The trigram tokenizer
+    # needs SQLite 3.34+; without it the triggers are dropped and
+    # search_stores falls back to a LIKE scan.
+    if not trigram_supported(conn):
+        for suffix in ("ai", "ad", "au"):
+            conn.execute(f"DROP TRIGGER IF EXISTS store_fts_{suffix}")
+    else:
+        stale = not store_fts_enabled(conn)
+        conn.executescript(STORE_FTS_SQL)
+        if stale:
+            conn.execute("INSERT INTO store_fts(store_fts) VALUES ('rebuild')")
+    ensure_column(conn, "store_flavors", "title_norm", "TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_store_flavors_date ON store_flavors(flavor_date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_store_flavors_title ON store_flavors(title_norm, flavor_date)")
+    conn.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS flavor_fts USING fts5(
+            title, description, content='store_flavors', content_rowid='rowid'
+        )
+        """
+    )
+    # External-content FTS: the upsert path keeps the index current through
+    # these triggers. Updates that leave the text alone do not touch it.
+    conn.executescript(
+        """
+        CREATE TRIGGER IF NOT EXISTS flavor_fts_ai AFTER INSERT ON store_flavors BEGIN
+            INSERT INTO flavor_fts(rowid, title, description) VALUES (new.rowid, new.title, new.description);
+        END;
+        CREATE TRIGGER IF NOT EXISTS flavor_fts_ad AFTER DELETE ON store_flavors BEGIN
+            INSERT INTO flavor_fts(flavor_fts, rowid, title, description)
+            VALUES ('delete', old.rowid, old.title, old.description);
+        END;
+        CREATE TRIGGER IF NOT EXISTS flavor_fts_au AFTER UPDATE OF title, description ON store_flavors
+        WHEN old.title IS NOT new.title OR old.description IS NOT new.description BEGIN
+            INSERT INTO flavor_fts(flavor_fts, rowid, title, description)
+            VALUES ('delete', old.rowid, old.title, old.description);
+            INSERT INTO flavor_fts(rowid, title, description) VALUES (new.rowid, new.title, new.description);
+        END;
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_store_flavors_store_title ON store_flavors(store_slug, title_norm, flavor_date)"
+    )
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS flavor_store_stats (
+            store_slug TEXT,
+            title_norm TEXT,
+            title TEXT,
+            appearances INTEGER NOT NULL,
+            first_date TEXT,
+            last_date TEXT,
+            PRIMARY KEY (store_slug, title_norm)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_flavor_store_stats_title ON flavor_store_stats(title_norm);
+        CREATE TABLE IF NOT EXISTS flavor_stats (
+            title_norm TEXT PRIMARY KEY,
+            title TEXT,
+            appearances INTEGER NOT NULL,
+            stores INTEGER NOT NULL,
+            first_date TEXT,
+            last_date TEXT
+        ) WITHOUT ROWID;
+        """
+    )
+    # Aggregates follow store_flavors row by row, like flavor_fts: each
+    # inserted, deleted or retitled row adjusts one flavor_store_stats row,
+    # whose own triggers adjust the flavor's flavor_stats row. Average gap
+    # needs no history scan: it is (last_date - first_date) / (appearances - 1).
+    # Shrinking a date range (deletes only) re-reads the bound from an index.
+    conn.executescript(
+        """
+        CREATE TRIGGER IF NOT EXISTS flavor_stats_ai AFTER INSERT ON store_flavors
+        WHEN new.title_norm IS NOT NULL BEGIN
+            INSERT INTO flavor_store_stats(store_slug, title_norm, title, appearances, first_date, last_date)
+            VALUES (new.store_slug, new.title_norm, new.title, 1, new.flavor_date, new.flavor_date)
+            ON CONFLICT(store_slug, title_norm) DO UPDATE SET
+                title = excluded.title,
+                appearances = appearances + 1,
+                first_date = MIN(first_date, excluded.first_date),
+                last_date = MAX(last_date, excluded.last_date);
+        END;
+        CREATE TRIGGER IF NOT EXISTS flavor_stats_ad AFTER DELETE ON store_flavors
+        WHEN old.title_norm IS NOT NULL BEGIN
+            UPDATE flavor_store_stats SET
+                appearances = appearances - 1,
+                first_date = (SELECT MIN(flavor_date) FROM store_flavors
+                              WHERE store_slug = old.store_slug AND title_norm = old.title_norm),
+                last_date = (SELECT MAX(flavor_date) FROM store_flavors
+                             WHERE store_slug = old.store_slug AND title_norm = old.title_norm)
+            WHERE store_slug = old.store_slug AND title_norm = old.title_norm;
+            DELETE FROM flavor_store_stats
+            WHERE store_slug = old.store_slug AND title_norm = old.title_norm AND appearances <= 0;
+        END;
+        CREATE TRIGGER IF NOT EXISTS flavor_stats_au AFTER UPDATE OF title_norm ON store_flavors
+        WHEN old.title_norm IS NOT new.title_norm BEGIN
+            UPDATE flavor_store_stats SET
+                appearances = appearances - 1,
+                first_date = (SELECT MIN(flavor_date) FROM store_flavors
+                              WHERE store_slug = old.store_slug AND title_norm = old.title_norm),
+                last_date = (SELECT MAX(flavor_date) FROM store_flavors
+                             WHERE store_slug = old.store_slug AND title_norm = old.title_norm)
+            WHERE store_slug = old.store_slug AND title_norm = old.title_norm;
+            DELETE FROM flavor_store_stats
+            WHERE store_slug = old.store_slug AND title_norm = old.title_norm AND appearances <= 0;
+            INSERT INTO flavor_store_stats(store_slug, title_norm, title, appearances, first_date, last_date)
+            SELECT new.store_slug, new.title_norm, new.title, 1, new.flavor_date, new.flavor_date
+            WHERE new.title_norm IS NOT NULL
+            ON CONFLICT(store_slug, title_norm) DO UPDATE SET
+                title = excluded.title,
+                appearances = appearances + 1,
+                first_date = MIN(first_date, excluded.first_date),
+                last_date = MAX(last_date, excluded.last_date);
+        END;
+        CREATE TRIGGER IF NOT EXISTS flavor_store_stats_ai AFTER INSERT ON flavor_store_stats BEGIN
+            INSERT INTO flavor_stats(title_norm, title, appearances, stores, first_date, last_date)
+            VALUES (new.title_norm, new.title, new.appearances, 1, new.first_date, new.last_date)
+            ON CONFLICT(title_norm) DO UPDATE SET
+                title = excluded.title,
+                appearances = appearances + excluded.appearances,
+                stores = stores + 1,
+                first_date = MIN(first_date, excluded.first_date),
+                last_date = MAX(last_date, excluded.last_date);
+        END;
+        CREATE TRIGGER IF NOT EXISTS flavor_store_stats_au AFTER UPDATE ON flavor_store_stats BEGIN
+            UPDATE flavor_stats SET
+                title = new.title,
+                appearances = appearances + new.appearances - old.appearances,
+                first_date = CASE WHEN new.first_date <= old.first_date THEN MIN(first_date, new.first_date)
+                    ELSE (SELECT MIN(s.first_date) FROM flavor_store_stats s WHERE s.title_norm = new.title_norm) END,
+                last_date = CASE WHEN new.last_date >= old.last_date THEN MAX(last_date, new.last_date)
+                    ELSE (SELECT MAX(s.last_date) FROM flavor_store_stats s WHERE s.title_norm = new.title_norm) END
+            WHERE title_norm = new.title_norm;
+        END;
+        CREATE TRIGGER IF NOT EXISTS flavor_store_stats_ad AFTER DELETE ON flavor_store_stats BEGIN
+            UPDATE flavor_stats SET
+                appearances = appearances - old.appearances,
+                stores = stores - 1,
+                first_date = (SELECT MIN(s.first_date) FROM flavor_store_stats s WHERE s.title_norm = old.title_norm),
+                last_date = (SELECT MAX(s.last_date) FROM flavor_store_stats s WHERE s.title_norm = old.title_norm)
+            WHERE title_norm = old.title_norm;
+            DELETE FROM flavor_stats WHERE title_norm = old.title_norm AND stores <= 0;
+        END;
+        """
+    )
     conn.execute(
         """
         CREATE TABLE IF NOT EXISTS snapshots (
@@ -108,81 +1093,1013 @@ def init_db() -> sqlite3.Connection:
             flavor_count INTEGER,
             min_date TEXT,
             max_date TEXT,
-            raw_json TEXT
+            raw_json TEXT,
+            payload_hash TEXT
         )
         """
     )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS snapshot_blobs (
+            hash TEXT PRIMARY KEY,
+            encoding TEXT,
+            size INTEGER,
+            data BLOB
+        )
+        """
+    )
+    ensure_column(conn, "snapshots", "payload_hash", "TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_snapshots_store ON snapshots(store_slug, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_snapshots_payload_hash ON snapshots(payload_hash)")
+    conn.create_function("inflate", 2, inflate_blob, deterministic=True)
+    conn.create_function("normalize_title", 1, normalize_title, deterministic=True)
+    conn.create_function("brand", 1, brand_from_slug, deterministic=True)
+    conn.execute(
+        """
+        CREATE VIEW IF NOT EXISTS snapshot_payloads AS
+        SELECT s.id, s.fetched_at, s.segment, s.store_slug, s.flavor_count, s.min_date, s.max_date,
+               COALESCE(s.raw_json, inflate(b.encoding, b.data)) AS raw_json
+        FROM snapshots s LEFT JOIN snapshot_blobs b ON b.hash = s.payload_hash
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS store_validators (
+            store_slug TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            content_hash TEXT,
+            changed_at TEXT,
+            checked_at TEXT
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS discover_progress (
+            strategy TEXT PRIMARY KEY,
+            started_at TEXT,
+            next_index INTEGER NOT NULL DEFAULT 0,
+            frontier_json TEXT,
+            done INTEGER NOT NULL DEFAULT 0,
+            last_updated_at TEXT
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS discovered_stores (
+            strategy TEXT,
+            slug TEXT,
+            name TEXT,
+            city TEXT,
+            state TEXT,
+            first_seen_at TEXT,
+            last_seen_at TEXT,
+            PRIMARY KEY (strategy, slug)
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS backfill_progress (
+            segment TEXT PRIMARY KEY,
+            started_at TEXT,
+            next_index INTEGER NOT NULL DEFAULT 0,
+            last_updated_at TEXT
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS backfill_completed (
+            segment TEXT,
+            store_slug TEXT,
+            completed_at TEXT,
+            PRIMARY KEY (segment, store_slug)
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS backfill_retry (
+            segment TEXT,
+            store_slug TEXT,
+            store_json TEXT NOT NULL,
+            attempts INTEGER NOT NULL,
+            last_error TEXT,
+            first_failed_at TEXT,
+            last_failed_at TEXT,
+            next_eligible_at TEXT,
+            PRIMARY KEY (segment, store_slug)
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS flavor_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            detected_at TEXT NOT NULL,
+            store_slug TEXT NOT NULL,
+            flavor_date TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            old_title TEXT,
+            new_title TEXT
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_flavor_changes_detected ON flavor_changes(detected_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_flavor_changes_store ON flavor_changes(store_slug, flavor_date)")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS backfill_leases (
+            segment TEXT,
+            store_slug TEXT,
+            owner TEXT NOT NULL,
+            leased_at TEXT NOT NULL,
+            expires_at TEXT NOT NULL,
+            PRIMARY KEY (segment, store_slug)
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_backfill_leases_owner ON backfill_leases(owner)")
     conn.commit()
+    migrate_db(conn)
+    import_legacy_state(conn)
     return conn
 
 
-def all_discovery_tokens() -> list[str]:
-    chars = string.ascii_lowercase + string.digits
-    return [a + b for a in chars for b in chars]
+def normalize_title(title: str | None) -> str:
+    """Case- and quote-insensitive flavor key ("Devil’s Food Cake" == "devil's food cake")."""
+    text = (title or "").replace("\u2019", "'").replace("\u2018", "'").lower()
+    return " ".join(text.split())
+
+
+def brand_from_slug(slug: str | None) -> str:
+    """Detect brand from store slug, mirroring brand_from_slug in culvers_fotd.star."""
+    slug = slug or ""
+    if slug.startswith("kopps-") or slug == "kopps":
+        return "kopps"
+    if slug == "gilles":
+        return "gilles"
+    if slug == "hefners":
+        return "hefners"
+    if slug == "kraverz":
+        return "kraverz"
+    if slug.startswith("oscars"):
+        return "oscars"
+    return "culvers"
+
+
+def ensure_column(conn: sqlite3.Connection, table: str, column: str, decl: str) -> None:
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def migrate_db(conn: sqlite3.Connection) -> None:
+    """Bring an existing database up to SCHEMA_VERSION (tracked in user_version)."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version < 1:
+        migrated = migrate_snapshot_blobs(conn)
+        if migrated:
+            print(f"migrated {migrated} snapshot payloads into snapshot_blobs", file=sys.stderr)
+    if version < 2:
+        conn.execute("UPDATE store_flavors SET title_norm = normalize_title(title) WHERE title_norm IS NULL")
+        conn.execute("INSERT INTO flavor_fts(flavor_fts) VALUES ('rebuild')")
+    if version < 3:
+        rebuild_flavor_stats(conn)
+    if version < 5:
+        # Discovered stores join stores (unfetched: last_seen_at NULL) so search finds them.
+        conn.execute(
+            """
+            INSERT OR IGNORE INTO stores(slug, name, city, state, first_seen_at)
+            SELECT slug, MAX(name), MAX(city), MAX(state), MIN(first_seen_at)
+            FROM discovered_stores GROUP BY slug
+            """
+        )
+    if version < SCHEMA_VERSION:
+        conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        conn.commit()
 
 
-def stage_discover(args: argparse.Namespace) -> int:
-    ensure_dirs()
-    tokens = all_discovery_tokens()
+def rebuild_flavor_stats(conn: sqlite3.Connection) -> None:
+    """Recompute the flavor aggregates from store_flavors (the triggers keep them current after)."""
+    conn.execute("DELETE FROM flavor_store_stats")
+    conn.execute("DELETE FROM flavor_stats")
+    conn.execute(
+        """
+        INSERT INTO flavor_store_stats(store_slug, title_norm, title, appearances, first_date, last_date)
+        SELECT store_slug, title_norm, MAX(title), COUNT(*), MIN(flavor_date), MAX(flavor_date)
+        FROM store_flavors WHERE title_norm IS NOT NULL
+        GROUP BY store_slug, title_norm
+        """
+    )
+    conn.commit()
 
-    state = read_json(
-        DISCOVER_STATE,
-        {
-            "started_at": utc_now(),
-            "next_index": 0,
-            "stores": {},
-            "completed_tokens": 0,
-            "last_updated_at": None,
-        },
+
+def commit(conn: sqlite3.Connection) -> None:
+    """Commit a stage's batch, timing it into the db_write_seconds histogram."""
+    with METRICS.timer("db_write_seconds", op="commit"):
+        conn.commit()
+
+
+def put_blob(conn: sqlite3.Connection, raw: str) -> str:
+    """Store raw JSON once, zlib-compressed, keyed by its SHA-256."""
+    data = raw.encode("utf-8")
+    digest = hashlib.sha256(data).hexdigest()
+    conn.execute(
+        "INSERT OR IGNORE INTO snapshot_blobs(hash, encoding, size, data) VALUES(?, 'zlib', ?, ?)",
+        (digest, len(data), zlib.compress(data, 9)),
     )
+    return digest
+
+
+def inflate_blob(encoding: str | None, data: bytes | None) -> str | None:
+    if data is None:
+        return None
+    if encoding == "zlib":
+        data = zlib.decompress(data)
+    return data.decode("utf-8")
+
+
+def migrate_snapshot_blobs(conn: sqlite3.Connection, chunk: int = 500) -> int:
+    """Move inline snapshots.raw_json into snapshot_blobs. Returns rows moved."""
+    moved = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, raw_json FROM snapshots WHERE raw_json IS NOT NULL LIMIT ?", (chunk,)
+        ).fetchall()
+        if not rows:
+            return moved
+        for snapshot_id, raw in rows:
+            digest = put_blob(conn, raw)
+            conn.execute("UPDATE snapshots SET payload_hash=?, raw_json=NULL WHERE id=?", (digest, snapshot_id))
+        conn.commit()
+        moved += len(rows)
 
-    next_index = int(state.get("next_index", 0))
-    stores_map: dict[str, dict[str, Any]] = state.get("stores", {})
 
-    processed = 0
-    while next_index < len(tokens) and processed < args.tokens_per_run:
-        token = tokens[next_index]
-        try:
-            payload = get_json("/api/v1/stores", {"q": token}, timeout=args.timeout)
-        except (urllib.error.URLError, TimeoutError) as err:
-            print(f"discover error token={token}: {err}", file=sys.stderr)
+def read_snapshot_payloads(
+    conn: sqlite3.Connection,
+    slug: str | None = None,
+    limit: int | None = None,
+) -> list[dict[str, Any]]:
+    """Snapshots newest first, with raw_json inflated from snapshot_blobs."""
+    sql = "SELECT id, fetched_at, segment, store_slug, flavor_count, min_date, max_date, raw_json FROM snapshot_payloads"
+    params: list[Any] = []
+    if slug is not None:
+        sql += " WHERE store_slug = ?"
+        params.append(slug)
+    sql += " ORDER BY id DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    keys = ("id", "fetched_at", "segment", "store_slug", "flavor_count", "min_date", "max_date", "raw_json")
+    return [dict(zip(keys, row)) for row in conn.execute(sql, params)]
+
+
+# Per store, rank the snapshots older than :keep_all within their retention
+# bucket (UTC day until :daily, then month), newest first; all but the
+# newest of each bucket are pruned.
+PRUNABLE_SNAPSHOTS_SQL = """
+    SELECT id FROM (
+        SELECT id, ROW_NUMBER() OVER (PARTITION BY store_slug, bucket ORDER BY id DESC) AS rank
+        FROM (
+            SELECT id, store_slug,
+                   CASE WHEN fetched_at >= :daily THEN substr(fetched_at, 1, 10) ELSE substr(fetched_at, 1, 7) END
+                   AS bucket
+            FROM snapshots WHERE fetched_at < :keep_all
+        )
+    )
+    WHERE rank > 1 ORDER BY id
+"""
+
+
+def append_archive(path: Path, lines: list[str]) -> int:
+    """Append lines to a gzip archive as one new fsynced member; returns bytes written."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("ab") as f:
+        start = f.tell()
+        with gzip.GzipFile(fileobj=f, mode="wb", compresslevel=9, mtime=0) as gz:
+            gz.write("".join(lines).encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+        return f.tell() - start
+
+
+def archive_partition(archive_dir: Path, kind: str, day: str) -> Path:
+    """archive/<kind>/YYYY-MM/YYYY-MM-DD.ndjson.gz for a UTC date (or "undated")."""
+    day = day or "undated"
+    return archive_dir / kind / day[:7] / f"{day}.ndjson.gz"
+
+
+def compact_snapshots(
+    conn: sqlite3.Connection,
+    archive_dir: Path,
+    today: str,
+    keep_all_days: int = 14,
+    daily_days: int = 90,
+    dry_run: bool = False,
+    chunk: int = 2000,
+) -> dict[str, Any]:
+    """Prune snapshots to the retention policy, archiving what is removed."""
+    # Archives are fsynced before the delete commits; a crash in between only
+    # repeats lines, which carry their snapshot id.
+    day = date.fromisoformat(today)
+    keep_all = (day - timedelta(days=keep_all_days)).isoformat()
+    daily = min((day - timedelta(days=daily_days)).isoformat(), keep_all)
+    ids = [r[0] for r in conn.execute(PRUNABLE_SNAPSHOTS_SQL, {"keep_all": keep_all, "daily": daily})]
+    summary: dict[str, Any] = {
+        "keep_all_since": keep_all,
+        "daily_since": daily,
+        "pruned": len(ids),
+        "blobs_deleted": 0,
+        "archive_files": 0,
+        "archive_bytes": 0,
+    }
+    if dry_run:
+        return summary
+
+    keys = ("id", "fetched_at", "segment", "store_slug", "flavor_count", "min_date", "max_date", "raw_json")
+    files: set[Path] = set()
+    for start in range(0, len(ids), chunk):
+        batch = ids[start : start + chunk]
+        marks = ",".join("?" * len(batch))
+        by_day: dict[str, list[str]] = {}
+        for row in conn.execute(
+            f"SELECT {', '.join(keys)} FROM snapshot_payloads WHERE id IN ({marks}) ORDER BY id", batch
+        ):
+            record = dict(zip(keys, row))
+            by_day.setdefault((record["fetched_at"] or "")[:10], []).append(json.dumps(record) + "\n")
+        for fetched_day, lines in sorted(by_day.items()):
+            path = archive_partition(archive_dir, "snapshots", fetched_day)
+            summary["archive_bytes"] += append_archive(path, lines)
+            files.add(path)
+
+        with METRICS.timer("db_write_seconds", op="compact"):
+            hashes = [
+                r[0]
+                for r in conn.execute(
+                    f"SELECT DISTINCT payload_hash FROM snapshots WHERE id IN ({marks}) AND payload_hash IS NOT NULL",
+                    batch,
+                )
+            ]
+            conn.execute(f"DELETE FROM snapshots WHERE id IN ({marks})", batch)
+            for digest in hashes:
+                if conn.execute("SELECT 1 FROM snapshots WHERE payload_hash = ? LIMIT 1", (digest,)).fetchone() is None:
+                    conn.execute("DELETE FROM snapshot_blobs WHERE hash = ?", (digest,))
+                    summary["blobs_deleted"] += 1
+        commit(conn)
+    summary["archive_files"] = len(files)
+    METRICS.inc("snapshots_pruned_total", len(ids))
+    return summary
+
+
+def compact_snapshot_log(log_path: Path, archive_dir: Path, dry_run: bool = False) -> dict[str, Any]:
+    """Move rotated snapshot-log segments (never the live log) into date-partitioned archives."""
+    segments = sorted(
+        [*log_path.parent.glob(f"{log_path.stem}.*{log_path.suffix}"),
+         *log_path.parent.glob(f"{log_path.stem}.*{log_path.suffix}.gz")]
+    )
+    summary = {"segments": len(segments), "records": 0, "archive_bytes": 0}
+    if dry_run:
+        return summary
+    for segment in segments:
+        opener = gzip.open if segment.suffix == ".gz" else open
+        by_day: dict[str, list[str]] = {}
+        with opener(segment, "rt", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    fetched_day = str(json.loads(line).get("fetched_at") or "")[:10]
+                except json.JSONDecodeError:
+                    fetched_day = ""
+                by_day.setdefault(fetched_day, []).append(line if line.endswith("\n") else line + "\n")
+                summary["records"] += 1
+        for fetched_day, lines in sorted(by_day.items()):
+            summary["archive_bytes"] += append_archive(archive_partition(archive_dir, "snapshot_runs", fetched_day), lines)
+        segment.unlink()
+    return summary
+
+
+def incremental_vacuum(conn: sqlite3.Connection, pages_per_step: int = 1024) -> dict[str, Any]:
+    """Return free pages to the filesystem a short transaction at a time."""
+    conn.commit()
+    converted = False
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        converted = True
+    freed = 0
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    while free:
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages_per_step)})").fetchall()
+        remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if remaining >= free:
             break
+        freed += free - remaining
+        free = remaining
+    # In WAL mode the file only shrinks once the truncated pages are checkpointed.
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    return {"converted": converted, "pages_freed": freed}
+
+
+def db_file_bytes(path: Path) -> int:
+    """Database file plus its WAL, as a backup would copy them."""
+    wal = path.with_name(path.name + "-wal")
+    return sum(p.stat().st_size for p in (path, wal) if p.exists())
+
+
+def load_discover_progress(conn: sqlite3.Connection, strategy: str) -> dict[str, Any]:
+    row = conn.execute(
+        "SELECT started_at, next_index, frontier_json, done, last_updated_at FROM discover_progress WHERE strategy=?",
+        (strategy,),
+    ).fetchone()
+    if row is None:
+        return {"started_at": utc_now(), "next_index": 0, "frontier": None, "done": False, "last_updated_at": None}
+    return {
+        "started_at": row[0],
+        "next_index": row[1],
+        "frontier": json.loads(row[2]) if row[2] else None,
+        "done": bool(row[3]),
+        "last_updated_at": row[4],
+    }
 
-        for store in payload.get("stores", []):
-            slug = store.get("slug")
-            if not slug:
-                continue
-            stores_map[slug] = {
-                "slug": slug,
-                "name": store.get("name", ""),
-                "city": store.get("city", ""),
-                "state": store.get("state", ""),
+
+def save_discover_progress(conn: sqlite3.Connection, strategy: str, progress: dict[str, Any]) -> None:
+    progress["last_updated_at"] = utc_now()
+    frontier = progress.get("frontier")
+    conn.execute(
+        """
+        INSERT INTO discover_progress(strategy, started_at, next_index, frontier_json, done, last_updated_at)
+        VALUES(?, ?, ?, ?, ?, ?)
+        ON CONFLICT(strategy) DO UPDATE SET
+            next_index=excluded.next_index,
+            frontier_json=excluded.frontier_json,
+            done=excluded.done,
+            last_updated_at=excluded.last_updated_at
+        """,
+        (
+            strategy,
+            progress["started_at"],
+            progress["next_index"],
+            json.dumps(frontier, separators=(",", ":")) if frontier is not None else None,
+            int(bool(progress["done"])),
+            progress["last_updated_at"],
+        ),
+    )
+
+
+def reset_discover_progress(conn: sqlite3.Connection, strategy: str) -> None:
+    """Start the strategy's sweep over; stores it already found are kept."""
+    conn.execute("DELETE FROM discover_progress WHERE strategy=?", (strategy,))
+    conn.commit()
+
+
+def record_discovered(
+    conn: sqlite3.Connection,
+    strategy: str,
+    stores: list[dict[str, Any]],
+    seen_at: str,
+) -> int:
+    """Upsert stores returned by a discovery query; returns how many were new."""
+    records = [store_record(s) for s in stores if s.get("slug")]
+    if not records:
+        return 0
+    with METRICS.timer("db_write_seconds", op="discovered"):
+        slugs = [r["slug"] for r in records]
+        known = {
+            row[0]
+            for row in conn.execute(
+                f"SELECT slug FROM discovered_stores WHERE strategy=? AND slug IN ({','.join('?' * len(slugs))})",
+                [strategy, *slugs],
+            )
+        }
+        conn.executemany(
+            """
+            INSERT INTO discovered_stores(strategy, slug, name, city, state, first_seen_at, last_seen_at)
+            VALUES(?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(strategy, slug) DO UPDATE SET
+                name=excluded.name,
+                city=excluded.city,
+                state=excluded.state,
+                last_seen_at=excluded.last_seen_at
+            """,
+            [(strategy, r["slug"], r["name"], r["city"], r["state"], seen_at, seen_at) for r in records],
+        )
+        # Also into stores, so search_stores finds them before their first
+        # fetch; last_seen_at stays NULL until upsert_store records one.
+        conn.executemany(
+            """
+            INSERT INTO stores(slug, name, city, state, first_seen_at) VALUES(?, ?, ?, ?, ?)
+            ON CONFLICT(slug) DO UPDATE SET
+                name=excluded.name,
+                city=excluded.city,
+                state=excluded.state
+            WHERE stores.last_seen_at IS NULL
+                AND (stores.name IS NOT excluded.name OR stores.city IS NOT excluded.city
+                     OR stores.state IS NOT excluded.state)
+            """,
+            [(r["slug"], r["name"], r["city"], r["state"], seen_at) for r in records],
+        )
+        return len(set(slugs) - known)
+
+
+def discovered_stores_map(conn: sqlite3.Connection, strategy: str | None = None) -> dict[str, dict[str, Any]]:
+    """Discovered stores by slug; without a strategy, the union of all of them."""
+    sql = "SELECT slug, name, city, state FROM discovered_stores"
+    params: list[Any] = []
+    if strategy is not None:
+        sql += " WHERE strategy=?"
+        params.append(strategy)
+    sql += " ORDER BY last_seen_at"
+    return {
+        slug: {"slug": slug, "name": name, "city": city, "state": state}
+        for slug, name, city, state in conn.execute(sql, params)
+    }
+
+
+def load_backfill_progress(conn: sqlite3.Connection, segment: str) -> dict[str, Any]:
+    row = conn.execute(
+        "SELECT started_at, next_index, last_updated_at FROM backfill_progress WHERE segment=?", (segment,)
+    ).fetchone()
+    completed = {r[0] for r in conn.execute("SELECT store_slug FROM backfill_completed WHERE segment=?", (segment,))}
+    if row is None:
+        return {"started_at": utc_now(), "next_index": 0, "last_updated_at": None, "completed": completed}
+    return {"started_at": row[0], "next_index": row[1], "last_updated_at": row[2], "completed": completed}
+
+
+def save_backfill_progress(conn: sqlite3.Connection, segment: str, progress: dict[str, Any]) -> None:
+    progress["last_updated_at"] = utc_now()
+    conn.execute(
+        """
+        INSERT INTO backfill_progress(segment, started_at, next_index, last_updated_at) VALUES(?, ?, ?, ?)
+        ON CONFLICT(segment) DO UPDATE SET
+            next_index=excluded.next_index,
+            last_updated_at=excluded.last_updated_at
+        """,
+        (segment, progress["started_at"], progress["next_index"], progress["last_updated_at"]),
+    )
+
+
+def mark_backfill_completed(conn: sqlite3.Connection, segment: str, slug: str, at: str) -> None:
+    conn.execute(
+        "INSERT OR REPLACE INTO backfill_completed(segment, store_slug, completed_at) VALUES(?, ?, ?)",
+        (segment, slug, at),
+    )
+
+
+def reset_backfill_progress(conn: sqlite3.Connection, segment: str) -> None:
+    conn.execute("DELETE FROM backfill_progress WHERE segment=?", (segment,))
+    conn.execute("DELETE FROM backfill_completed WHERE segment=?", (segment,))
+    conn.execute("DELETE FROM backfill_retry WHERE segment=?", (segment,))
+    conn.execute("DELETE FROM backfill_leases WHERE segment=?", (segment,))
+    conn.commit()
+
+
+def retry_delay(attempts: int, base_minutes: float, max_hours: float = 24.0) -> timedelta:
+    """Spacing before retry number attempts+1: base, 2x base, 4x base, ... capped."""
+    return timedelta(minutes=min(max_hours * 60.0, base_minutes * (2 ** max(0, attempts - 1))))
+
+
+def record_retry_failure(
+    conn: sqlite3.Connection,
+    segment: str,
+    store: dict[str, Any],
+    error: str,
+    at: str,
+    base_minutes: float,
+    max_attempts: int,
+) -> int:
+    """Queue (or requeue) a failed store; returns its attempt count."""
+    # At max_attempts the row stays as a dead letter with no next_eligible_at.
+    row = conn.execute(
+        "SELECT attempts FROM backfill_retry WHERE segment=? AND store_slug=?", (segment, store["slug"])
+    ).fetchone()
+    attempts = (row[0] if row else 0) + 1
+    next_eligible = None
+    if attempts < max_attempts:
+        next_eligible = (datetime.fromisoformat(at) + retry_delay(attempts, base_minutes)).isoformat()
+    conn.execute(
+        """
+        INSERT INTO backfill_retry(segment, store_slug, store_json, attempts, last_error,
+                                   first_failed_at, last_failed_at, next_eligible_at)
+        VALUES(?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(segment, store_slug) DO UPDATE SET
+            store_json=excluded.store_json,
+            attempts=excluded.attempts,
+            last_error=excluded.last_error,
+            last_failed_at=excluded.last_failed_at,
+            next_eligible_at=excluded.next_eligible_at
+        """,
+        (segment, store["slug"], json.dumps(store), attempts, error[:500], at, at, next_eligible),
+    )
+    return attempts
+
+
+def clear_retry(conn: sqlite3.Connection, segment: str, slug: str) -> None:
+    conn.execute("DELETE FROM backfill_retry WHERE segment=? AND store_slug=?", (segment, slug))
+
+
+def eligible_retries(conn: sqlite3.Connection, segment: str, now: str, limit: int) -> list[dict[str, Any]]:
+    rows = conn.execute(
+        """
+        SELECT store_json FROM backfill_retry
+        WHERE segment=? AND next_eligible_at IS NOT NULL AND next_eligible_at <= ?
+        ORDER BY next_eligible_at, store_slug
+        LIMIT ?
+        """,
+        (segment, now, limit),
+    )
+    return [json.loads(r[0]) for r in rows]
+
+
+def retry_queue_summary(conn: sqlite3.Connection, segment: str, now: str) -> dict[str, Any]:
+    pending, eligible, dead, oldest, next_at = conn.execute(
+        """
+        SELECT COUNT(next_eligible_at),
+               COALESCE(SUM(next_eligible_at <= :now), 0),
+               COUNT(*) - COUNT(next_eligible_at),
+               MIN(first_failed_at),
+               MIN(next_eligible_at)
+        FROM backfill_retry WHERE segment = :segment
+        """,
+        {"segment": segment, "now": now},
+    ).fetchone()
+    return {
+        "pending": pending,
+        "eligible_now": eligible,
+        "dead": dead,
+        "oldest_failure": oldest,
+        "next_eligible_at": next_at,
+    }
+
+
+def default_lease_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{random.getrandbits(32):08x}"
+
+
+def claim_stores(
+    conn: sqlite3.Connection,
+    segment: str,
+    slugs: list[str],
+    owner: str,
+    now: datetime,
+    lease: timedelta,
+) -> set[str]:
+    """Lease slugs to owner (free, expired or already its own) and return the subset it holds."""
+    # Not committed here: the claim rides in the caller's open batch, and
+    # holds the write lock until then, so other workers wait rather than race.
+    if not slugs:
+        return set()
+    leased_at, expires_at = now.isoformat(), (now + lease).isoformat()
+    conn.executemany(
+        """
+        INSERT INTO backfill_leases(segment, store_slug, owner, leased_at, expires_at)
+        SELECT :segment, :slug, :owner, :leased_at, :expires_at
+        WHERE NOT EXISTS (SELECT 1 FROM backfill_completed WHERE segment = :segment AND store_slug = :slug)
+        ON CONFLICT(segment, store_slug) DO UPDATE SET
+            owner = excluded.owner,
+            leased_at = excluded.leased_at,
+            expires_at = excluded.expires_at
+        WHERE backfill_leases.expires_at <= excluded.leased_at OR backfill_leases.owner = excluded.owner
+        """,
+        [
+            {"segment": segment, "slug": slug, "owner": owner, "leased_at": leased_at, "expires_at": expires_at}
+            for slug in slugs
+        ],
+    )
+    held = {
+        row[0]
+        for row in conn.execute(
+            f"""
+            SELECT store_slug FROM backfill_leases
+            WHERE segment = ? AND owner = ? AND store_slug IN ({','.join('?' * len(slugs))})
+            """,
+            [segment, owner, *slugs],
+        )
+    }
+    return held
+
+
+def renew_leases(conn: sqlite3.Connection, segment: str, owner: str, now: datetime, lease: timedelta) -> None:
+    conn.execute(
+        "UPDATE backfill_leases SET expires_at = ? WHERE segment = ? AND owner = ?",
+        ((now + lease).isoformat(), segment, owner),
+    )
+
+
+def release_lease(conn: sqlite3.Connection, segment: str, owner: str, slug: str | None = None) -> None:
+    """Drop one of owner's leases, or all of them when slug is None."""
+    if slug is None:
+        conn.execute("DELETE FROM backfill_leases WHERE segment = ? AND owner = ?", (segment, owner))
+    else:
+        conn.execute(
+            "DELETE FROM backfill_leases WHERE segment = ? AND owner = ? AND store_slug = ?", (segment, owner, slug)
+        )
+
+
+def lease_summary(conn: sqlite3.Connection, segment: str, now: str) -> dict[str, Any]:
+    active, expired, owners = conn.execute(
+        """
+        SELECT COALESCE(SUM(expires_at > :now), 0), COALESCE(SUM(expires_at <= :now), 0),
+               COUNT(DISTINCT CASE WHEN expires_at > :now THEN owner END)
+        FROM backfill_leases WHERE segment = :segment
+        """,
+        {"segment": segment, "now": now},
+    ).fetchone()
+    return {"active": active, "expired": expired, "owners": owners}
+
+
+def import_legacy_state(conn: sqlite3.Connection) -> None:
+    """One-time import of the pre-SQLite *_state.json files, renamed to *.json.migrated after."""
+    for strategy, path in (("sweep", DISCOVER_STATE), ("adaptive", ADAPTIVE_DISCOVER_STATE)):
+        if not path.exists():
+            continue
+        state = read_json(path, {})
+        exists = conn.execute("SELECT 1 FROM discover_progress WHERE strategy=?", (strategy,)).fetchone()
+        if not exists:
+            stores = list(state.pop("stores", {}).values())
+            seen_at = state.get("last_updated_at") or utc_now()
+            record_discovered(conn, strategy, stores, seen_at)
+            progress = {
+                "started_at": state.get("started_at") or seen_at,
+                "next_index": int(state.get("next_index", 0)),
+                "done": bool(state.get("done", False)),
+                "frontier": None,
             }
+            if strategy == "adaptive":
+                progress["frontier"] = {
+                    k: state[k]
+                    for k in ("level", "queue", "level_results", "page_limit", "requests",
+                              "results_returned", "skipped", "misses")
+                    if k in state
+                }
+            save_discover_progress(conn, strategy, progress)
+        conn.commit()
+        path.rename(path.with_name(path.name + ".migrated"))
 
-        next_index += 1
-        processed += 1
+    for segment in ("wi", "rest"):
+        _, path = segment_files(segment)
+        if not path.exists():
+            continue
+        state = read_json(path, {})
+        exists = conn.execute("SELECT 1 FROM backfill_progress WHERE segment=?", (segment,)).fetchone()
+        if not exists:
+            at = state.get("last_updated_at") or utc_now()
+            for slug in state.get("completed_slugs", []):
+                mark_backfill_completed(conn, segment, slug, at)
+            save_backfill_progress(
+                conn,
+                segment,
+                {"started_at": state.get("started_at") or at, "next_index": int(state.get("next_index", 0))},
+            )
+        conn.commit()
+        path.rename(path.with_name(path.name + ".migrated"))
 
-        if args.sleep_ms > 0:
-            time.sleep(args.sleep_ms / 1000.0)
 
-    state["stores"] = stores_map
-    state["next_index"] = next_index
-    state["completed_tokens"] = next_index
-    state["last_updated_at"] = utc_now()
-    write_json(DISCOVER_STATE, state)
+DISCOVERY_CHARS = string.ascii_lowercase + string.digits
+
 
+def all_discovery_tokens() -> list[str]:
+    return [a + b for a in DISCOVERY_CHARS for b in DISCOVERY_CHARS]
+
+
+def store_record(store: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "slug": store["slug"],
+        "name": store.get("name", ""),
+        "city": store.get("city", ""),
+        "state": store.get("state", ""),
+    }
+
+
+def write_store_lists(stores_map: dict[str, dict[str, Any]]) -> tuple[list, list, list]:
     stores = sorted(stores_map.values(), key=lambda s: s["slug"])
     wi_stores = [s for s in stores if str(s.get("state", "")).upper() == "WI"]
     rest_stores = [s for s in stores if str(s.get("state", "")).upper() != "WI"]
     write_json(STORES_PATH, stores)
     write_json(WI_STORES_PATH, wi_stores)
     write_json(REST_STORES_PATH, rest_stores)
+    return stores, wi_stores, rest_stores
+
+
+def infer_page_limit(sizes: list[int]) -> int | None:
+    """Guess the Worker's result cap: the largest size, if several queries hit it."""
+    if not sizes:
+        return None
+    largest = max(sizes)
+    if largest >= 5 and sizes.count(largest) >= 2:
+        return largest
+    return None
+
+
+def plan_next_level(
+    level_results: dict[str, dict[str, int]],
+    page_limit: int | None,
+    max_len: int,
+    corpus: list[str] | None = None,
+) -> list[str]:
+    """Children to query for the next prefix length, likeliest first."""
+    # Only truncated results can hide stores; past the root, a truncated
+    # branch that surfaced nothing new is not widened.
+    children: list[str] = []
+    for token, result in level_results.items():
+        if len(token) >= max_len or page_limit is None or result["size"] < page_limit:
+            continue
+        if result["new"] == 0 and len(token) > 1:
+            continue
+        candidates = [token + c for c in DISCOVERY_CHARS]
+        if corpus:
+            hits = {child: sum(text.count(child) for text in corpus) for child in candidates}
+            candidates.sort(key=lambda child: -hits[child])
+        children.extend(candidates)
+    return children
+
+
+def discovery_corpus(stores_map: dict[str, dict[str, Any]]) -> list[str]:
+    return [
+        " ".join(str(store.get(k, "")) for k in ("slug", "name", "city")).lower()
+        for store in stores_map.values()
+    ]
+
+
+ADAPTIVE_FRONTIER = {
+    "level": 1,
+    "queue": list(DISCOVERY_CHARS),
+    "level_results": {},
+    "page_limit": None,
+    "requests": 0,
+    "results_returned": 0,
+    "skipped": 0,
+    "misses": {},
+}
+
+
+# Set by the pipeline stage: discovery hands it every search result right
+# after recording it, and lets it record fetches while a search is in flight.
+_pipeline: BackfillPipeline | None = None
+
+
+def discovery_search(token: str, timeout: int) -> dict[str, Any]:
+    if _pipeline is not None:
+        return _pipeline.overlap(get_json, "/api/v1/stores", {"q": token}, timeout=timeout)
+    return get_json("/api/v1/stores", {"q": token}, timeout=timeout)
+
+
+def commit_discovery(conn: sqlite3.Connection, final: bool = False) -> None:
+    # Under the pipeline, discovery's checkpoints join its batched commits.
+    if _pipeline is not None and not final:
+        _pipeline.commit_due()
+    else:
+        commit(conn)
+
+
+def stage_discover_adaptive(args: argparse.Namespace) -> int:
+    ensure_dirs()
+    known = {s["slug"] for s in read_json(STORES_PATH, [])}
+
+    conn = init_db()
+    progress = load_discover_progress(conn, "adaptive")
+    state = progress["frontier"] or json.loads(json.dumps(ADAPTIVE_FRONTIER))
+    progress["frontier"] = state
+
+    queue: list[str] = state["queue"]
+    level_results: dict[str, dict[str, int]] = state["level_results"]
+    misses: dict[str, int] = state["misses"]
+    page_limit = args.page_limit or state.get("page_limit")
+    done = progress["done"]
+
+    def checkpoint(final: bool = False) -> None:
+        state.update({"queue": queue, "level_results": level_results, "misses": misses, "page_limit": page_limit})
+        progress["done"] = done
+        save_discover_progress(conn, "adaptive", progress)
+        commit_discovery(conn, final)
+
+    processed = 0
+    while not done and processed < args.tokens_per_run and not SHUTDOWN.is_set():
+        if not queue:
+            page_limit = page_limit or infer_page_limit([r["size"] for r in level_results.values()])
+            corpus = discovery_corpus(discovered_stores_map(conn, "adaptive"))
+            queue = plan_next_level(level_results, page_limit, args.max_prefix_len, corpus)
+            level_results = {}
+            misses.clear()
+            if not queue:
+                done = True
+                break
+            state["level"] += 1
+            continue
+
+        token = queue[0]
+        parent = token[:-1]
+        if args.patience and parent and misses.get(parent, 0) >= args.patience:
+            queue.pop(0)
+            state["skipped"] += 1
+            continue
+        try:
+            payload = discovery_search(token, args.timeout)
+        except (urllib.error.URLError, TimeoutError) as err:
+            print(f"discover error token={token}: {err}", file=sys.stderr)
+            break
+        queue.pop(0)
+
+        results = [s for s in payload.get("stores", []) if s.get("slug")]
+        new = record_discovered(conn, "adaptive", results, utc_now())
+        if _pipeline is not None:
+            _pipeline.offer(results)
+        level_results[token] = {"size": len(results), "new": new}
+        if parent:
+            misses[parent] = 0 if new else misses.get(parent, 0) + 1
+        state["requests"] += 1
+        state["results_returned"] += len(results)
+        processed += 1
+        checkpoint()
+
+        if args.sleep_ms > 0:
+            SHUTDOWN.wait(args.sleep_ms / 1000.0)
+
+    checkpoint(final=True)
+    found = set(discovered_stores_map(conn, "adaptive"))
+    stores, wi_stores, rest_stores = write_store_lists(discovered_stores_map(conn))
+    conn.close()
+
+    print(
+        "discover",
+        json.dumps(
+            {
+                "strategy": "adaptive",
+                "done": done,
+                "level": state["level"],
+                "requests_this_run": processed,
+                "requests_total": state["requests"],
+                "tokens_pruned_total": state["skipped"],
+                "queue_remaining": len(queue),
+                "page_limit": page_limit,
+                "stores_found": len(found),
+                "stores_total": len(stores),
+                "stores_wi": len(wi_stores),
+                "stores_rest": len(rest_stores),
+                "redundancy": round(state["results_returned"] / len(found), 2) if found else None,
+                "coverage_of_known": round(len(found & known) / len(known), 4) if known else None,
+                "http": get_client().timing_summary(),
+                "rate_limit": rate_limit_summary(),
+            }
+        ),
+    )
+    return 0
+
+
+def stage_discover(args: argparse.Namespace) -> int:
+    configure_rate_limit(args)
+    if args.reset:
+        ensure_dirs()
+        conn = init_db()
+        reset_discover_progress(conn, args.strategy)
+        conn.close()
+    if args.strategy == "adaptive":
+        return stage_discover_adaptive(args)
+
+    ensure_dirs()
+    tokens = all_discovery_tokens()
+
+    conn = init_db()
+    progress = load_discover_progress(conn, "sweep")
+    next_index = int(progress["next_index"])
+
+    processed = 0
+    while next_index < len(tokens) and processed < args.tokens_per_run and not SHUTDOWN.is_set():
+        token = tokens[next_index]
+        try:
+            payload = discovery_search(token, args.timeout)
+        except (urllib.error.URLError, TimeoutError) as err:
+            print(f"discover error token={token}: {err}", file=sys.stderr)
+            break
+
+        # The token's stores and the advanced cursor commit together.
+        record_discovered(conn, "sweep", payload.get("stores", []), utc_now())
+        if _pipeline is not None:
+            _pipeline.offer(payload.get("stores", []))
+        next_index += 1
+        processed += 1
+        progress["next_index"] = next_index
+        progress["done"] = next_index >= len(tokens)
+        save_discover_progress(conn, "sweep", progress)
+        commit_discovery(conn)
+
+        if args.sleep_ms > 0:
+            SHUTDOWN.wait(args.sleep_ms / 1000.0)
+
+    commit_discovery(conn, final=True)
+    stores, wi_stores, rest_stores = write_store_lists(discovered_stores_map(conn))
+    conn.close()
 
     done = next_index >= len(tokens)
     print(
         "discover",
         json.dumps(
             {
+                "strategy": "sweep",
                 "done": done,
                 "processed_tokens_this_run": processed,
                 "completed_tokens_total": next_index,
@@ -190,6 +2107,8 @@ def stage_discover(args: argparse.Namespace) -> int:
                 "stores_total": len(stores),
                 "stores_wi": len(wi_stores),
                 "stores_rest": len(rest_stores),
+                "http": get_client().timing_summary(),
+                "rate_limit": rate_limit_summary(),
             }
         ),
     )
@@ -236,61 +2155,214 @@ def upsert_store(conn: sqlite3.Connection, store: dict[str, Any], seen_at: str)
     )
 
 
-def upsert_flavor(conn: sqlite3.Connection, slug: str, flavor: dict[str, Any], seen_at: str) -> None:
+FLAVOR_UPSERT_SQL = """
+    INSERT INTO store_flavors(store_slug, flavor_date, title, description, first_seen_at, last_seen_at, title_norm)
+    VALUES(?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(store_slug, flavor_date) DO UPDATE SET
+        title=excluded.title,
+        description=excluded.description,
+        last_seen_at=excluded.last_seen_at,
+        title_norm=excluded.title_norm
+"""
+
+
+def flavor_row(slug: str, flavor: dict[str, Any], seen_at: str) -> tuple[str, str, str, str, str, str, str]:
+    return (
+        slug,
+        flavor.get("date", ""),
+        flavor.get("title", ""),
+        flavor.get("description", ""),
+        seen_at,
+        seen_at,
+        normalize_title(flavor.get("title", "")),
+    )
+
+
+def upsert_flavor(conn: sqlite3.Connection, slug: str, flavor: dict[str, Any], seen_at: str) -> int:
+    return upsert_flavors(conn, slug, [flavor], seen_at)
+
+
+def upsert_flavors(conn: sqlite3.Connection, slug: str, flavors: list[dict[str, Any]], seen_at: str) -> int:
+    """Write a store's flavors and log what changed; returns the number of changes."""
+    rows = [flavor_row(slug, f, seen_at) for f in flavors if f.get("date")]
+    if not rows:
+        return 0
+    dates = [row[1] for row in rows]
+    current = {
+        flavor_date: (title, title_norm)
+        for flavor_date, title, title_norm in conn.execute(
+            """
+            SELECT flavor_date, title, title_norm FROM store_flavors
+            WHERE store_slug = ? AND flavor_date BETWEEN ? AND ?
+            """,
+            (slug, min(dates), max(dates)),
+        )
+    }
+    changes: list[tuple[str, str, str, str, str | None, str | None]] = []
+    for _, flavor_date, title, _, _, _, title_norm in rows:
+        old = current.pop(flavor_date, None)
+        if old is None:
+            changes.append((seen_at, slug, flavor_date, "added", None, title))
+        elif old[1] != title_norm:
+            changes.append((seen_at, slug, flavor_date, "changed", old[0], title))
+    for flavor_date, (title, _) in sorted(current.items()):
+        changes.append((seen_at, slug, flavor_date, "removed", title, None))
+
+    if current:
+        conn.executemany(
+            "DELETE FROM store_flavors WHERE store_slug = ? AND flavor_date = ?",
+            [(slug, flavor_date) for flavor_date in current],
+        )
+    conn.executemany(FLAVOR_UPSERT_SQL, rows)
+    if changes:
+        conn.executemany(
+            """
+            INSERT INTO flavor_changes(detected_at, store_slug, flavor_date, kind, old_title, new_title)
+            VALUES(?, ?, ?, ?, ?, ?)
+            """,
+            changes,
+        )
+    return len(changes)
+
+
+def flavor_changes(
+    conn: sqlite3.Connection,
+    since: str | None = None,
+    after_id: int | None = None,
+    store: str | None = None,
+    kinds: list[str] | None = None,
+    limit: int = 1000,
+) -> list[dict[str, Any]]:
+    """Logged changes in detection order, optionally after a timestamp or id cursor."""
+    where: list[str] = []
+    params: list[Any] = []
+    if since:
+        where.append("detected_at >= ?")
+        params.append(since)
+    if after_id is not None:
+        where.append("id > ?")
+        params.append(after_id)
+    if store:
+        where.append("store_slug = ?")
+        params.append(store)
+    if kinds:
+        where.append(f"kind IN ({','.join('?' * len(kinds))})")
+        params.extend(kinds)
+    sql = "SELECT id, detected_at, store_slug, flavor_date, kind, old_title, new_title FROM flavor_changes"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id LIMIT ?"
+    params.append(limit)
+    keys = ("id", "detected_at", "slug", "date", "kind", "old_title", "new_title")
+    return [dict(zip(keys, row)) for row in conn.execute(sql, params)]
+
+
+def fetch_store_payload(
+    store: dict[str, Any],
+    timeout: int,
+    sleep_ms: int = 0,
+    validators: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    """Fetch one store's flavor payload (conditionally, with validators). Thread-safe."""
+    seen_at = utc_now()
+    status, headers, payload = get_json_conditional(
+        "/api/v1/flavors", {"slug": store["slug"]}, validators, timeout=timeout
+    )
+    if sleep_ms > 0:
+        SHUTDOWN.wait(sleep_ms / 1000.0)
+
+    cached_hash = (validators or {}).get("content_hash")
+    content_hash = cached_hash if payload is None else payload_hash(payload)
+    return {
+        "seen_at": seen_at,
+        "payload": payload,
+        "changed": status != 304 and content_hash != cached_hash,
+        "etag": headers.get("etag"),
+        "last_modified": headers.get("last-modified"),
+        "content_hash": content_hash,
+    }
+
+
+def load_validators(conn: sqlite3.Connection, slugs: list[str]) -> dict[str, dict[str, Any]]:
+    validators: dict[str, dict[str, Any]] = {}
+    for i in range(0, len(slugs), 500):
+        chunk = slugs[i : i + 500]
+        rows = conn.execute(
+            f"""
+            SELECT store_slug, etag, last_modified, content_hash
+            FROM store_validators WHERE store_slug IN ({",".join("?" * len(chunk))})
+            """,
+            chunk,
+        )
+        for slug, etag, last_modified, content_hash in rows:
+            validators[slug] = {"etag": etag, "last_modified": last_modified, "content_hash": content_hash}
+    return validators
+
+
+def save_validators(conn: sqlite3.Connection, slug: str, fetched: dict[str, Any]) -> None:
+    """Record a fetch outcome; an unchanged store only moves checked_at."""
+    seen_at = fetched["seen_at"]
+    if not fetched["changed"]:
+        conn.execute(
+            """
+            INSERT INTO store_validators(store_slug, etag, last_modified, content_hash, checked_at)
+            VALUES(?, ?, ?, ?, ?)
+            ON CONFLICT(store_slug) DO UPDATE SET
+                etag=COALESCE(excluded.etag, etag),
+                last_modified=COALESCE(excluded.last_modified, last_modified),
+                checked_at=excluded.checked_at
+            """,
+            (slug, fetched["etag"], fetched["last_modified"], fetched["content_hash"], seen_at),
+        )
+        return
     conn.execute(
         """
-        INSERT INTO store_flavors(store_slug, flavor_date, title, description, first_seen_at, last_seen_at)
+        INSERT INTO store_validators(store_slug, etag, last_modified, content_hash, changed_at, checked_at)
         VALUES(?, ?, ?, ?, ?, ?)
-        ON CONFLICT(store_slug, flavor_date) DO UPDATE SET
-            title=excluded.title,
-            description=excluded.description,
-            last_seen_at=excluded.last_seen_at
+        ON CONFLICT(store_slug) DO UPDATE SET
+            etag=excluded.etag,
+            last_modified=excluded.last_modified,
+            content_hash=excluded.content_hash,
+            changed_at=excluded.changed_at,
+            checked_at=excluded.checked_at
         """,
-        (
-            slug,
-            flavor.get("date", ""),
-            flavor.get("title", ""),
-            flavor.get("description", ""),
-            seen_at,
-            seen_at,
-        ),
+        (slug, fetched["etag"], fetched["last_modified"], fetched["content_hash"], seen_at, seen_at),
     )
 
 
-def backfill_one_store(
+def record_store_payload(
     conn: sqlite3.Connection,
     segment: str,
     store: dict[str, Any],
-    timeout: int,
+    payload: dict[str, Any],
+    seen_at: str,
 ) -> dict[str, Any]:
+    """Write a fetched payload to SQLite and the export files (single writer only)."""
     slug = store["slug"]
-    seen_at = utc_now()
-    payload = get_json("/api/v1/flavors", {"slug": slug}, timeout=timeout)
     flavors = payload.get("flavors", [])
 
-    upsert_store(conn, store, seen_at)
-    for flavor in flavors:
-        upsert_flavor(conn, slug, flavor, seen_at)
-
     dates = [f.get("date") for f in flavors if f.get("date")]
     min_date = min(dates) if dates else None
     max_date = max(dates) if dates else None
 
-    conn.execute(
-        """
-        INSERT INTO snapshots(fetched_at, segment, store_slug, flavor_count, min_date, max_date, raw_json)
-        VALUES(?, ?, ?, ?, ?, ?, ?)
-        """,
-        (
-            seen_at,
-            segment,
-            slug,
-            len(flavors),
-            min_date,
-            max_date,
-            json.dumps(payload, separators=(",", ":")),
-        ),
-    )
+    with METRICS.timer("db_write_seconds", op="store_payload"):
+        upsert_store(conn, store, seen_at)
+        changes = upsert_flavors(conn, slug, flavors, seen_at)
+        conn.execute(
+            """
+            INSERT INTO snapshots(fetched_at, segment, store_slug, flavor_count, min_date, max_date, payload_hash)
+            VALUES(?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                seen_at,
+                segment,
+                slug,
+                len(flavors),
+                min_date,
+                max_date,
+                put_blob(conn, json.dumps(payload, separators=(",", ":"))),
+            ),
+        )
 
     calendar_out = {
         "fetched_at": seen_at,
@@ -304,97 +2376,277 @@ def backfill_one_store(
         },
         "flavors": flavors,
     }
-    (CALENDAR_DIR / f"{slug}.json").write_text(
-        json.dumps(calendar_out, indent=2, sort_keys=True), encoding="utf-8"
+    exporter = get_exporter()
+    exporter.write_calendar(slug, calendar_out)
+    exporter.log_snapshot(
+        {
+            "fetched_at": seen_at,
+            "segment": segment,
+            "store_slug": slug,
+            "flavor_count": len(flavors),
+            "min_date": min_date,
+            "max_date": max_date,
+        }
     )
 
-    with SNAPSHOT_LOG.open("a", encoding="utf-8") as f:
-        f.write(
-            json.dumps(
-                {
-                    "fetched_at": seen_at,
-                    "segment": segment,
-                    "store_slug": slug,
-                    "flavor_count": len(flavors),
-                    "min_date": min_date,
-                    "max_date": max_date,
-                }
-            )
-            + "\n"
-        )
-
     return {
         "slug": slug,
         "count": len(flavors),
         "min_date": min_date,
         "max_date": max_date,
+        "changes": changes,
     }
 
 
-def stage_backfill(args: argparse.Namespace) -> int:
-    ensure_dirs()
-    stores = load_segment_stores(args.segment)
-    stores_path, state_path = segment_files(args.segment)
+def record_fetch(
+    conn: sqlite3.Connection,
+    segment: str,
+    store: dict[str, Any],
+    fetched: dict[str, Any],
+) -> dict[str, Any]:
+    """Persist a fetch_store_payload result, skipping all writes if unchanged."""
+    with METRICS.timer("db_write_seconds", op="validators"):
+        save_validators(conn, store["slug"], fetched)
+    if not fetched["changed"]:
+        return {"slug": store["slug"], "changed": False}
+    result = record_store_payload(conn, segment, store, fetched["payload"], fetched["seen_at"])
+    result["changed"] = True
+    return result
 
-    state = read_json(
-        state_path,
-        {
-            "segment": args.segment,
-            "stores_path": str(stores_path.relative_to(ROOT)),
-            "started_at": utc_now(),
-            "next_index": 0,
-            "completed_slugs": [],
-            "last_updated_at": None,
-        },
+
+def backfill_one_store(
+    conn: sqlite3.Connection,
+    segment: str,
+    store: dict[str, Any],
+    timeout: int,
+) -> dict[str, Any]:
+    validators = load_validators(conn, [store["slug"]]).get(store["slug"])
+    return record_fetch(conn, segment, store, fetch_store_payload(store, timeout, validators=validators))
+
+
+FETCH_ERRORS = (urllib.error.URLError, TimeoutError, json.JSONDecodeError)
+
+# Set by the daemon: one fetch pool for every stage it runs, so the fetch
+# threads, and with them their keep-alive connections, outlive each stage.
+_fetch_pool: ThreadPoolExecutor | None = None
+
+
+def fetch_pool(concurrency: int) -> contextlib.AbstractContextManager[ThreadPoolExecutor]:
+    """The daemon's pool if there is one, else a new pool closed with the block."""
+    if _fetch_pool is not None:
+        return contextlib.nullcontext(_fetch_pool)
+    return ThreadPoolExecutor(max_workers=max(1, concurrency))
+
+
+def run_store_fetches(
+    conn: sqlite3.Connection,
+    segment: str,
+    work: list[tuple[int, dict[str, Any]]],
+    args: argparse.Namespace,
+    on_result: Callable[[int, dict[str, Any], dict[str, Any] | None, Exception | None], bool],
+    pool: ThreadPoolExecutor | None = None,
+) -> None:
+    """Fetch stores on args.concurrency threads and record them on this one."""
+    concurrency = max(1, args.concurrency)
+    validators = {} if args.force else load_validators(conn, [store["slug"] for _, store in work])
+
+    with contextlib.nullcontext(pool) if pool is not None else fetch_pool(concurrency) as executor:
+        pending: dict[Future, tuple[int, dict[str, Any]]] = {}
+        queue = iter(work)
+        stop = False
+
+        def fill() -> None:
+            while not stop and not SHUTDOWN.is_set() and len(pending) < concurrency:
+                item = next(queue, None)
+                if item is None:
+                    return
+                store = item[1]
+                fut = executor.submit(
+                    fetch_store_payload, store, args.timeout, args.sleep_ms, validators.get(store["slug"])
+                )
+                pending[fut] = item
+
+        fill()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in sorted(done, key=lambda f: pending[f][0]):
+                key, store = pending.pop(fut)
+                try:
+                    result, err = record_fetch(conn, segment, store, fut.result()), None
+                except FETCH_ERRORS as exc:
+                    result, err = None, exc
+                if not on_result(key, store, result, err):
+                    stop = True
+            fill()
+
+
+def print_fetch_result(segment: str, position: str, result: dict[str, Any]) -> None:
+    if not result["changed"]:
+        print(f"ok segment={segment} {position} slug={result['slug']} unchanged")
+        return
+    print(
+        f"ok segment={segment} {position} "
+        f"slug={result['slug']} count={result['count']} "
+        f"range={result['min_date']}..{result['max_date']}"
     )
 
-    next_index = int(state.get("next_index", 0))
-    completed = set(state.get("completed_slugs", []))
+
+def advance_checkpoint(next_index: int, finished: set[int], total: int) -> int:
+    """Move next_index past the contiguous run of finished indices."""
+    while next_index < total and next_index in finished:
+        finished.discard(next_index)
+        next_index += 1
+    return next_index
+
+
+def stage_backfill(args: argparse.Namespace) -> int:
+    ensure_dirs()
+    configure_rate_limit(args)
+    stores = load_segment_stores(args.segment)
 
     conn = init_db()
+    if args.reset:
+        reset_backfill_progress(conn, args.segment)
+    progress = load_backfill_progress(conn, args.segment)
+    next_index = int(progress["next_index"])
+    completed: set[str] = progress["completed"]
+
+    # Every store this run fetches is leased to it first, so several
+    # processes can drain one segment without fetching the same store twice.
+    owner = args.owner or default_lease_owner()
+    lease = timedelta(minutes=args.lease_minutes)
+
+    # Stores that failed on earlier runs and are due again go first and take
+    # their share of --stores-per-run.
+    retries = eligible_retries(conn, args.segment, utc_now(), args.stores_per_run)
+    queued = {store["slug"] for store in retries}
+    held = claim_stores(conn, args.segment, sorted(queued), owner, datetime.now(UTC), lease)
+    retries = [store for store in retries if store["slug"] in held]
+
+    finished: set[int] = set()
+    index = next_index
+    claimed = len(retries)
+
+    def claim_next(limit: int) -> list[int]:
+        """Lease the next stores from the cursor, up to limit."""
+        # Slugs leased by another worker are skipped but stay unfinished, so the
+        # cursor waits for them.
+        nonlocal index, claimed
+        work: list[int] = []
+        while index < len(stores) and not work and limit > 0:
+            wanted: list[int] = []
+            while index < len(stores) and len(wanted) < limit:
+                if stores[index].get("slug", "") in completed or stores[index].get("slug", "") in queued:
+                    finished.add(index)
+                else:
+                    wanted.append(index)
+                index += 1
+            slugs = [stores[i].get("slug", "") for i in wanted]
+            held = claim_stores(conn, args.segment, slugs, owner, datetime.now(UTC), lease)
+            work = [i for i in wanted if stores[i].get("slug", "") in held]
+        claimed += len(work)
+        return work
 
     processed = 0
     success = 0
+    unchanged = 0
     failures = 0
+    retried = 0
+    recovered = 0
+    flavor_changes_seen = 0
     counts: list[int] = []
-
-    while next_index < len(stores) and processed < args.stores_per_run:
-        store = stores[next_index]
+    uncommitted = 0
+    batch_started = time.monotonic()
+
+    def checkpoint() -> None:
+        # Completion marks are written next to each store's rows; the cursor
+        # joins them here, so one commit makes data and resume point durable.
+        nonlocal next_index, uncommitted, batch_started
+        next_index = advance_checkpoint(next_index, finished, len(stores))
+        progress["next_index"] = next_index
+        save_backfill_progress(conn, args.segment, progress)
+        renew_leases(conn, args.segment, owner, datetime.now(UTC), lease)
+        commit(conn)
+        get_exporter().flush()
+        uncommitted = 0
+        batch_started = time.monotonic()
+
+    def batch_full() -> bool:
+        # The write lock is held from a batch's first write (a lease claim or
+        # a store) to its commit, across fetch waits; timing from the last
+        # commit caps it, so other workers' writes do not time out behind it.
+        return uncommitted >= args.commit_every or time.monotonic() - batch_started >= MAX_BATCH_SECONDS
+
+    def record(store: dict[str, Any], position: str, result: dict[str, Any] | None, err: Exception | None) -> bool:
+        """Count one outcome and queue or clear its retry; False if it failed."""
+        nonlocal processed, success, unchanged, failures, uncommitted, flavor_changes_seen
         slug = store.get("slug", "")
-
-        if slug in completed:
-            next_index += 1
-            continue
-
-        try:
-            result = backfill_one_store(conn, args.segment, store, timeout=args.timeout)
-            success += 1
-            counts.append(result["count"])
-            completed.add(slug)
-            print(
-                f"ok segment={args.segment} index={next_index + 1}/{len(stores)} "
-                f"slug={slug} count={result['count']} "
-                f"range={result['min_date']}..{result['max_date']}"
-            )
-        except (urllib.error.URLError, TimeoutError, json.JSONDecodeError) as err:
-            failures += 1
-            print(f"error segment={args.segment} slug={slug}: {err}", file=sys.stderr)
-            if args.stop_on_error:
-                break
-
         processed += 1
-        next_index += 1
+        uncommitted += 1
+        release_lease(conn, args.segment, owner, slug)
+        if err is not None:
+            failures += 1
+            attempts = record_retry_failure(
+                conn, args.segment, store, str(err), utc_now(), args.retry_base_minutes, args.max_attempts
+            )
+            print(f"error segment={args.segment} slug={slug} attempts={attempts}: {err}", file=sys.stderr)
+            return False
+        success += 1
+        completed.add(slug)
+        mark_backfill_completed(conn, args.segment, slug, utc_now())
+        clear_retry(conn, args.segment, slug)
+        if result["changed"]:
+            counts.append(result["count"])
+            flavor_changes_seen += result["changes"]
+        else:
+            unchanged += 1
+        print_fetch_result(args.segment, position, result)
+        return True
+
+    def on_retry(j: int, store: dict[str, Any], result: dict[str, Any] | None, err: Exception | None) -> bool:
+        nonlocal retried, recovered
+        retried += 1
+        ok = record(store, f"retry={j + 1}/{len(retries)}", result, err)
+        recovered += ok
+        if batch_full():
+            checkpoint()
+        return ok or not args.stop_on_error
+
+    def on_result(i: int, store: dict[str, Any], result: dict[str, Any] | None, err: Exception | None) -> bool:
+        ok = record(store, f"index={i + 1}/{len(stores)}", result, err)
+        if not ok and args.stop_on_error:
+            # Leave the failed index unfinished so the next run retries it.
+            return False
+        finished.add(i)
+        if batch_full():
+            checkpoint()
+        return True
+
+    # Work is leased a chunk at a time, so workers started together
+    # interleave through the segment instead of the first taking it all.
+    chunk = max(args.commit_every, 4 * max(1, args.concurrency))
+    try:
+        with fetch_pool(args.concurrency) as pool:
+            run_store_fetches(conn, args.segment, list(enumerate(retries)), args, on_retry, pool)
+            while not (failures and args.stop_on_error) and not SHUTDOWN.is_set():
+                work = claim_next(min(chunk, args.stores_per_run - claimed))
+                if not work:
+                    break
+                run_store_fetches(conn, args.segment, [(i, stores[i]) for i in work], args, on_result, pool)
+    except BaseException:
+        # Drop the unfinished batch as a crash would, but hand this run's
+        # leases back now instead of making other workers wait them out.
+        conn.rollback()
+        release_lease(conn, args.segment, owner)
         conn.commit()
+        raise
 
-        if args.sleep_ms > 0:
-            time.sleep(args.sleep_ms / 1000.0)
-
+    release_lease(conn, args.segment, owner)
+    checkpoint()
+    retry_queue = retry_queue_summary(conn, args.segment, utc_now())
+    leases = lease_summary(conn, args.segment, utc_now())
     conn.close()
-
-    state["next_index"] = next_index
-    state["completed_slugs"] = sorted(completed)
-    state["last_updated_at"] = utc_now()
-    write_json(state_path, state)
+    get_exporter().close()
 
     done = next_index >= len(stores)
     print(
@@ -406,10 +2658,21 @@ def stage_backfill(args: argparse.Namespace) -> int:
                 "stores_total": len(stores),
                 "processed_this_run": processed,
                 "success_this_run": success,
+                "unchanged_this_run": unchanged,
                 "failures_this_run": failures,
+                "flavor_changes_this_run": flavor_changes_seen,
+                "retried_this_run": retried,
+                "recovered_this_run": recovered,
+                "retry_queue": retry_queue,
+                "owner": owner,
+                "leases": leases,
                 "next_index": next_index,
                 "remaining": max(0, len(stores) - next_index),
                 "median_flavors": sorted(counts)[len(counts) // 2] if counts else None,
+                "concurrency": max(1, args.concurrency),
+                "exports": get_exporter().summary(),
+                "http": get_client().timing_summary(),
+                "rate_limit": rate_limit_summary(),
             }
         ),
     )
@@ -419,68 +2682,773 @@ def stage_backfill(args: argparse.Namespace) -> int:
     return 0
 
 
+class BackfillPipeline:
+    """Backfill fed by discovery while it runs (the pipeline stage)."""
+
+    def __init__(self, conn: sqlite3.Connection, args: argparse.Namespace) -> None:
+        self.conn = conn
+        self.args = args
+        self.owner = args.owner or default_lease_owner()
+        self.lease = timedelta(minutes=args.lease_minutes)
+        self.concurrency = max(1, args.concurrency)
+        self.pool = ThreadPoolExecutor(max_workers=self.concurrency)
+        self.search_pool = ThreadPoolExecutor(max_workers=1)
+        self.heap: list[tuple[int, int, str, dict[str, Any]]] = []
+        self.pending: dict[Future, tuple[str, dict[str, Any]]] = {}
+        self.seen: set[str] = set()
+        self.seeded = False
+        self.uncommitted = 0
+        self.batch_started = time.monotonic()
+        self.started = time.monotonic()
+        self.first_store_seconds: float | None = None
+        self.queue_high_water = 0
+        self.stats = {segment: Counter() for segment in ("wi", "rest")}
+
+    def offer(self, stores: list[dict[str, Any]]) -> None:
+        if not self.seeded:
+            # Stores found by earlier discover runs but never backfilled.
+            self.seeded = True
+            self.offer(list(discovered_stores_map(self.conn).values()))
+        for store in stores:
+            slug = store.get("slug")
+            if not slug or slug in self.seen:
+                continue
+            self.seen.add(slug)
+            segment = "wi" if str(store.get("state", "")).upper() == "WI" else "rest"
+            heapq.heappush(self.heap, (segment != "wi", len(self.seen), segment, store_record(store)))
+        self.queue_high_water = max(self.queue_high_water, len(self.heap))
+        self.submit()
+        while len(self.heap) >= self.args.queue_size and self.pending:
+            self.pump(block=True)
+
+    def overlap(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run one discovery request on a helper thread, recording fetches until it returns."""
+        request = self.search_pool.submit(fn, *args, **kwargs)
+        while not request.done():
+            self.submit()
+            if not self.pending:
+                break
+            wait([request, *self.pending], return_when=FIRST_COMPLETED)
+            self.pump(block=False, until=request)
+        return request.result()
+
+    def submit(self) -> None:
+        """Lease and start fetches from the heap until concurrency is reached."""
+        while self.heap and len(self.pending) < self.concurrency and not SHUTDOWN.is_set():
+            batch: dict[str, list[dict[str, Any]]] = {"wi": [], "rest": []}
+            for _ in range(min(len(self.heap), self.concurrency - len(self.pending))):
+                _, _, segment, store = heapq.heappop(self.heap)
+                batch[segment].append(store)
+            for segment, stores in batch.items():
+                if not stores:
+                    continue
+                slugs = [store["slug"] for store in stores]
+                # Completed stores and other workers' leases are dropped here.
+                held = claim_stores(self.conn, segment, slugs, self.owner, datetime.now(UTC), self.lease)
+                validators = {} if self.args.force else load_validators(self.conn, sorted(held))
+                for store in stores:
+                    if store["slug"] not in held:
+                        self.stats[segment]["skipped"] += 1
+                        continue
+                    fut = self.pool.submit(
+                        fetch_store_payload,
+                        store,
+                        self.args.timeout,
+                        self.args.sleep_ms,
+                        validators.get(store["slug"]),
+                    )
+                    self.pending[fut] = (segment, store)
+
+    def pump(self, block: bool, until: Future | None = None) -> None:
+        """Record the fetches that have landed (waiting for one if block), stopping once until is done."""
+        if not self.pending:
+            return
+        done, _ = wait(self.pending, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for fut in done:
+            if until is not None and until.done():
+                break
+            segment, store = self.pending.pop(fut)
+            try:
+                result, err = record_fetch(self.conn, segment, store, fut.result()), None
+            except FETCH_ERRORS as exc:
+                result, err = None, exc
+            self.record(segment, store, result, err)
+        self.submit()
+        self.commit_due()
+
+    def record(
+        self, segment: str, store: dict[str, Any], result: dict[str, Any] | None, err: Exception | None
+    ) -> None:
+        slug = store["slug"]
+        stats = self.stats[segment]
+        stats["processed"] += 1
+        self.uncommitted += 1
+        release_lease(self.conn, segment, self.owner, slug)
+        if err is not None:
+            stats["failures"] += 1
+            attempts = record_retry_failure(
+                self.conn, segment, store, str(err), utc_now(), self.args.retry_base_minutes, self.args.max_attempts
+            )
+            print(f"error segment={segment} slug={slug} attempts={attempts}: {err}", file=sys.stderr)
+            return
+        stats["success"] += 1
+        mark_backfill_completed(self.conn, segment, slug, utc_now())
+        clear_retry(self.conn, segment, slug)
+        if result["changed"]:
+            stats["flavor_changes"] += result["changes"]
+        else:
+            stats["unchanged"] += 1
+        if self.first_store_seconds is None:
+            self.first_store_seconds = time.monotonic() - self.started
+        print_fetch_result(segment, f"queued={len(self.heap)}", result)
+
+    def checkpoint(self) -> None:
+        for segment in self.stats:
+            renew_leases(self.conn, segment, self.owner, datetime.now(UTC), self.lease)
+        commit(self.conn)
+        get_exporter().flush()
+        self.uncommitted = 0
+        self.batch_started = time.monotonic()
+
+    def commit_due(self) -> None:
+        """Commit the open batch (lease claims and discovery's writes included) once it is full or old."""
+        if self.uncommitted >= self.args.commit_every or time.monotonic() - self.batch_started >= MAX_BATCH_SECONDS:
+            self.checkpoint()
+
+    def drain(self) -> None:
+        """Fetch everything still queued (after discovery has finished)."""
+        if not self.seeded:
+            self.offer([])
+        while self.pending or (self.heap and not SHUTDOWN.is_set()):
+            self.submit()
+            self.pump(block=True)
+
+    def close(self, abort: bool = False) -> None:
+        """Stop the pool and hand back this run's leases; abort drops the open batch."""
+        for fut in self.pending:
+            fut.cancel()
+        self.pool.shutdown(wait=True)
+        self.search_pool.shutdown(wait=True)
+        if abort:
+            self.conn.rollback()
+        for segment in self.stats:
+            release_lease(self.conn, segment, self.owner)
+        self.conn.commit()
+        get_exporter().flush()
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "owner": self.owner,
+            "stores_seen": len(self.seen),
+            "queue_remaining": len(self.heap),
+            "queue_high_water": self.queue_high_water,
+            "first_store_seconds": round(self.first_store_seconds, 3) if self.first_store_seconds is not None else None,
+            "segments": {
+                segment: {
+                    key: stats[key]
+                    for key in ("processed", "success", "unchanged", "failures", "skipped", "flavor_changes")
+                }
+                for segment, stats in self.stats.items()
+            },
+        }
+
+
+def stage_pipeline(args: argparse.Namespace) -> int:
+    global _shared_conn, _pipeline
+    ensure_dirs()
+    started = time.perf_counter()
+    # Discovery opens and closes the database itself; sharing one connection
+    # keeps the pipeline's writes in the same transactions as its checkpoints.
+    _shared_conn = init_db(KeepOpenConnection)
+    pipeline = _pipeline = BackfillPipeline(_shared_conn, args)
+    try:
+        rc = stage_discover(args)
+        pipeline.drain()
+    except BaseException:
+        pipeline.close(abort=True)
+        raise
+    else:
+        pipeline.close()
+    finally:
+        _pipeline = None
+        conn, _shared_conn = _shared_conn, None
+        conn.shutdown()
+        get_exporter().close()
+
+    summary = pipeline.summary()
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    summary["http"] = get_client().timing_summary()
+    summary["rate_limit"] = rate_limit_summary()
+    print("pipeline", json.dumps(summary))
+    failures = sum(stats["failures"] for stats in summary["segments"].values())
+    return rc or (2 if failures and args.stop_on_error else 0)
+
+
+REFRESH_RANKING_SQL = """
+WITH latest AS (
+    SELECT store_slug, MAX(id) AS id FROM snapshots GROUP BY store_slug
+),
+freshness AS (
+    SELECT st.slug, st.name, st.city, st.state, sn.max_date,
+           MAX(COALESCE(st.last_seen_at, ''), COALESCE(v.checked_at, '')) AS checked_at
+    FROM stores st
+    LEFT JOIN latest l ON l.store_slug = st.slug
+    LEFT JOIN snapshots sn ON sn.id = l.id
+    LEFT JOIN store_validators v ON v.store_slug = st.slug
+    WHERE st.last_seen_at IS NOT NULL
+),
+scored AS (
+    SELECT *,
+           (julianday(:now) - julianday(checked_at)) * 24.0 AS age_hours,
+           julianday(max_date) - julianday(date(:now)) AS horizon_days
+    FROM freshness
+)
+SELECT slug, name, city, state, checked_at, max_date, age_hours, horizon_days,
+       COALESCE(age_hours / (MAX(COALESCE(horizon_days, 0), 0) + 1), 1e9) AS urgency
+FROM scored
+WHERE age_hours IS NULL OR age_hours * 60.0 >= :min_age_minutes
+ORDER BY urgency DESC, slug
+LIMIT :limit
+"""
+
+
+def refresh_candidates(
+    conn: sqlite3.Connection,
+    limit: int,
+    min_age_minutes: int = 0,
+    now: str | None = None,
+) -> list[dict[str, Any]]:
+    """Stores most in need of a fetch, most urgent first."""
+    # Never-fetched stores first (WI before the rest), then hours since the
+    # last check divided by (days of forecast left + 1).
+    in_db = {row[0] for row in conn.execute("SELECT slug FROM stores WHERE last_seen_at IS NOT NULL")}
+    never = [
+        dict(store, urgency=None)
+        for path in (WI_STORES_PATH, REST_STORES_PATH)
+        for store in read_json(path, [])
+        if store.get("slug") and store["slug"] not in in_db
+    ]
+    if len(never) >= limit:
+        return never[:limit]
+
+    keys = ("slug", "name", "city", "state", "checked_at", "max_date", "age_hours", "horizon_days", "urgency")
+    rows = conn.execute(
+        REFRESH_RANKING_SQL,
+        {"now": now or utc_now(), "min_age_minutes": min_age_minutes, "limit": limit - len(never)},
+    )
+    return never + [dict(zip(keys, row)) for row in rows]
+
+
+def stage_refresh(args: argparse.Namespace) -> int:
+    ensure_dirs()
+    conn = init_db()
+    candidates = refresh_candidates(conn, args.limit, args.min_age_minutes)
+
+    if args.dry_run:
+        conn.close()
+        for c in candidates:
+            print(json.dumps(c))
+        return 0
+
+    configure_rate_limit(args)
+    success = 0
+    unchanged = 0
+    failures = 0
+    flavor_changes_seen = 0
+    uncommitted = 0
+
+    def on_result(i: int, store: dict[str, Any], result: dict[str, Any] | None, err: Exception | None) -> bool:
+        nonlocal success, unchanged, failures, uncommitted, flavor_changes_seen
+        if err is not None:
+            failures += 1
+            print(f"error segment=refresh slug={store['slug']}: {err}", file=sys.stderr)
+        else:
+            success += 1
+            unchanged += 0 if result["changed"] else 1
+            flavor_changes_seen += result.get("changes", 0)
+            print_fetch_result("refresh", f"rank={i + 1}/{len(candidates)}", result)
+        uncommitted += 1
+        if uncommitted >= args.commit_every:
+            commit(conn)
+            get_exporter().flush()
+            uncommitted = 0
+        return True
+
+    run_store_fetches(conn, "refresh", list(enumerate(candidates)), args, on_result)
+    commit(conn)
+    conn.close()
+    get_exporter().close()
+
+    urgencies = [c["urgency"] for c in candidates if c.get("urgency") is not None]
+    print(
+        "refresh",
+        json.dumps(
+            {
+                "candidates": len(candidates),
+                "never_fetched": sum(1 for c in candidates if c.get("urgency") is None),
+                "success_this_run": success,
+                "unchanged_this_run": unchanged,
+                "failures_this_run": failures,
+                "flavor_changes_this_run": flavor_changes_seen,
+                "exports": get_exporter().summary(),
+                "max_urgency": round(max(urgencies), 3) if urgencies else None,
+                "min_horizon_days": min(
+                    (c["horizon_days"] for c in candidates if c.get("horizon_days") is not None), default=None
+                ),
+                "http": get_client().timing_summary(),
+                "rate_limit": rate_limit_summary(),
+            }
+        ),
+    )
+    return 0
+
+
+def fts_phrase(text: str) -> str:
+    """Quote each word so user input is never parsed as FTS5 query syntax."""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+
+def query_flavors(
+    conn: sqlite3.Connection,
+    text: str | None = None,
+    title: str | None = None,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    state: str | None = None,
+    brand: str | None = None,
+    latest: bool = False,
+    limit: int = 100,
+) -> list[dict[str, Any]]:
+    """Flavor rows matching full-text words and/or an exact title, with filters."""
+    where: list[str] = []
+    params: list[Any] = []
+    if text:
+        # With a date range the date index is usually the more selective
+        # driver; the unary + stops the planner from iterating FTS rowids.
+        rowid = "+f.rowid" if date_from or date_to else "f.rowid"
+        where.append(f"{rowid} IN (SELECT rowid FROM flavor_fts WHERE flavor_fts MATCH ?)")
+        params.append(fts_phrase(text))
+    if title:
+        where.append("f.title_norm = ?")
+        params.append(normalize_title(title))
+    if date_from:
+        where.append("f.flavor_date >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append("f.flavor_date <= ?")
+        params.append(date_to)
+    if state:
+        where.append("UPPER(s.state) = ?")
+        params.append(state.upper())
+    if brand:
+        where.append("brand(f.store_slug) = ?")
+        params.append(brand.lower())
+
+    sql = """
+        SELECT f.flavor_date, f.store_slug, s.name, s.city, s.state, f.title
+        FROM store_flavors f LEFT JOIN stores s ON s.slug = f.store_slug
+    """
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY f.flavor_date {'DESC' if latest else 'ASC'}, f.store_slug LIMIT ?"
+    params.append(limit)
+
+    keys = ("date", "slug", "name", "city", "state", "title")
+    return [dict(zip(keys, row)) for row in conn.execute(sql, params)]
+
+
+def like_pattern(text: str, prefix: str = "%", suffix: str = "%") -> str:
+    """LIKE pattern for text taken literally (escape character: backslash)."""
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return prefix + escaped + suffix
+
+
+# Exact slug/name/city first, then prefixes, then word starts inside a
+# name or city ("mad" -> "Lake Madison"), then any other substring.
+STORE_RANK_SQL = """
+    CASE
+        WHEN s.slug = :q COLLATE NOCASE OR s.name = :q COLLATE NOCASE OR s.city = :q COLLATE NOCASE THEN 0
+        WHEN s.slug LIKE :prefix ESCAPE '\\' OR s.name LIKE :prefix ESCAPE '\\'
+            OR s.city LIKE :prefix ESCAPE '\\' THEN 1
+        WHEN s.name LIKE :word ESCAPE '\\' OR s.city LIKE :word ESCAPE '\\' OR s.slug LIKE :part ESCAPE '\\' THEN 2
+        ELSE 3
+    END
+"""
+
+
+def search_stores(
+    conn: sqlite3.Connection,
+    q: str,
+    state: str | None = None,
+    brand: str | None = None,
+    limit: int = 20,
+) -> list[dict[str, Any]]:
+    """Stores whose slug, name or city contains q, best matches first (as /api/v1/stores?q=)."""
+    q = q.strip()
+    if not q:
+        return []
+    params: dict[str, Any] = {
+        "q": q,
+        "prefix": like_pattern(q, prefix=""),
+        "word": like_pattern(q, prefix="% "),
+        "part": like_pattern(q, prefix="%-"),
+        "limit": limit,
+    }
+    if len(q) >= 3 and store_fts_enabled(conn):
+        where = ["s.rowid IN (SELECT rowid FROM store_fts WHERE store_fts MATCH :match)"]
+        params["match"] = '"' + q.replace('"', '""') + '"'
+    else:
+        where = ["(s.slug LIKE :any ESCAPE '\\' OR s.name LIKE :any ESCAPE '\\' OR s.city LIKE :any ESCAPE '\\')"]
+        params["any"] = like_pattern(q)
+    if state:
+        where.append("UPPER(s.state) = :state")
+        params["state"] = state.upper()
+    if brand:
+        where.append("brand(s.slug) = :brand")
+        params["brand"] = brand.lower()
+    sql = f"""
+        SELECT s.slug, s.name, s.city, s.state, brand(s.slug), {STORE_RANK_SQL} AS rank
+        FROM stores s WHERE {" AND ".join(where)}
+        ORDER BY rank, s.name, s.slug LIMIT :limit
+    """
+    keys = ("slug", "name", "city", "state", "brand", "rank")
+    return [dict(zip(keys, row)) for row in conn.execute(sql, params)]
+
+
+def stage_search(args: argparse.Namespace) -> int:
+    ensure_dirs()
+    conn = init_db()
+    started = time.perf_counter()
+    rows = search_stores(conn, args.q, state=args.state, brand=args.brand, limit=args.limit)
+    elapsed_ms = (time.perf_counter() - started) * 1000.0
+    conn.close()
+
+    for row in rows:
+        print(json.dumps(row))
+    print("search", json.dumps({"rows": len(rows), "elapsed_ms": round(elapsed_ms, 3)}), file=sys.stderr)
+    return 0
+
+
+def stage_query(args: argparse.Namespace) -> int:
+    ensure_dirs()
+    conn = init_db()
+    started = time.perf_counter()
+    rows = query_flavors(
+        conn,
+        text=args.text,
+        title=args.title,
+        date_from=args.date_from,
+        date_to=args.date_to,
+        state=args.state,
+        brand=args.brand,
+        latest=args.latest,
+        limit=args.limit,
+    )
+    elapsed_ms = (time.perf_counter() - started) * 1000.0
+    conn.close()
+
+    for row in rows:
+        print(json.dumps(row))
+    print("query", json.dumps({"rows": len(rows), "elapsed_ms": round(elapsed_ms, 2)}), file=sys.stderr)
+    return 0
+
+
+AVG_GAP_SQL = "CASE WHEN appearances > 1 THEN ROUND((julianday(last_date) - julianday(first_date)) / (appearances - 1), 1) END"
+
+
+def flavor_overview(conn: sqlite3.Connection, limit: int) -> dict[str, Any]:
+    """Most common and rarest flavors, read from flavor_stats alone."""
+    keys = ("title", "appearances", "stores", "avg_gap_days", "first_date", "last_date")
+    sql = f"SELECT title, appearances, stores, {AVG_GAP_SQL}, first_date, last_date FROM flavor_stats"
+    total = conn.execute("SELECT COUNT(*), COALESCE(SUM(appearances), 0) FROM flavor_stats").fetchone()
+    return {
+        "flavors": total[0],
+        "store_days": total[1],
+        "most_common": [dict(zip(keys, r)) for r in conn.execute(sql + " ORDER BY appearances DESC, title LIMIT ?", (limit,))],
+        "rarest": [dict(zip(keys, r)) for r in conn.execute(sql + " ORDER BY appearances, title LIMIT ?", (limit,))],
+    }
+
+
+def flavor_detail(conn: sqlite3.Connection, title: str, today: str, limit: int) -> dict[str, Any] | None:
+    """One flavor: totals, last/next date anywhere, spread by state, top stores."""
+    norm = normalize_title(title)
+    row = conn.execute(
+        f"SELECT title, appearances, stores, {AVG_GAP_SQL}, first_date, last_date FROM flavor_stats WHERE title_norm = ?",
+        (norm,),
+    ).fetchone()
+    if row is None:
+        return None
+    out = dict(zip(("title", "appearances", "stores", "avg_gap_days", "first_date", "last_date"), row))
+    out["last_seen"] = conn.execute(
+        "SELECT MAX(flavor_date) FROM store_flavors WHERE title_norm = ? AND flavor_date <= ?", (norm, today)
+    ).fetchone()[0]
+    out["next_scheduled"] = conn.execute(
+        "SELECT MIN(flavor_date) FROM store_flavors WHERE title_norm = ? AND flavor_date > ?", (norm, today)
+    ).fetchone()[0]
+    out["by_state"] = [
+        {"state": state, "stores": stores, "appearances": appearances}
+        for state, stores, appearances in conn.execute(
+            """
+            SELECT COALESCE(s.state, ''), COUNT(*), SUM(a.appearances)
+            FROM flavor_store_stats a LEFT JOIN stores s ON s.slug = a.store_slug
+            WHERE a.title_norm = ?
+            GROUP BY 1 ORDER BY 3 DESC, 1
+            """,
+            (norm,),
+        )
+    ]
+    out["top_stores"] = [
+        dict(zip(("slug", "name", "state", "appearances", "avg_gap_days", "last_date"), r))
+        for r in conn.execute(
+            f"""
+            SELECT a.store_slug, s.name, s.state, a.appearances, {AVG_GAP_SQL}, a.last_date
+            FROM flavor_store_stats a LEFT JOIN stores s ON s.slug = a.store_slug
+            WHERE a.title_norm = ?
+            ORDER BY a.appearances DESC, a.store_slug LIMIT ?
+            """,
+            (norm, limit),
+        )
+    ]
+    return out
+
+
+def store_rotation(conn: sqlite3.Connection, slug: str, today: str, limit: int) -> list[dict[str, Any]]:
+    """A store's flavors by frequency, with last/next dates relative to today."""
+    rows = []
+    for norm, title, appearances, gap, first_date, last_date in conn.execute(
+        f"""
+        SELECT title_norm, title, appearances, {AVG_GAP_SQL}, first_date, last_date
+        FROM flavor_store_stats WHERE store_slug = ?
+        ORDER BY appearances DESC, title LIMIT ?
+        """,
+        (slug, limit),
+    ):
+        last_seen = conn.execute(
+            "SELECT MAX(flavor_date) FROM store_flavors WHERE store_slug = ? AND title_norm = ? AND flavor_date <= ?",
+            (slug, norm, today),
+        ).fetchone()[0]
+        next_scheduled = conn.execute(
+            "SELECT MIN(flavor_date) FROM store_flavors WHERE store_slug = ? AND title_norm = ? AND flavor_date > ?",
+            (slug, norm, today),
+        ).fetchone()[0]
+        rows.append(
+            {
+                "title": title,
+                "appearances": appearances,
+                "avg_gap_days": gap,
+                "first_date": first_date,
+                "last_seen": last_seen,
+                "next_scheduled": next_scheduled,
+                "days_since": (
+                    (date.fromisoformat(today) - date.fromisoformat(last_seen)).days if last_seen else None
+                ),
+            }
+        )
+    return rows
+
+
+def stage_changes(args: argparse.Namespace) -> int:
+    ensure_dirs()
+    conn = init_db()
+    started = time.perf_counter()
+    rows = flavor_changes(
+        conn, since=args.since, after_id=args.after_id, store=args.store, kinds=args.kind, limit=args.limit
+    )
+    elapsed_ms = (time.perf_counter() - started) * 1000.0
+    conn.close()
+
+    for row in rows:
+        print(json.dumps(row))
+    print(
+        "changes",
+        json.dumps(
+            {"rows": len(rows), "last_id": rows[-1]["id"] if rows else args.after_id, "elapsed_ms": round(elapsed_ms, 2)}
+        ),
+        file=sys.stderr,
+    )
+    return 0
+
+
+def stage_stats(args: argparse.Namespace) -> int:
+    ensure_dirs()
+    conn = init_db()
+    started = time.perf_counter()
+    if args.rebuild:
+        rebuild_flavor_stats(conn)
+    today = args.date or utc_now()[:10]
+    result: dict[str, Any] = {"date": today}
+    rc = 0
+    if args.flavor:
+        detail = flavor_detail(conn, args.flavor, today, args.limit)
+        if detail is None:
+            print(f"no history for flavor: {args.flavor}", file=sys.stderr)
+            rc = 1
+        result["flavor"] = detail
+    if args.store:
+        result["store"] = args.store
+        result["rotation"] = store_rotation(conn, args.store, today, args.limit)
+    if not args.flavor and not args.store:
+        result.update(flavor_overview(conn, args.limit))
+    conn.close()
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000.0, 2)
+    print(json.dumps(result, indent=2))
+    return rc
+
+
+def stage_pack(_: argparse.Namespace) -> int:
+    ensure_dirs()
+    started = time.perf_counter()
+    with METRICS.timer("export_seconds", kind="pack"):
+        count = write_calendar_pack(CALENDAR_DIR, CALENDAR_PACK)
+    print(
+        "pack",
+        json.dumps(
+            {
+                "calendars": count,
+                "bytes": CALENDAR_PACK.stat().st_size,
+                "path": display_path(CALENDAR_PACK),
+                "elapsed_ms": round((time.perf_counter() - started) * 1000.0, 1),
+            }
+        ),
+    )
+    return 0
+
+
+def stage_export(args: argparse.Namespace) -> int:
+    ensure_dirs()
+    started = time.perf_counter()
+    conn = init_db()
+    with METRICS.timer("export_seconds", kind="static"):
+        summary = export_static(
+            conn, EXPORT_DIR, args.date or utc_now()[:10], args.days, args.prefix_len, full=args.full
+        )
+    conn.close()
+    summary["path"] = display_path(EXPORT_DIR)
+    summary["elapsed_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+    print("export", json.dumps(summary))
+    return 0
+
+
+def stage_compact(args: argparse.Namespace) -> int:
+    ensure_dirs()
+    started = time.perf_counter()
+    conn = init_db()
+    bytes_before = db_file_bytes(DB_PATH)
+    summary = compact_snapshots(
+        conn,
+        ARCHIVE_DIR,
+        args.date or utc_now()[:10],
+        keep_all_days=args.keep_all_days,
+        daily_days=args.daily_days,
+        dry_run=args.dry_run,
+    )
+    summary["snapshots_left"] = conn.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0]
+    summary["snapshot_log"] = compact_snapshot_log(SNAPSHOT_LOG, ARCHIVE_DIR, dry_run=args.dry_run)
+    if not args.dry_run and not args.no_vacuum:
+        summary["vacuum"] = incremental_vacuum(conn)
+        if summary["vacuum"]["converted"]:
+            print("converted database to auto_vacuum=INCREMENTAL (one-time full VACUUM)", file=sys.stderr)
+    conn.close()
+    summary["db_bytes"] = {"before": bytes_before, "after": db_file_bytes(DB_PATH)}
+    summary["dry_run"] = args.dry_run
+    summary["path"] = display_path(ARCHIVE_DIR)
+    summary["elapsed_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+    print("compact", json.dumps(summary))
+    return 0
+
+
 def stage_status(_: argparse.Namespace) -> int:
     ensure_dirs()
 
     stores = read_json(STORES_PATH, [])
     wi_stores = read_json(WI_STORES_PATH, [])
     rest_stores = read_json(REST_STORES_PATH, [])
-    discover_state = read_json(DISCOVER_STATE, {})
-    wi_state = read_json(WI_STATE, {})
-    rest_state = read_json(REST_STATE, {})
 
     conn = init_db()
     cur = conn.cursor()
 
-    cur.execute("SELECT COUNT(*) FROM stores")
+    sweep = load_discover_progress(conn, "sweep")
+    adaptive = load_discover_progress(conn, "adaptive")
+    adaptive_frontier = adaptive["frontier"] or {}
+    adaptive_found = len(discovered_stores_map(conn, "adaptive"))
+    backfill = {}
+    for segment, segment_stores in (("wi", wi_stores), ("rest", rest_stores)):
+        # Counted from backfill_completed itself: the pipeline stage marks
+        # stores completed without ever writing a progress row.
+        row = cur.execute(
+            """
+            SELECT p.next_index, p.last_updated_at, c.completed
+            FROM (SELECT COUNT(*) AS completed FROM backfill_completed WHERE segment = ?) c
+            LEFT JOIN backfill_progress p ON p.segment = ?
+            """,
+            (segment, segment),
+        ).fetchone()
+        backfill[segment] = {
+            "next_index": row[0] or 0,
+            "completed": row[2],
+            "total": len(segment_stores),
+            "last_updated_at": row[1],
+            "retry_queue": retry_queue_summary(conn, segment, utc_now()),
+            "leases": lease_summary(conn, segment, utc_now()),
+        }
+
+    cur.execute("SELECT COUNT(*) FROM stores WHERE last_seen_at IS NOT NULL")
     stores_db = cur.fetchone()[0]
 
     cur.execute("SELECT COUNT(*) FROM store_flavors")
     flavors_db = cur.fetchone()[0]
 
-    cur.execute("SELECT state, COUNT(*) FROM stores GROUP BY state ORDER BY COUNT(*) DESC LIMIT 10")
+    cur.execute("SELECT state, COUNT(*) FROM stores WHERE last_seen_at IS NOT NULL GROUP BY state ORDER BY COUNT(*) DESC LIMIT 10")
     state_top = [{"state": r[0], "count": r[1]} for r in cur.fetchall()]
 
     cur.execute("SELECT COUNT(*) FROM snapshots")
     snapshots_db = cur.fetchone()[0]
 
+    cur.execute("SELECT COUNT(*) FROM store_validators")
+    validators_db = cur.fetchone()[0]
+
+    cur.execute("SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM snapshot_blobs")
+    blobs_db, blob_raw_bytes, blob_stored_bytes = cur.fetchone()
+
+    freelist_pages = cur.execute("PRAGMA freelist_count").fetchone()[0]
+    auto_vacuum = {0: "none", 1: "full", 2: "incremental"}[cur.execute("PRAGMA auto_vacuum").fetchone()[0]]
+
     conn.close()
 
     print(
         json.dumps(
             {
                 "discovery": {
-                    "tokens_completed": discover_state.get("completed_tokens", 0),
+                    "tokens_completed": sweep["next_index"],
                     "stores_found_total": len(stores),
                     "stores_found_wi": len(wi_stores),
                     "stores_found_rest": len(rest_stores),
-                    "last_updated_at": discover_state.get("last_updated_at"),
-                },
-                "backfill": {
-                    "wi": {
-                        "next_index": wi_state.get("next_index", 0),
-                        "completed": len(wi_state.get("completed_slugs", [])),
-                        "total": len(wi_stores),
-                        "last_updated_at": wi_state.get("last_updated_at"),
-                    },
-                    "rest": {
-                        "next_index": rest_state.get("next_index", 0),
-                        "completed": len(rest_state.get("completed_slugs", [])),
-                        "total": len(rest_stores),
-                        "last_updated_at": rest_state.get("last_updated_at"),
+                    "last_updated_at": sweep["last_updated_at"],
+                    "adaptive": {
+                        "done": adaptive["done"],
+                        "level": adaptive_frontier.get("level"),
+                        "requests": adaptive_frontier.get("requests", 0),
+                        "stores_found": adaptive_found,
+                        "last_updated_at": adaptive["last_updated_at"],
                     },
                 },
+                "backfill": backfill,
                 "database": {
                     "stores": stores_db,
                     "store_flavor_rows": flavors_db,
                     "snapshots": snapshots_db,
+                    "stores_with_validators": validators_db,
+                    "snapshot_blobs": blobs_db,
+                    "snapshot_blob_bytes": {"raw": blob_raw_bytes, "stored": blob_stored_bytes},
                     "top_states": state_top,
+                    "file_bytes": db_file_bytes(DB_PATH),
+                    "freelist_pages": freelist_pages,
+                    "auto_vacuum": auto_vacuum,
                 },
                 "paths": {
-                    "data_dir": str(DATA_DIR.relative_to(ROOT)),
-                    "db": str(DB_PATH.relative_to(ROOT)),
-                    "wi_state": str(WI_STATE.relative_to(ROOT)),
-                    "rest_state": str(REST_STATE.relative_to(ROOT)),
+                    "data_dir": display_path(DATA_DIR),
+                    "db": display_path(DB_PATH),
+                    "archive": display_path(ARCHIVE_DIR),
                 },
             },
             indent=2,
@@ -491,14 +3459,256 @@ def stage_status(_: argparse.Namespace) -> int:
     return 0
 
 
+class ScheduledTask:
+    """A stage the daemon runs every interval seconds; argv returns None to skip a round."""
+
+    def __init__(self, name: str, interval: float, priority: int, argv: Callable[[], list[str] | None]) -> None:
+        self.name = name
+        self.interval = interval
+        self.priority = priority
+        self.argv = argv
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_rc: int | None = None
+        self.last_started_at: str | None = None
+        self.last_seconds: float | None = None
+        self.next_run = 0.0
+
+
+SKIP_RECHECK_SECONDS = 60.0
+
+
+class Daemon:
+    """Runs stages one at a time on a schedule, sharing one connection, fetch pool and HTTP client."""
+
+    def __init__(self, tasks: list[ScheduledTask]) -> None:
+        self.tasks = tasks
+        self.current: str | None = None
+        self.started = time.monotonic()
+        self.started_at = utc_now()
+        self._lock = threading.Lock()
+
+    def run_task(self, task: ScheduledTask) -> int | None:
+        argv = task.argv()
+        if argv is None:
+            with self._lock:
+                task.skipped += 1
+            return None
+        with self._lock:
+            self.current = task.name
+            task.last_started_at = utc_now()
+        started = time.perf_counter()
+        try:
+            args = build_parser().parse_args(argv)
+            rc = args.func(args)
+        except Exception:  # noqa: BLE001 - one failed stage must not stop the schedule
+            traceback.print_exc()
+            rc = 1
+        seconds = time.perf_counter() - started
+        METRICS.observe("daemon_task_seconds", seconds, task=task.name)
+        METRICS.inc("daemon_task_runs_total", task=task.name, rc=rc)
+        with self._lock:
+            self.current = None
+            task.runs += 1
+            task.failures += rc != 0
+            task.last_rc = rc
+            task.last_seconds = round(seconds, 3)
+        print("daemon", json.dumps({"task": task.name, "rc": rc, "seconds": round(seconds, 3)}), flush=True)
+        return rc
+
+    def run(self, once: bool = False) -> None:
+        """Run due tasks until SHUTDOWN is set (or, with once, until each has run)."""
+        now = time.monotonic()
+        heap = []
+        for task in self.tasks:
+            task.next_run = now
+            heap.append((now, task.priority, task.name))
+        heapq.heapify(heap)
+        by_name = {task.name: task for task in self.tasks}
+        while heap and not SHUTDOWN.is_set():
+            due, _, name = heap[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                SHUTDOWN.wait(delay)
+                continue
+            heapq.heappop(heap)
+            task = by_name[name]
+            rc = self.run_task(task)
+            if once:
+                continue
+            task.next_run = time.monotonic() + (SKIP_RECHECK_SECONDS if rc is None else task.interval)
+            heapq.heappush(heap, (task.next_run, task.priority, name))
+
+    def health(self) -> dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            tasks = {
+                t.name: {
+                    "runs": t.runs,
+                    "failures": t.failures,
+                    "skipped": t.skipped,
+                    "last_rc": t.last_rc,
+                    "last_started_at": t.last_started_at,
+                    "last_seconds": t.last_seconds,
+                    "next_run_in_s": round(max(0.0, t.next_run - now), 1),
+                }
+                for t in self.tasks
+            }
+            current = self.current
+        if SHUTDOWN.is_set():
+            status = "stopping"
+        elif any(t["last_rc"] not in (None, 0) for t in tasks.values()):
+            status = "degraded"
+        else:
+            status = "ok"
+        return {
+            "status": status,
+            "started_at": self.started_at,
+            "uptime_s": round(now - self.started, 1),
+            "current_task": current,
+            "tasks": tasks,
+        }
+
+
+def serve_daemon_http(daemon: Daemon, host: str, port: int) -> http.server.ThreadingHTTPServer:
+    """GET /healthz (JSON; 503 while stopping) and /metrics (Prometheus text) on a background thread."""
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path == "/healthz":
+                health = daemon.health()
+                body = json.dumps(health).encode("utf-8")
+                status, ctype = (503 if health["status"] == "stopping" else 200), "application/json"
+            elif self.path == "/metrics":
+                body = METRICS.prometheus(METRICS.snapshot()).encode("utf-8")
+                status, ctype = 200, "text/plain; version=0.0.4"
+            else:
+                body, status, ctype = b"not found\n", 404, "text/plain"
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="daemon-http", daemon=True).start()
+    return server
+
+
+def daemon_tasks(args: argparse.Namespace) -> list[ScheduledTask]:
+    def common() -> list[str]:
+        rate = ["--rate", str(round(_limiter.rate, 2)), "--min-rate", str(args.min_rate)]
+        rate += ["--retries", str(args.retries)]
+        if args.max_rate:
+            rate += ["--max-rate", str(args.max_rate)]
+        return ["--concurrency", str(args.concurrency), *rate]
+
+    def refresh() -> list[str]:
+        return ["refresh", "--limit", str(args.refresh_limit), *common()]
+
+    def backfill(segment: str) -> Callable[[], list[str] | None]:
+        def argv() -> list[str] | None:
+            if not segment_files(segment)[0].exists():
+                return None
+            return ["backfill", "--segment", segment, "--stores-per-run", str(args.backfill_stores), *common()]
+
+        return argv
+
+    def discover() -> list[str]:
+        # A finished sweep is started over, so each interval re-checks the
+        # whole store list for openings.
+        conn = init_db()
+        done = load_discover_progress(conn, "adaptive")["done"]
+        conn.close()
+        argv = ["discover", "--strategy", "adaptive", "--tokens-per-run", str(args.discover_tokens), *common()[2:]]
+        return argv + ["--reset"] if done else argv
+
+    tasks = []
+    if args.refresh_minutes > 0:
+        tasks.append(ScheduledTask("refresh", args.refresh_minutes * 60.0, 0, refresh))
+    if args.backfill_minutes > 0:
+        tasks.append(ScheduledTask("backfill_wi", args.backfill_minutes * 60.0, 1, backfill("wi")))
+        tasks.append(ScheduledTask("backfill_rest", args.backfill_minutes * 60.0, 2, backfill("rest")))
+    if args.discover_hours > 0:
+        tasks.append(ScheduledTask("discover", args.discover_hours * 3600.0, 3, discover))
+    return tasks
+
+
+def stage_daemon(args: argparse.Namespace) -> int:
+    global _shared_conn, _fetch_pool
+    ensure_dirs()
+    SHUTDOWN.clear()
+    configure_rate_limit(args)  # the first task starts at --rate; later ones at the learned rate
+    daemon = Daemon(daemon_tasks(args))
+
+    def on_signal(signum: int, _frame: Any) -> None:
+        print(f"daemon: {signal.Signals(signum).name}, stopping after the current checkpoint", file=sys.stderr)
+        SHUTDOWN.set()
+
+    previous = {sig: signal.signal(sig, on_signal) for sig in (signal.SIGTERM, signal.SIGINT)}
+    _shared_conn = init_db(KeepOpenConnection)
+    _fetch_pool = ThreadPoolExecutor(max_workers=max(1, args.concurrency))
+    server = serve_daemon_http(daemon, args.host, args.port) if args.port >= 0 else None
+    if server is not None:
+        print(f"daemon: health on http://{args.host}:{server.server_address[1]}/healthz", file=sys.stderr, flush=True)
+    try:
+        daemon.run(once=args.once)
+    finally:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        conn, _shared_conn = _shared_conn, None
+        conn.shutdown()
+        pool, _fetch_pool = _fetch_pool, None
+        pool.shutdown(wait=True)
+        get_exporter().close()
+        reset_client()
+
+    health = daemon.health()
+    print("daemon", json.dumps({"status": health["status"], "tasks": health["tasks"]}))
+    return 0 if health["status"] != "degraded" else 1
+
+
+def add_rate_limit_args(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--rate", type=float, default=5.0, help="Starting request rate (req/s); adapts from here")
+    p.add_argument("--max-rate", type=float, default=0.0, help="Ceiling for the adaptive rate (0 = none)")
+    p.add_argument("--min-rate", type=float, default=0.5, help="Floor the rate backs off to on 429/5xx")
+    p.add_argument("--retries", type=int, default=4, help="Retries per request on 429/5xx/timeouts")
+
+
 def build_parser() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(description="Staged Culver's flavor backfill utility")
+    p.add_argument("--no-metrics", action="store_true", help="Do not write metrics.ndjson / .prom files")
+    p.add_argument("--profile", action="store_true", help="Save cProfile stats and a tracemalloc report for this run")
     sub = p.add_subparsers(dest="cmd", required=True)
 
     p_discover = sub.add_parser("discover", help="Discover stores and split WI/rest lists")
     p_discover.add_argument("--tokens-per-run", type=int, default=200, help="Discovery tokens to process per run")
     p_discover.add_argument("--sleep-ms", type=int, default=0, help="Optional sleep between API calls")
     p_discover.add_argument("--timeout", type=int, default=30, help="HTTP timeout seconds")
+    p_discover.add_argument(
+        "--strategy",
+        choices=["sweep", "adaptive"],
+        default="sweep",
+        help="sweep: fixed two-character tokens; adaptive: expand prefixes only where results are truncated",
+    )
+    p_discover.add_argument("--max-prefix-len", type=int, default=3, help="Longest prefix the adaptive strategy tries")
+    p_discover.add_argument("--page-limit", type=int, default=0, help="Worker result cap (0 = infer from responses)")
+    p_discover.add_argument(
+        "--patience",
+        type=int,
+        default=6,
+        help="Adaptive: prune a prefix's remaining children after this many in a row add nothing (0 = never)",
+    )
+    p_discover.add_argument("--reset", action="store_true", help="Start a new sweep (found stores are kept)")
+    add_rate_limit_args(p_discover)
     p_discover.set_defaults(func=stage_discover)
 
     p_backfill = sub.add_parser("backfill", help="Backfill store flavor windows by segment")
@@ -507,18 +3717,184 @@ def build_parser() -> argparse.ArgumentParser:
     p_backfill.add_argument("--sleep-ms", type=int, default=0, help="Optional sleep between API calls")
     p_backfill.add_argument("--timeout", type=int, default=30, help="HTTP timeout seconds")
     p_backfill.add_argument("--stop-on-error", action="store_true", help="Stop immediately on first fetch error")
+    p_backfill.add_argument("--concurrency", type=int, default=1, help="Flavor fetches to keep in flight")
+    p_backfill.add_argument("--force", action="store_true", help="Ignore cached validators and rewrite every store")
+    p_backfill.add_argument("--commit-every", type=int, default=25, help="Stores per transaction and checkpoint")
+    p_backfill.add_argument("--reset", action="store_true", help="Start the segment over from its first store")
+    p_backfill.add_argument(
+        "--retry-base-minutes", type=float, default=5.0, help="Wait before a failed store's first retry; doubles after"
+    )
+    p_backfill.add_argument(
+        "--max-attempts", type=int, default=8, help="Failures before a store is parked as a dead letter"
+    )
+    p_backfill.add_argument("--owner", help="Lease owner ID for this worker (default: host:pid:random)")
+    p_backfill.add_argument(
+        "--lease-minutes", type=float, default=15.0, help="Lease length; renewed at each checkpoint"
+    )
+    add_rate_limit_args(p_backfill)
     p_backfill.set_defaults(func=stage_backfill)
 
+    p_pipeline = sub.add_parser(
+        "pipeline", help="Discover and backfill at once: new stores are fetched as discovery finds them, WI first"
+    )
+    p_pipeline.add_argument("--strategy", choices=["sweep", "adaptive"], default="adaptive", help="Discovery strategy")
+    p_pipeline.add_argument("--tokens-per-run", type=int, default=200, help="Discovery tokens to process per run")
+    p_pipeline.add_argument("--max-prefix-len", type=int, default=3, help="Longest prefix the adaptive strategy tries")
+    p_pipeline.add_argument("--page-limit", type=int, default=0, help="Worker result cap (0 = infer from responses)")
+    p_pipeline.add_argument("--patience", type=int, default=6, help="Adaptive pruning patience (0 = never)")
+    p_pipeline.add_argument("--reset", action="store_true", help="Start a new discovery sweep")
+    p_pipeline.add_argument("--queue-size", type=int, default=200, help="Stores discovery may run ahead of backfill")
+    p_pipeline.add_argument("--concurrency", type=int, default=4, help="Flavor fetches to keep in flight")
+    p_pipeline.add_argument("--sleep-ms", type=int, default=0, help="Optional sleep between API calls")
+    p_pipeline.add_argument("--timeout", type=int, default=30, help="HTTP timeout seconds")
+    p_pipeline.add_argument("--stop-on-error", action="store_true", help="Exit 2 if any fetch failed")
+    p_pipeline.add_argument("--force", action="store_true", help="Ignore cached validators and rewrite every store")
+    p_pipeline.add_argument("--commit-every", type=int, default=25, help="Stores per transaction")
+    p_pipeline.add_argument(
+        "--retry-base-minutes", type=float, default=5.0, help="Wait before a failed store's first retry; doubles after"
+    )
+    p_pipeline.add_argument(
+        "--max-attempts", type=int, default=8, help="Failures before a store is parked as a dead letter"
+    )
+    p_pipeline.add_argument("--owner", help="Lease owner ID for this worker (default: host:pid:random)")
+    p_pipeline.add_argument(
+        "--lease-minutes", type=float, default=15.0, help="Lease length; renewed at each checkpoint"
+    )
+    add_rate_limit_args(p_pipeline)
+    p_pipeline.set_defaults(func=stage_pipeline)
+
+    p_refresh = sub.add_parser("refresh", help="Fetch the stores whose data is closest to running out")
+    p_refresh.add_argument("--limit", type=int, default=50, help="Stores to fetch this run")
+    p_refresh.add_argument(
+        "--min-age-minutes", type=int, default=60, help="Skip stores checked more recently than this"
+    )
+    p_refresh.add_argument("--concurrency", type=int, default=1, help="Flavor fetches to keep in flight")
+    p_refresh.add_argument("--sleep-ms", type=int, default=0, help="Optional sleep between API calls")
+    p_refresh.add_argument("--timeout", type=int, default=30, help="HTTP timeout seconds")
+    p_refresh.add_argument("--force", action="store_true", help="Ignore cached validators and rewrite every store")
+    p_refresh.add_argument("--commit-every", type=int, default=25, help="Stores per transaction")
+    p_refresh.add_argument("--dry-run", action="store_true", help="Print the ranking without fetching")
+    add_rate_limit_args(p_refresh)
+    p_refresh.set_defaults(func=stage_refresh)
+
+    p_query = sub.add_parser("query", help="Search flavor history (which stores serve X, when X last appeared)")
+    p_query.add_argument("text", nargs="?", help="Words to match in flavor title/description")
+    p_query.add_argument("--title", help="Exact flavor title (case and quote insensitive)")
+    p_query.add_argument("--from", dest="date_from", help="First date, YYYY-MM-DD")
+    p_query.add_argument("--to", dest="date_to", help="Last date, YYYY-MM-DD")
+    p_query.add_argument("--state", help="Two-letter state, e.g. WI")
+    p_query.add_argument("--brand", choices=["culvers", "kopps", "gilles", "hefners", "kraverz", "oscars"])
+    p_query.add_argument("--latest", action="store_true", help="Newest dates first")
+    p_query.add_argument("--limit", type=int, default=100, help="Maximum rows")
+    p_query.set_defaults(func=stage_query)
+
+    p_search = sub.add_parser("search", help="Search known stores offline, ranked like a typeahead")
+    p_search.add_argument("q", help="Text to find in a store's slug, name or city")
+    p_search.add_argument("--state", help="Two-letter state, e.g. WI")
+    p_search.add_argument("--brand", choices=["culvers", "kopps", "gilles", "hefners", "kraverz", "oscars"])
+    p_search.add_argument("--limit", type=int, default=20, help="Maximum rows")
+    p_search.set_defaults(func=stage_search)
+
+    p_changes = sub.add_parser("changes", help="Flavor changes (added/changed/removed dates) seen by fetches")
+    p_changes.add_argument("--since", help="Detected at or after this ISO date/time, e.g. 2026-10-17T06:00")
+    p_changes.add_argument("--after-id", type=int, help="Only changes after this id (the last_id of a previous call)")
+    p_changes.add_argument("--store", help="One store slug")
+    p_changes.add_argument("--kind", action="append", choices=["added", "changed", "removed"], help="Repeatable")
+    p_changes.add_argument("--limit", type=int, default=1000, help="Maximum rows")
+    p_changes.set_defaults(func=stage_changes)
+
+    p_stats = sub.add_parser("stats", help="Flavor frequency and rotation from the incremental aggregates")
+    p_stats.add_argument("--flavor", help="One flavor: totals, last/next date, spread by state, top stores")
+    p_stats.add_argument("--store", help="One store slug: its rotation with last/next date per flavor")
+    p_stats.add_argument("--limit", type=int, default=20, help="Rows per list")
+    p_stats.add_argument("--date", help="Treat this YYYY-MM-DD as today (default: UTC today)")
+    p_stats.add_argument("--rebuild", action="store_true", help="Recompute the aggregates from store_flavors first")
+    p_stats.set_defaults(func=stage_stats)
+
+    p_pack = sub.add_parser("pack", help="Pack all store calendars into one indexed file")
+    p_pack.set_defaults(func=stage_pack)
+
+    p_export = sub.add_parser("export", help="Write static forecast shards and a store-search index")
+    p_export.add_argument("--days", type=int, default=7, help="Days after today to include")
+    p_export.add_argument("--prefix-len", type=int, default=2, help="Slug characters that pick a store's shard")
+    p_export.add_argument("--date", help="Treat this YYYY-MM-DD as today (default: UTC today)")
+    p_export.add_argument("--full", action="store_true", help="Rebuild every shard, not just changed stores")
+    p_export.set_defaults(func=stage_export)
+
+    p_compact = sub.add_parser("compact", help="Prune old snapshots to the retention policy, archive them, vacuum")
+    p_compact.add_argument("--keep-all-days", type=int, default=14, help="Keep every snapshot this many days")
+    p_compact.add_argument(
+        "--daily-days", type=int, default=90, help="Then the last per store per day; older, the last per month"
+    )
+    p_compact.add_argument("--date", help="Treat this YYYY-MM-DD as today (default: UTC today)")
+    p_compact.add_argument("--dry-run", action="store_true", help="Only count what would be pruned")
+    p_compact.add_argument("--no-vacuum", action="store_true", help="Skip the incremental vacuum")
+    p_compact.set_defaults(func=stage_compact)
+
+    p_daemon = sub.add_parser("daemon", help="Run refresh, backfill and discovery on a schedule in one process")
+    p_daemon.add_argument("--refresh-minutes", type=float, default=30.0, help="Refresh interval (0 = off)")
+    p_daemon.add_argument("--refresh-limit", type=int, default=50, help="Stores per refresh")
+    p_daemon.add_argument(
+        "--backfill-minutes", type=float, default=15.0, help="Backfill/retry interval per segment (0 = off)"
+    )
+    p_daemon.add_argument("--backfill-stores", type=int, default=50, help="Stores per backfill run")
+    p_daemon.add_argument("--discover-hours", type=float, default=24.0, help="Adaptive discovery interval (0 = off)")
+    p_daemon.add_argument("--discover-tokens", type=int, default=5000, help="Tokens per discovery run")
+    p_daemon.add_argument("--concurrency", type=int, default=4, help="Flavor fetches to keep in flight")
+    p_daemon.add_argument("--host", default="127.0.0.1", help="Health/metrics listen address")
+    p_daemon.add_argument("--port", type=int, default=8790, help="Health/metrics port (0 = any free port, -1 = off)")
+    p_daemon.add_argument("--once", action="store_true", help="Run each task once, then exit")
+    add_rate_limit_args(p_daemon)
+    p_daemon.set_defaults(func=stage_daemon)
+
     p_status = sub.add_parser("status", help="Show discovery/backfill checkpoint status")
     p_status.set_defaults(func=stage_status)
 
     return p
 
 
+def run_profiled(args: argparse.Namespace) -> int:
+    """Run a stage under cProfile (main thread only) and tracemalloc and save both reports."""
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    stem = PROFILE_DIR / f"{args.cmd}-{datetime.now(UTC).strftime('%Y%m%dT%H%M%S')}"
+    profiler = cProfile.Profile()
+    tracemalloc.start(10)
+    try:
+        rc = profiler.runcall(args.func, args)
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        profiler.dump_stats(f"{stem}.pstats")
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(40)
+        report.write(f"\ntracemalloc: current={current} bytes peak={peak} bytes\n")
+        for stat in snapshot.statistics("lineno")[:25]:
+            report.write(f"{stat}\n")
+        Path(f"{stem}.txt").write_text(report.getvalue(), encoding="utf-8")
+        print(
+            "profile",
+            json.dumps(
+                {
+                    "pstats": display_path(Path(f"{stem}.pstats")),
+                    "report": display_path(Path(f"{stem}.txt")),
+                    "peak_bytes": peak,
+                }
+            ),
+            file=sys.stderr,
+        )
+    return rc
+
+
 def main() -> int:
     parser = build_parser()
     args = parser.parse_args()
-    return args.func(args)
+    METRICS.reset(args.cmd)
+    try:
+        return run_profiled(args) if args.profile else args.func(args)
+    finally:
+        if not args.no_metrics:
+            METRICS.write(METRICS_DIR)
 
 
 if __name__ == "__main__":
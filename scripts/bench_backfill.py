@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""End-to-end throughput benchmark for backfill_custard.py, fully offline.
+
+Starts scripts/fake_worker.py in-process, points the backfill tool at it with
+a scratch data directory, and times discover, backfill (cold, then warm with
+conditional requests) and status. Each stage reports stores/sec,
+requests/sec, p50/p99 request latency and time spent in DB writes.
+
+Save a run with --save and compare later runs against it with --baseline.
+
+Usage:
+    python scripts/bench_backfill.py --latency-ms 20 --jitter-ms 10 --concurrency 8
+    python scripts/bench_backfill.py --save bench.json
+    python scripts/bench_backfill.py --baseline bench.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any, Self
+
+import backfill_custard as bf
+from fake_worker import FakeWorker
+
+COMPARED = ("seconds", "stores_per_sec", "requests_per_sec", "p50_ms", "p99_ms", "db_write_ms")
+
+
+class DbTimer:
+    """Wrap a backfill_custard function and accumulate its wall time."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.original: Callable[..., Any] = getattr(bf, name)
+        self.seconds = 0.0
+        self.calls = 0
+
+    def __enter__(self) -> Self:
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            try:
+                return self.original(*args, **kwargs)
+            finally:
+                self.seconds += time.perf_counter() - started
+                self.calls += 1
+
+        setattr(bf, self.name, timed)
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        setattr(bf, self.name, self.original)
+
+
+def summary_line(output: str, label: str) -> dict[str, Any]:
+    for line in reversed(output.splitlines()):
+        if line.startswith(label + " {"):
+            return json.loads(line[len(label) + 1 :])
+    return {}
+
+
+def run_stage(argv: list[str], timed: str | None, stores_key: str | None = None) -> dict[str, Any]:
+    """Run one CLI stage in-process and measure it.
+
+    Stores are counted as calls to the timed function unless stores_key names
+    a field of the stage's summary line to read instead.
+    """
+    bf.reset_client()
+    args = bf.build_parser().parse_args(argv)
+    out = io.StringIO()
+    timer = DbTimer(timed) if timed else contextlib.nullcontext()
+    started = time.perf_counter()
+    with timer, contextlib.redirect_stdout(out):
+        rc = args.func(args)
+    seconds = time.perf_counter() - started
+
+    http = bf.get_client().timing_summary()
+    result: dict[str, Any] = {
+        "rc": rc,
+        "seconds": round(seconds, 3),
+        "requests": http["requests"],
+        "requests_per_sec": round(http["requests"] / seconds, 1) if seconds else None,
+        "p50_ms": http["p50_ms"],
+        "p99_ms": http["p99_ms"],
+    }
+    summary = summary_line(out.getvalue(), argv[0])
+    if isinstance(timer, DbTimer):
+        stores = summary.get(stores_key, 0) if stores_key else timer.calls
+        result["stores"] = stores
+        result["stores_per_sec"] = round(stores / seconds, 1) if seconds else None
+        result["db_write_ms"] = round(timer.seconds * 1000.0, 1)
+    result["summary"] = summary
+    return result
+
+
+def compare(report: dict[str, Any], baseline: dict[str, Any]) -> dict[str, Any]:
+    """Ratio of each metric to the baseline run (>1 means the number grew)."""
+    out = {}
+    for stage, metrics in report["stages"].items():
+        base = baseline.get("stages", {}).get(stage, {})
+        ratios = {
+            key: round(metrics[key] / base[key], 2)
+            for key in COMPARED
+            if metrics.get(key) and base.get(key)
+        }
+        if ratios:
+            out[stage] = ratios
+    return out
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Offline discover/backfill/status benchmark against a fake Worker")
+    p.add_argument("--stores", type=int, default=1100, help="Synthetic stores served by the fake Worker")
+    p.add_argument("--page-limit", type=int, default=50, help="Fake Worker search result cap")
+    p.add_argument("--latency-ms", type=float, default=0.0, help="Fake Worker latency per request")
+    p.add_argument("--jitter-ms", type=float, default=0.0, help="Fake Worker latency jitter")
+    p.add_argument("--error-rate", type=float, default=0.0, help="Fake Worker 503 rate")
+    p.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fake Worker random 429 rate")
+    p.add_argument("--max-rps", type=float, default=0.0, help="Fake Worker requests/sec cap (0 = off)")
+    p.add_argument("--retry-after", type=int, default=1, help="Fake Worker Retry-After seconds")
+    p.add_argument("--strategy", choices=["sweep", "adaptive"], default="adaptive", help="Discovery strategy")
+    p.add_argument("--concurrency", type=int, default=8, help="Backfill fetch concurrency")
+    p.add_argument("--rate", type=float, default=5.0, help="Client starting request rate")
+    p.add_argument("--max-rate", type=float, default=0.0, help="Client rate ceiling (0 = none)")
+    p.add_argument("--commit-every", type=int, default=25, help="Backfill stores per transaction")
+    p.add_argument("--save", type=Path, help="Write the report to this file")
+    p.add_argument("--baseline", type=Path, help="Compare against a report saved with --save")
+    args = p.parse_args()
+
+    worker = FakeWorker(
+        stores=args.stores,
+        page_limit=args.page_limit,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        max_rps=args.max_rps,
+        retry_after=args.retry_after,
+    )
+    rate = ["--rate", str(args.rate), "--max-rate", str(args.max_rate)]
+    backfill = ["--stores-per-run", str(args.stores), "--concurrency", str(args.concurrency),
+                "--commit-every", str(args.commit_every), *rate]
+    stages: dict[str, Any] = {}
+
+    with worker, tempfile.TemporaryDirectory() as tmp:
+        bf.API_BASE = worker.url
+        bf.use_data_dir(Path(tmp))
+        discover = ["discover", "--strategy", args.strategy, "--tokens-per-run", "100000", *rate]
+        stages["discover"] = run_stage(discover, "record_discovered", "stores_found")
+        for segment in ("wi", "rest"):
+            stages[f"backfill_{segment}_cold"] = run_stage(["backfill", "--segment", segment, *backfill], "record_fetch")
+        for segment in ("wi", "rest"):
+            stages[f"backfill_{segment}_warm"] = run_stage(
+                ["backfill", "--segment", segment, "--reset", *backfill], "record_fetch"
+            )
+        stages["status"] = run_stage(["status"], None)
+        bf.reset_client()
+
+    report = {
+        "config": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()
+                   if k not in ("save", "baseline")},
+        "worker_requests": worker.requests,
+        "stages": stages,
+    }
+    if args.baseline:
+        report["vs_baseline"] = compare(report, json.loads(args.baseline.read_text(encoding="utf-8")))
+    if args.save:
+        args.save.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Benchmark the backfill SQLite write path on synthetic data.
+
+Compares the original per-row, commit-per-store, rollback-journal writes on
+the original schema against the batched WAL path used by backfill_custard.py
+on the current one (FTS, stats triggers and all). No network access;
+everything happens in a temporary directory.
+
+Usage:
+    python scripts/bench_db_writes.py --stores 1000 --flavors 30 --commit-every 25
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+import backfill_custard as bf
+
+
+def synthetic_flavors(n: int) -> list[dict[str, str]]:
+    return [
+        {
+            "date": f"2026-{1 + i // 28:02d}-{1 + i % 28:02d}",
+            "title": f"Flavor {i % 29}",
+            "description": "Synthetic benchmark flavor description text.",
+        }
+        for i in range(n)
+    ]
+
+
+# The original table and single-row write, kept here so the baseline does not
+# pick up later changes to backfill_custard's schema (FTS, stats triggers, WAL)
+# or to upsert_flavor (such as change logging).
+LEGACY_SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS store_flavors (
+        store_slug TEXT,
+        flavor_date TEXT,
+        title TEXT,
+        description TEXT,
+        first_seen_at TEXT,
+        last_seen_at TEXT,
+        PRIMARY KEY (store_slug, flavor_date)
+    )
+"""
+
+LEGACY_UPSERT_SQL = """
+    INSERT INTO store_flavors(store_slug, flavor_date, title, description, first_seen_at, last_seen_at)
+    VALUES(?, ?, ?, ?, ?, ?)
+    ON CONFLICT(store_slug, flavor_date) DO UPDATE SET
+        title=excluded.title,
+        description=excluded.description,
+        last_seen_at=excluded.last_seen_at
+"""
+
+
+def run_legacy(db_path: Path, stores: int, flavors: list[dict[str, str]]) -> float:
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.execute("PRAGMA synchronous=FULL")
+    conn.execute(LEGACY_SCHEMA_SQL)
+    conn.commit()
+    started = time.perf_counter()
+    for i in range(stores):
+        seen_at = bf.utc_now()
+        for flavor in flavors:
+            conn.execute(
+                LEGACY_UPSERT_SQL,
+                (f"store-{i:04d}", flavor["date"], flavor["title"], flavor["description"], seen_at, seen_at),
+            )
+        conn.commit()
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return elapsed
+
+
+def run_batched(db_path: Path, stores: int, flavors: list[dict[str, str]], commit_every: int) -> float:
+    bf.DB_PATH = db_path
+    conn = bf.init_db()
+    started = time.perf_counter()
+    for i in range(stores):
+        bf.upsert_flavors(conn, f"store-{i:04d}", flavors, bf.utc_now())
+        if (i + 1) % commit_every == 0:
+            conn.commit()
+    conn.commit()
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return elapsed
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Benchmark backfill SQLite write throughput")
+    p.add_argument("--stores", type=int, default=1000, help="Synthetic stores to write")
+    p.add_argument("--flavors", type=int, default=30, help="Flavor rows per store")
+    p.add_argument("--commit-every", type=int, default=25, help="Stores per transaction (batched path)")
+    args = p.parse_args()
+
+    flavors = synthetic_flavors(args.flavors)
+    rows = args.stores * args.flavors
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bf.use_data_dir(Path(tmp))
+        legacy = run_legacy(Path(tmp) / "legacy.sqlite", args.stores, flavors)
+        batched = run_batched(Path(tmp) / "batched.sqlite", args.stores, flavors, args.commit_every)
+
+    print(
+        json.dumps(
+            {
+                "rows": rows,
+                "legacy": {"schema": "baseline", "seconds": round(legacy, 3), "rows_per_sec": round(rows / legacy)},
+                "batched": {"schema": "current", "seconds": round(batched, 3), "rows_per_sec": round(rows / batched)},
+                "speedup": round(legacy / batched, 1),
+            },
+            indent=2,
+        )
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""Local stand-in for the custard-calendar Worker API.
+
+Serves /api/v1/stores?q= and /api/v1/flavors?slug= over synthetic but
+realistically shaped data (~1,100 stores across the six brands), so the
+backfill tool can be exercised and benchmarked without the live Worker.
+
+Latency, jitter, 5xx error rate, random 429 rate and a requests/sec cap
+(answered with 429 + Retry-After) are configurable. Responses
+carry ETags, honour If-None-Match and are gzip-compressed on request.
+
+Usage:
+    python scripts/fake_worker.py --port 8787 --latency-ms 40 --jitter-ms 20
+    CUSTARD_API_BASE=http://127.0.0.1:8787 python scripts/backfill_custard.py discover
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import http.server
+import json
+import random
+import socket
+import threading
+import time
+import urllib.parse
+from datetime import date, timedelta
+from typing import Any, Self
+
+FLAVORS = [
+    "Dark Chocolate PB Crunch", "Chocolate Caramel Twist", "Mint Explosion", "Turtle Dove",
+    "Double Strawberry", "Turtle Cheesecake", "Caramel Turtle", "Andes Mint Avalanche",
+    "OREO Cookie Cheesecake", "Devil's Food Cake", "Caramel Cashew", "Butter Pecan",
+    "Caramel Chocolate Pecan", "Dark Chocolate Decadence", "Caramel Fudge Cookie Dough",
+    "Mint Cookie", "Caramel Pecan", "Really Reese's", "Raspberry Cheesecake",
+    "Chocolate Covered Strawberry", "Caramel Peanut Buttercup", "Turtle", "Georgia Peach",
+    "Snickers Swirl", "Chocolate Volcano", "OREO Cookie Overload", "Salted Double Caramel Pecan",
+    "Crazy for Cookie Dough", "Chocolate Heath Crunch", "Blackberry Cobbler", "Lemon Berry Layer Cake",
+    "Cappuccino Almond Fudge", "Pumpkin Pecan", "Brownie Batter Overload", "Midnight Toffee",
+]
+
+STATES = ["WI"] * 18 + ["IL"] * 8 + ["MN"] * 6 + ["IA"] * 5 + ["MI"] * 5 + ["IN"] * 4 + [
+    "OH", "MO", "TN", "GA", "FL", "TX", "AZ", "CO", "NE", "KS", "SD", "ND", "KY", "SC", "NC", "UT",
+]
+
+SYLLABLES = ["mad", "wau", "osh", "ken", "app", "ra", "ci", "ne", "kee", "ton", "ville", "field",
+             "burg", "dale", "port", "ley", "mon", "ro", "sha", "bel", "ver", "ona", "lake", "ridge"]
+
+# Real slugs the app and contract tests rely on, served alongside the generated ones.
+FIXED_STORES = [
+    {"slug": "mt-horeb", "name": "Mt. Horeb", "city": "Mt. Horeb", "state": "WI"},
+    {"slug": "kopps-greenfield", "name": "Kopp's Greenfield", "city": "Greenfield", "state": "WI"},
+    {"slug": "kopps-brookfield", "name": "Kopp's Brookfield", "city": "Brookfield", "state": "WI"},
+    {"slug": "kopps-glendale", "name": "Kopp's Glendale", "city": "Glendale", "state": "WI"},
+    {"slug": "gilles", "name": "Gille's", "city": "Milwaukee", "state": "WI"},
+    {"slug": "hefners", "name": "Hefner's", "city": "Fond du Lac", "state": "WI"},
+    {"slug": "kraverz", "name": "Kraverz", "city": "Appleton", "state": "WI"},
+    {"slug": "oscars", "name": "Oscar's", "city": "Muskego", "state": "WI"},
+    {"slug": "oscars-franklin", "name": "Oscar's Franklin", "city": "Franklin", "state": "WI"},
+    {"slug": "oscars-west-allis", "name": "Oscar's West Allis", "city": "West Allis", "state": "WI"},
+]
+
+
+def synthetic_stores(count: int = 1100, seed: int = 7) -> list[dict[str, str]]:
+    rng = random.Random(seed)
+    stores = {s["slug"]: dict(s) for s in FIXED_STORES}
+    while len(stores) < count:
+        city = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).title()
+        state = rng.choice(STATES)
+        slug = city.lower()
+        if slug in stores:
+            slug = f"{slug}-{rng.choice(['n', 's', 'e', 'w', 'hwy-' + str(rng.randint(10, 99))])}"
+        if slug in stores:
+            continue
+        stores[slug] = {"slug": slug, "name": city, "city": city, "state": state}
+    return sorted(stores.values(), key=lambda s: s["slug"])
+
+
+def synthetic_flavors(slug: str, today: date, days: int = 30) -> list[dict[str, str]]:
+    out = []
+    for offset in range(-2, days):
+        day = today + timedelta(days=offset)
+        digest = hashlib.sha1(f"{slug}:{day.isoformat()}".encode()).digest()
+        title = FLAVORS[digest[0] % len(FLAVORS)]
+        out.append({"date": day.isoformat(), "title": title, "description": f"{title} frozen custard."})
+    return out
+
+
+class FakeWorker:
+    """Threaded HTTP/1.1 server implementing the two Worker endpoints."""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        stores: int = 1100,
+        page_limit: int = 50,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: int = 1,
+        max_rps: float = 0.0,
+        seed: int = 7,
+    ) -> None:
+        self.stores = synthetic_stores(stores, seed)
+        self.by_slug = {s["slug"]: s for s in self.stores}
+        self.page_limit = page_limit
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.max_rps = max_rps
+        self._window: list[float] = []
+        self.today = date.today()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.server = http.server.ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> Self:
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> Self:
+        return self.start()
+
+    def __exit__(self, *exc: object) -> None:
+        self.stop()
+
+    def search(self, q: str) -> list[dict[str, str]]:
+        q = q.lower()
+        hits = [s for s in self.stores if q in s["slug"] or q in s["name"].lower() or q in s["city"].lower()]
+        return hits[: self.page_limit] if self.page_limit else hits
+
+    def _roll(self) -> float:
+        with self._lock:
+            self.requests += 1
+            return self._rng.random()
+
+    def _over_capacity(self) -> bool:
+        """Sliding one-second window, like a per-client rate limit at the edge."""
+        if not self.max_rps:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            self._window = [t for t in self._window if now - t < 1.0]
+            if len(self._window) >= self.max_rps:
+                return True
+            self._window.append(now)
+            return False
+
+    def _handler(self) -> type[http.server.BaseHTTPRequestHandler]:
+        worker = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self) -> None:
+                super().setup()
+                # Headers and body go out as separate writes; without this,
+                # Nagle plus delayed ACKs adds ~40 ms to every response.
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_GET(self) -> None:
+                roll = worker._roll()
+                delay = worker.latency_ms + worker._rng.uniform(-worker.jitter_ms, worker.jitter_ms)
+                if delay > 0:
+                    time.sleep(delay / 1000.0)
+                if roll < worker.rate_limit_rate or worker._over_capacity():
+                    self._send(429, {"error": "rate limited"}, {"Retry-After": str(worker.retry_after)})
+                    return
+                if roll < worker.rate_limit_rate + worker.error_rate:
+                    self._send(503, {"error": "unavailable"})
+                    return
+
+                url = urllib.parse.urlsplit(self.path)
+                params = urllib.parse.parse_qs(url.query)
+                if url.path == "/api/v1/stores":
+                    self._send(200, {"stores": worker.search(params.get("q", [""])[0])})
+                elif url.path == "/api/v1/flavors":
+                    store = worker.by_slug.get(params.get("slug", [""])[0])
+                    if store is None:
+                        self._send(404, {"error": "unknown store"})
+                        return
+                    body = {
+                        "name": store["name"],
+                        "address": f"100 Main St, {store['city']}, {store['state']}",
+                        "flavors": synthetic_flavors(store["slug"], worker.today),
+                    }
+                    self._send(200, body)
+                else:
+                    self._send(404, {"error": "not found"})
+
+            def _send(self, status: int, payload: dict[str, Any], headers: dict[str, str] | None = None) -> None:
+                body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                if status == 200 and self.headers.get("If-None-Match") == etag:
+                    status, body = 304, b""
+                gzipped = bool(body) and "gzip" in self.headers.get("Accept-Encoding", "")
+                if gzipped:
+                    body = gzip.compress(body, 5)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("API-Version", "1")
+                if status in (200, 304):
+                    self.send_header("ETag", etag)
+                if gzipped:
+                    self.send_header("Content-Encoding", "gzip")
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        return Handler
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Local fake of the custard-calendar Worker API")
+    p.add_argument("--host", default="127.0.0.1", help="Bind address")
+    p.add_argument("--port", type=int, default=8787, help="Bind port")
+    p.add_argument("--stores", type=int, default=1100, help="Synthetic stores to serve")
+    p.add_argument("--page-limit", type=int, default=50, help="Max stores per search (0 = unlimited)")
+    p.add_argument("--latency-ms", type=float, default=0.0, help="Added latency per request")
+    p.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- jitter on the latency")
+    p.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered 503")
+    p.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered 429")
+    p.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s")
+    p.add_argument("--max-rps", type=float, default=0.0, help="Answer 429 above this many requests/sec (0 = off)")
+    args = p.parse_args()
+
+    worker = FakeWorker(
+        host=args.host,
+        port=args.port,
+        stores=args.stores,
+        page_limit=args.page_limit,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        max_rps=args.max_rps,
+    )
+    print(f"fake worker serving {len(worker.stores)} stores at {worker.url}", flush=True)
+    try:
+        worker.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""Export the flavor history as a memory-mapped store x date matrix.
+
+ids.npy holds one uint16 flavor id per (store, day) cell, 0 meaning no
+data. Sidecar arrays name the dimensions: slugs/states/brands per row, and
+norms/titles per flavor id. meta.json records the first day, the used
+shape (the arrays are allocated in chunks, so new stores and dates usually
+fit in place) and the flavor_changes id the matrix is current to.
+
+A run after the first applies only the flavor_changes rows logged since,
+writing into the mapped matrix in place; meta.json is written last, so an
+interrupted update is simply repeated. Loading is np.load(mmap_mode="r"),
+and queries are array operations over the mapped cells.
+
+Usage:
+    python scripts/flavor_matrix.py                     # build or update
+    python scripts/flavor_matrix.py --full              # rebuild from store_flavors
+    python scripts/flavor_matrix.py --serving mint --from 2026-10-19 --to 2026-10-25 --state WI
+    python scripts/flavor_matrix.py --frequency --state WI --limit 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+from datetime import date
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from backfill_custard import (
+    DATA_DIR,
+    DB_PATH,
+    brand_from_slug,
+    normalize_title,
+    utc_now,
+)
+
+MATRIX_DIR = DATA_DIR / "matrix"
+FORMAT_VERSION = 1
+BRANDS = ["culvers", "kopps", "gilles", "hefners", "kraverz", "oscars"]
+
+# Allocation steps for the matrix: rows (stores) and columns (days).
+ROW_CHUNK = 256
+DAY_CHUNK = 64
+
+
+def _capacity(n: int, chunk: int) -> int:
+    return max(chunk, -(-n // chunk) * chunk)
+
+
+def _save(path: Path, array: np.ndarray) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+def _write_meta(out_dir: Path, meta: dict[str, Any]) -> None:
+    tmp = out_dir / "meta.json.tmp"
+    tmp.write_text(json.dumps(meta, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    os.replace(tmp, out_dir / "meta.json")
+
+
+def _read_meta(out_dir: Path) -> dict[str, Any] | None:
+    try:
+        meta = json.loads((out_dir / "meta.json").read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return meta if meta.get("version") == FORMAT_VERSION else None
+
+
+def _write_ids(out_dir: Path, rows: np.ndarray, cols: np.ndarray, ids: np.ndarray, shape: tuple[int, int],
+               old: np.ndarray | None = None) -> None:
+    """Allocate a fresh ids.npy with room for shape, copy old in, set the cells."""
+    tmp = out_dir / "ids.npy.tmp"
+    matrix = np.lib.format.open_memmap(
+        tmp, mode="w+", dtype=np.uint16, shape=(_capacity(shape[0], ROW_CHUNK), _capacity(shape[1], DAY_CHUNK))
+    )
+    if old is not None:
+        matrix[: old.shape[0], : old.shape[1]] = old
+    matrix[rows, cols] = ids
+    matrix.flush()
+    del matrix
+    os.replace(tmp, out_dir / "ids.npy")
+
+
+def _store_sidecars(conn: sqlite3.Connection, slugs: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    state_by_slug = dict(conn.execute("SELECT slug, state FROM stores"))
+    states = np.array([state_by_slug.get(s) or "" for s in slugs], dtype="U2")
+    brands = np.array([BRANDS.index(brand_from_slug(s)) for s in slugs], dtype=np.uint8)
+    return states, brands
+
+
+def _write_sidecars(conn: sqlite3.Connection, out_dir: Path, slugs: list[str], norms: list[str],
+                    titles: list[str]) -> None:
+    states, brands = _store_sidecars(conn, slugs)
+    _save(out_dir / "slugs.npy", np.array(slugs, dtype=str))
+    _save(out_dir / "states.npy", states)
+    _save(out_dir / "brands.npy", brands)
+    _save(out_dir / "norms.npy", np.array(norms, dtype=str))
+    _save(out_dir / "titles.npy", np.array(titles, dtype=str))
+
+
+def _changes_cursor(conn: sqlite3.Connection) -> int | None:
+    """Newest flavor_changes id, or None on a database without the change log."""
+    try:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM flavor_changes").fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+
+
+def build_matrix(conn: sqlite3.Connection, out_dir: Path) -> dict[str, Any]:
+    """Rebuild every array from store_flavors."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    # One read transaction, so the cursor matches the rows read.
+    conn.execute("BEGIN")
+    try:
+        cursor = _changes_cursor(conn)
+        rows = conn.execute(
+            """
+            SELECT store_slug, flavor_date, title, title_norm FROM store_flavors
+            WHERE flavor_date IS NOT NULL AND flavor_date != '' AND title_norm != ''
+            ORDER BY flavor_date
+            """
+        ).fetchall()
+        slugs = sorted({r[0] for r in rows} | {r[0] for r in conn.execute("SELECT slug FROM stores WHERE last_seen_at IS NOT NULL")})
+    finally:
+        conn.rollback()
+
+    # Id 0 is "no data"; flavors are numbered in title_norm order, each shown
+    # by its most recent spelling.
+    title_by_norm: dict[str, str] = {}
+    for _, _, title, norm in rows:
+        title_by_norm[norm] = title
+    norms = ["", *sorted(title_by_norm)]
+    titles = ["", *(title_by_norm[n] for n in norms[1:])]
+    norm_index = {n: i for i, n in enumerate(norms)}
+    slug_index = {s: i for i, s in enumerate(slugs)}
+
+    if rows:
+        flavor_days = np.array([r[1] for r in rows], dtype="datetime64[D]")
+        start = flavor_days.min()
+        cols = (flavor_days - start).astype(np.int64)
+        days = int(cols.max()) + 1
+    else:
+        start, cols, days = np.datetime64(utc_now()[:10], "D"), np.zeros(0, dtype=np.int64), 0
+    row_idx = np.fromiter((slug_index[r[0]] for r in rows), dtype=np.int64, count=len(rows))
+    flavor_ids = np.fromiter((norm_index[r[3]] for r in rows), dtype=np.uint16, count=len(rows))
+
+    _write_ids(out_dir, row_idx, cols, flavor_ids, (len(slugs), days))
+    _write_sidecars(conn, out_dir, slugs, norms, titles)
+    meta = {
+        "version": FORMAT_VERSION,
+        "start": str(start),
+        "days": days,
+        "stores": len(slugs),
+        "flavors": len(norms) - 1,
+        "brands": BRANDS,
+        "changes_cursor": cursor,
+        "updated_at": utc_now(),
+    }
+    _write_meta(out_dir, meta)
+    return {"mode": "full", "cells": len(rows), **{k: meta[k] for k in ("start", "days", "stores", "flavors")}}
+
+
+def update_matrix(conn: sqlite3.Connection, out_dir: Path, full: bool = False) -> dict[str, Any]:
+    """Apply the flavor_changes logged since the last run, or rebuild when needed.
+
+    A full rebuild happens on the first run, with --full, on a database
+    without the change log, and when a change predates the matrix's first
+    day (history loaded after the matrix was built).
+    """
+    meta = _read_meta(out_dir)
+    if full or meta is None or meta.get("changes_cursor") is None or _changes_cursor(conn) is None:
+        return build_matrix(conn, out_dir)
+
+    changes = conn.execute(
+        "SELECT id, store_slug, flavor_date, kind, new_title FROM flavor_changes WHERE id > ? ORDER BY id",
+        (meta["changes_cursor"],),
+    ).fetchall()
+    if not changes:
+        return {"mode": "unchanged", "cells": 0, **{k: meta[k] for k in ("start", "days", "stores", "flavors")}}
+
+    slugs = np.load(out_dir / "slugs.npy").tolist()
+    norms = np.load(out_dir / "norms.npy").tolist()
+    titles = np.load(out_dir / "titles.npy").tolist()
+    slug_index = {s: i for i, s in enumerate(slugs)}
+    norm_index = {n: i for i, n in enumerate(norms)}
+    start = date.fromisoformat(meta["start"])
+
+    cells: dict[tuple[int, int], int] = {}
+    for _, slug, flavor_date, kind, new_title in changes:
+        col = (date.fromisoformat(flavor_date) - start).days
+        if col < 0:
+            return build_matrix(conn, out_dir)
+        row = slug_index.get(slug)
+        if row is None:
+            row = slug_index[slug] = len(slugs)
+            slugs.append(slug)
+        norm = normalize_title(new_title) if kind != "removed" else ""
+        flavor_id = norm_index.get(norm)
+        if flavor_id is None:
+            flavor_id = norm_index[norm] = len(norms)
+            norms.append(norm)
+            titles.append(new_title)
+        cells[(row, col)] = flavor_id
+    if len(norms) > np.iinfo(np.uint16).max:
+        raise ValueError(f"{len(norms)} flavors do not fit uint16 ids")
+
+    days = max(meta["days"], max(col for _, col in cells) + 1)
+    rows_idx = np.fromiter((r for r, _ in cells), dtype=np.int64, count=len(cells))
+    cols_idx = np.fromiter((c for _, c in cells), dtype=np.int64, count=len(cells))
+    flavor_ids = np.fromiter(cells.values(), dtype=np.uint16, count=len(cells))
+
+    matrix = np.load(out_dir / "ids.npy", mmap_mode="r+")
+    if len(slugs) > matrix.shape[0] or days > matrix.shape[1]:
+        _write_ids(out_dir, rows_idx, cols_idx, flavor_ids, (len(slugs), days), old=matrix)
+    else:
+        matrix[rows_idx, cols_idx] = flavor_ids
+        matrix.flush()
+    del matrix
+
+    # Store states can change between runs, so the store sidecars are
+    # refreshed every time; they are small.
+    _write_sidecars(conn, out_dir, slugs, norms, titles)
+    meta.update(
+        days=days,
+        stores=len(slugs),
+        flavors=len(norms) - 1,
+        changes_cursor=changes[-1][0],
+        updated_at=utc_now(),
+    )
+    _write_meta(out_dir, meta)
+    return {"mode": "incremental", "cells": len(cells), **{k: meta[k] for k in ("start", "days", "stores", "flavors")}}
+
+
+class FlavorMatrix:
+    """The exported matrix, memory-mapped read-only, with vectorized queries."""
+
+    def __init__(self, directory: Path = MATRIX_DIR) -> None:
+        meta = _read_meta(directory)
+        if meta is None:
+            raise FileNotFoundError(f"no flavor matrix in {directory}")
+        self.meta = meta
+        self.start = np.datetime64(meta["start"], "D")
+        stores, days = meta["stores"], meta["days"]
+
+        def load(name: str) -> np.ndarray:
+            return np.load(directory / f"{name}.npy", mmap_mode="r")
+
+        self.ids = load("ids")[:stores, :days]
+        self.slugs = load("slugs")
+        self.states = load("states")
+        self.brands = load("brands")
+        self.norms = load("norms")
+        self.titles = load("titles")
+
+    def columns(self, first: str | None = None, last: str | None = None) -> slice:
+        """Column slice for an inclusive YYYY-MM-DD range (open ends allowed)."""
+        lo = 0 if first is None else max(0, int((np.datetime64(first, "D") - self.start).astype(int)))
+        hi = self.ids.shape[1] if last is None else int((np.datetime64(last, "D") - self.start).astype(int)) + 1
+        return slice(lo, max(lo, min(hi, self.ids.shape[1])))
+
+    def store_mask(self, state: str | None = None, brand: str | None = None) -> np.ndarray:
+        mask = np.ones(self.ids.shape[0], dtype=bool)
+        if state:
+            mask &= self.states == state.upper()
+        if brand:
+            mask &= self.brands == self.meta["brands"].index(brand)
+        return mask
+
+    def match(self, text: str) -> np.ndarray:
+        """Flavor ids whose normalized title contains text."""
+        found = np.flatnonzero(np.char.find(self.norms, normalize_title(text)) >= 0)
+        return found[found > 0]
+
+    def serving(
+        self,
+        text: str,
+        first: str | None = None,
+        last: str | None = None,
+        state: str | None = None,
+        brand: str | None = None,
+    ) -> list[dict[str, str]]:
+        """Every (store, date) in range serving a flavor matching text."""
+        cols = self.columns(first, last)
+        rows = np.flatnonzero(self.store_mask(state, brand))
+        window = self.ids[rows, cols]
+        hit_rows, hit_cols = np.nonzero(np.isin(window, self.match(text)))
+        return [
+            {
+                "slug": str(self.slugs[rows[r]]),
+                "state": str(self.states[rows[r]]),
+                "date": str(self.start + cols.start + c),
+                "title": str(self.titles[window[r, c]]),
+            }
+            for r, c in zip(hit_rows.tolist(), hit_cols.tolist())
+        ]
+
+    def frequency(
+        self,
+        first: str | None = None,
+        last: str | None = None,
+        state: str | None = None,
+        brand: str | None = None,
+    ) -> list[tuple[str, int]]:
+        """Store-days per flavor in range, most frequent first."""
+        window = self.ids[self.store_mask(state, brand), self.columns(first, last)]
+        counts = np.bincount(window.ravel(), minlength=len(self.titles))
+        counts[0] = 0
+        order = np.argsort(-counts, kind="stable")
+        return [(str(self.titles[i]), int(counts[i])) for i in order if counts[i]]
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Build or query the memory-mapped store x date flavor matrix")
+    p.add_argument("--db", type=Path, default=DB_PATH, help="Backfill database to read")
+    p.add_argument("--out", type=Path, default=MATRIX_DIR, help="Matrix directory")
+    p.add_argument("--full", action="store_true", help="Rebuild from store_flavors instead of applying changes")
+    p.add_argument("--serving", metavar="TEXT", help="Query: stores serving a flavor matching TEXT")
+    p.add_argument("--frequency", action="store_true", help="Query: store-days per flavor")
+    p.add_argument("--from", dest="date_from", help="First date, YYYY-MM-DD")
+    p.add_argument("--to", dest="date_to", help="Last date, YYYY-MM-DD")
+    p.add_argument("--state", help="Two-letter state, e.g. WI")
+    p.add_argument("--brand", choices=BRANDS)
+    p.add_argument("--limit", type=int, default=20, help="Rows for --frequency")
+    args = p.parse_args()
+
+    if args.serving or args.frequency:
+        started = time.perf_counter()
+        matrix = FlavorMatrix(args.out)
+        if args.serving:
+            result: Any = matrix.serving(args.serving, args.date_from, args.date_to, args.state, args.brand)
+        else:
+            result = matrix.frequency(args.date_from, args.date_to, args.state, args.brand)[: args.limit]
+        print(json.dumps(result, indent=2))
+        print("matrix", json.dumps({"rows": len(result), "elapsed_ms": round((time.perf_counter() - started) * 1000.0, 3)}))
+        return 0
+
+    started = time.perf_counter()
+    conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    try:
+        summary = update_matrix(conn, args.out, full=args.full)
+    finally:
+        conn.close()
+    summary["bytes"] = sum(path.stat().st_size for path in args.out.glob("*.npy"))
+    summary["elapsed_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+    print("matrix", json.dumps(summary))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""Precompile flavor display names and cone profiles for culvers_fotd.star.
+
+Reads every distinct flavor title from the backfill database, runs Python
+ports of the app's format_flavor_for_display and get_flavor_profile over
+them, and writes the results into the generated FLAVOR_DISPLAY table in the
+.star file. The app looks titles up there first and only falls back to the
+string-munging path for titles the table has never seen.
+
+FLAVOR_PROFILES, abbr_map and base_nouns are read from the .star source
+itself, so the port cannot drift from the app's data; only the control flow
+is mirrored here.
+
+Titles whose profile comes from the keyword fallback, or from the generic
+vanilla default, are reported so profile coverage can be tracked.
+
+Usage:
+    python scripts/precompile_flavors.py                # rewrite the table
+    python scripts/precompile_flavors.py --check        # exit 1 if stale
+    python scripts/precompile_flavors.py --titles extra_titles.txt
+"""
+
+from __future__ import annotations
+
+import argparse
+import ast
+import json
+import re
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Any
+
+ROOT = Path(__file__).resolve().parents[1]
+STAR_PATH = ROOT / "apps" / "culversfotd" / "culvers_fotd.star"
+DB_PATH = ROOT / "data" / "backfill" / "flavors.sqlite"
+
+BEGIN_MARKER = "# --- BEGIN GENERATED FLAVOR_DISPLAY (scripts/precompile_flavors.py; do not edit) ---"
+END_MARKER = "# --- END GENERATED FLAVOR_DISPLAY ---"
+
+
+def _literal(source: str, pattern: str) -> Any:
+    """literal_eval the bracketed literal that follows pattern in source."""
+    match = re.search(pattern, source, re.MULTILINE)
+    if match is None:
+        raise ValueError(f"{pattern!r} not found in {STAR_PATH.name}")
+    start = match.end() - 1
+    opener = source[start]
+    closer = {"{": "}", "[": "]"}[opener]
+    depth = 0
+    for end in range(start, len(source)):
+        if source[end] == opener:
+            depth += 1
+        elif source[end] == closer:
+            depth -= 1
+            if depth == 0:
+                return ast.literal_eval(source[start : end + 1])
+    raise ValueError(f"unterminated literal after {pattern!r}")
+
+
+class StarData:
+    """The app's data literals: profiles, palettes and display-name tables."""
+
+    def __init__(self, source: str) -> None:
+        self.profiles: dict[str, dict[str, Any]] = _literal(source, r"^FLAVOR_PROFILES = \{")
+        self.base_colors: dict[str, str] = _literal(source, r"^BASE_COLORS = \{")
+        self.ribbon_colors: dict[str, str] = _literal(source, r"^RIBBON_COLORS = \{")
+        self.topping_colors: dict[str, str] = _literal(source, r"^TOPPING_COLORS = \{")
+        self.base_nouns: list[str] = _literal(source, r"^\s+base_nouns = \[")
+        self.abbr_map: dict[str, str] = _literal(source, r"^\s+abbr_map = \{")
+        self.demo_titles: list[str] = _literal(source, r"^DEMO_FLAVOR_NAMES = \[")
+
+
+def flavor_profile(data: StarData, flavor_name: str) -> tuple[dict[str, Any], str, str | None]:
+    """Port of get_flavor_profile; returns (profile, match kind, profile key).
+
+    Match kind is "exact", "keyword" or "generic"; the key is set only for
+    exact matches.
+    """
+    key = flavor_name.lower()
+    if key in data.profiles:
+        return data.profiles[key], "exact", key
+
+    normalized = key.replace("\u2019", "'").replace("\u2018", "'")
+    if normalized in data.profiles:
+        return data.profiles[normalized], "exact", normalized
+
+    def plain(base: str, ribbon: str | None = None, toppings: list[str] | None = None) -> dict[str, Any]:
+        return {"base": base, "ribbon": ribbon, "toppings": toppings or [], "density": "standard"}
+
+    if "mint" in key:
+        return plain("mint"), "keyword", None
+    elif "dark choc" in key:
+        return plain("dark_chocolate"), "keyword", None
+    elif "chocolate" in key or "cocoa" in key:
+        return plain("chocolate"), "keyword", None
+    elif "strawberry" in key:
+        return plain("strawberry"), "keyword", None
+    elif "cheesecake" in key:
+        return plain("cheesecake"), "keyword", None
+    elif "caramel" in key:
+        return plain("caramel", "caramel"), "keyword", None
+    elif "peach" in key:
+        return plain("peach"), "keyword", None
+    elif "butter pecan" in key:
+        return plain("butter_pecan", None, ["pecan"]), "keyword", None
+    elif "vanilla" in key:
+        return plain("vanilla"), "keyword", None
+    return plain("vanilla"), "generic", None
+
+
+def display_lines(data: StarData, name: str, max_chars: int = 5) -> list[str]:
+    """Port of format_flavor_for_display."""
+    if "Dark Chocolate PB Crunch" in name or "Dk Choc PB Crunch" in name:
+        return ["DK PB", "Crunc"]
+    elif "OREO Cookie Cheesecake" in name or "Oreo" in name.lower():
+        # As in the app, the name.lower() test can never match "Oreo".
+        if "Cheesecake" in name:
+            return ["Oreo", "Chees"]
+        else:
+            return ["Oreo", "Cook"]
+    elif "Chocolate Covered Strawberry" in name:
+        return ["Choc", "Straw"]
+    elif "Devil's Food Cake" in name or "Devils Food Cake" in name:
+        return ["Devil", "Cake"]
+    elif "Snickers" in name:
+        return ["Snkrs", "Swirl"]
+    elif "Georgia Peach" in name:
+        return ["GA", "Peach"]
+    elif "Really Reese" in name or "Reese" in name:
+        return ["Reese"]
+    elif "Turtle Cheesecake" in name:
+        return ["Turtl", "Chees"]
+    elif "Turtle Dove" in name:
+        return ["Turtl", "Dove"]
+    elif "Caramel Turtle" in name:
+        return ["Crml", "Turtl"]
+    elif "Butter Pecan" in name:
+        return ["Buttr", "Pecan"]
+    elif "Caramel Cashew" in name:
+        return ["Crml", "Cashw"]
+    elif "Andes Mint Avalanche" in name:
+        return ["Mint", "Avlnc"]
+    elif "Chocolate Volcano" in name or "Choc Volcano" in name:
+        return ["Choc", "Volc"]
+    elif "Chocolate Decadence" in name or "Choc Decadence" in name:
+        return ["Choc", "Decad"]
+    elif "Chocolate Heath Crunch" in name or "Choc Heath Crunch" in name:
+        return ["Heath", "Crunc"]
+    elif "Caramel Fudge Cookie Dough" in name or "Crml Fudge Cook Dough" in name:
+        return ["Fudge", "Dough"]
+    elif "Salted Double Caramel Pecan" in name or "Salt Dbl Crml Pecan" in name:
+        return ["Salt", "Pecan"]
+    elif name == "Turtle":
+        return ["Turtl"]
+
+    abbreviated = name
+    for full, short in data.abbr_map.items():
+        abbreviated = abbreviated.replace(full, short)
+
+    words = abbreviated.split()
+    if len(words) == 0:
+        return ["???"]
+
+    if words[-1] in data.base_nouns:
+        base_noun = words[-1]
+        desc_words = words[:-1]
+    elif len(words) >= 2:
+        two_word = " ".join(words[-2:])
+        if two_word in ["Cook Dough", "Layer Cake", "Batt Bliss"]:
+            base_noun = two_word
+            desc_words = words[:-2]
+        else:
+            base_noun = words[-1]
+            desc_words = words[:-1]
+    else:
+        return [words[0][:max_chars]]
+
+    line1 = " ".join(desc_words) if desc_words else ""
+    line2 = base_noun
+
+    if len(line1) > max_chars:
+        if len(desc_words) > 1:
+            line1 = " ".join(desc_words[1:])
+        if len(line1) > max_chars:
+            line1 = line1[:max_chars]
+
+    if len(line2) > max_chars:
+        line2 = line2[:max_chars]
+
+    if line1 and line2:
+        return [line1, line2]
+    elif line2:
+        return [line2]
+    else:
+        return [name[:max_chars]]
+
+
+def db_titles(db_path: Path) -> list[str]:
+    if not db_path.exists():
+        return []
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        return [r[0] for r in conn.execute("SELECT DISTINCT title FROM store_flavors WHERE title != ''")]
+    finally:
+        conn.close()
+
+
+def compile_titles(data: StarData, titles: list[str]) -> tuple[dict[str, dict[str, Any]], dict[str, list[str]]]:
+    """Build the table and the coverage report (titles per match kind)."""
+    table: dict[str, dict[str, Any]] = {}
+    coverage: dict[str, list[str]] = {"exact": [], "keyword": [], "generic": []}
+    for title in sorted(set(titles)):
+        profile, kind, key = flavor_profile(data, title)
+        table[title] = {"lines": display_lines(data, title), "profile": profile, "profile_key": key}
+        coverage[kind].append(title)
+    return table, coverage
+
+
+def _star_value(value: Any) -> str:
+    if value is None:
+        return "None"
+    if isinstance(value, str):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, list):
+        return "[" + ", ".join(_star_value(v) for v in value) + "]"
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{_star_value(k)}: {_star_value(v)}" for k, v in value.items()) + "}"
+    raise TypeError(f"cannot render {type(value).__name__} as Starlark")
+
+
+def render_block(table: dict[str, dict[str, Any]]) -> str:
+    lines = [
+        BEGIN_MARKER,
+        "# Title -> precomputed display lines and cone profile. Regenerate after a backfill.",
+        "FLAVOR_DISPLAY = {",
+    ]
+    for title, entry in table.items():
+        key = entry["profile_key"]
+        profile = f"FLAVOR_PROFILES[{_star_value(key)}]" if key else _star_value(entry["profile"])
+        lines.append(f'    {_star_value(title)}: {{"lines": {_star_value(entry["lines"])}, "profile": {profile}}},')
+    lines += ["}", END_MARKER]
+    return "\n".join(lines)
+
+
+def replace_block(source: str, block: str) -> str:
+    start = source.index(BEGIN_MARKER)
+    end = source.index(END_MARKER) + len(END_MARKER)
+    return source[:start] + block + source[end:]
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Precompile flavor display lines and profiles into culvers_fotd.star")
+    p.add_argument("--db", type=Path, default=DB_PATH, help="Backfill database to read titles from")
+    p.add_argument("--star", type=Path, default=STAR_PATH, help="App source holding the generated table")
+    p.add_argument("--titles", type=Path, help="Extra titles, one per line")
+    p.add_argument("--check", action="store_true", help="Do not write; exit 1 if the table is out of date")
+    args = p.parse_args()
+
+    source = args.star.read_text(encoding="utf-8")
+    data = StarData(source)
+    titles = db_titles(args.db) + data.demo_titles
+    if args.titles:
+        titles += [t.strip() for t in args.titles.read_text(encoding="utf-8").splitlines() if t.strip()]
+
+    table, coverage = compile_titles(data, titles)
+    updated = replace_block(source, render_block(table))
+    stale = updated != source
+    if stale and not args.check:
+        args.star.write_text(updated, encoding="utf-8")
+
+    print(
+        "precompile",
+        json.dumps(
+            {
+                "titles": len(table),
+                "exact": len(coverage["exact"]),
+                "keyword": len(coverage["keyword"]),
+                "generic": len(coverage["generic"]),
+                "stale": stale,
+                "written": stale and not args.check,
+            }
+        ),
+    )
+    for kind in ("keyword", "generic"):
+        for title in coverage[kind]:
+            print(f"{kind} profile: {title}", file=sys.stderr)
+    return 1 if stale and args.check else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
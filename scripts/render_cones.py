@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""Render the app's mini cones to pixels and bake them into culvers_fotd.star.
+
+A NumPy port of create_mini_cone draws every cone the app can show: each
+FLAVOR_PROFILES entry plus the keyword-fallback profiles. Each one becomes a
+9x11 RGBA PNG, base64-encoded into the generated CONE_SPRITES table, so the
+app shows a cone as one render.Image instead of a tree of 1px Boxes. The
+same sprites are written side by side as an atlas PNG, which the golden
+tests compare pixel for pixel.
+
+Palettes and profiles are read from the .star source (see
+precompile_flavors.StarData). PNGs are encoded here with zlib; only NumPy
+is required.
+
+Usage:
+    python scripts/render_cones.py                  # rewrite CONE_SPRITES
+    python scripts/render_cones.py --check          # exit 1 if stale
+    python scripts/render_cones.py --atlas cones.png
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import struct
+import zlib
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from precompile_flavors import STAR_PATH, StarData, flavor_profile
+
+WIDTH = 9
+HEIGHT = 11
+
+CONE_LIGHT = "#D2691E"
+CONE_DARK = "#B8860B"
+
+# Slot pixels as (x, y), matching the Padding offsets in create_mini_cone.
+TOPPING_SLOTS = [(2, 1), (6, 1), (3, 3), (5, 2)]
+RIBBON_PIXELS = [(3, 0), (4, 1), (5, 2)]
+
+# One title per keyword branch of get_flavor_profile, plus one for the
+# generic default, so every fallback profile gets a sprite.
+FALLBACK_PROBES = ["mint", "dark choc", "chocolate", "strawberry", "cheesecake", "caramel", "peach",
+                   "butter pecan", "vanilla", ""]
+
+BEGIN_MARKER = "# --- BEGIN GENERATED CONE_SPRITES (scripts/render_cones.py; do not edit) ---"
+END_MARKER = "# --- END GENERATED CONE_SPRITES ---"
+
+
+def rgba(color: str) -> tuple[int, int, int, int]:
+    color = color.lstrip("#")
+    return int(color[0:2], 16), int(color[2:4], 16), int(color[4:6], 16), 255
+
+
+def sprite_key(profile: dict[str, Any]) -> str:
+    """Same key as cone_sprite_key() in the app."""
+    return "{}|{}|{}|{}".format(
+        profile["base"],
+        profile.get("ribbon") or "",
+        ",".join(profile.get("toppings", [])),
+        profile.get("density", "standard"),
+    )
+
+
+def topping_slots(profile: dict[str, Any]) -> list[str]:
+    toppings = profile.get("toppings", [])
+    density = profile.get("density", "standard")
+    if density == "pure":
+        return []
+    if density == "double":
+        if not toppings:
+            return []
+        return [toppings[0], toppings[0]] + toppings[1:2]
+    if density == "overload":
+        return [toppings[0], toppings[0]] if toppings else []
+    return list(toppings[:4])
+
+
+def render_cone(data: StarData, profile: dict[str, Any]) -> np.ndarray:
+    """Port of create_mini_cone: an (11, 9, 4) uint8 RGBA array."""
+    img = np.zeros((HEIGHT, WIDTH, 4), dtype=np.uint8)
+    density = profile.get("density", "standard")
+    has_ribbon = profile.get("ribbon") is not None and density != "pure"
+
+    # Scoop: a 5px row, then five 7px rows.
+    base = rgba(data.base_colors[profile["base"]])
+    img[0, 2:7] = base
+    img[1:6, 1:8] = base
+
+    # Cone: checkerboard rows 6-9 (5, 5, 3, 3 wide), then the tip.
+    light, dark = rgba(CONE_LIGHT), rgba(CONE_DARK)
+    for y, (x0, width) in enumerate([(2, 5), (2, 5), (3, 3), (3, 3)], start=6):
+        for i in range(width):
+            img[y, x0 + i] = light if (i + y) % 2 == 0 else dark
+    img[10, 4] = dark
+
+    # Toppings, then ribbon on top; T4 shares R3's pixel and is skipped
+    # whenever a ribbon is drawn.
+    for n, name in enumerate(topping_slots(profile)):
+        if n == 3 and has_ribbon:
+            break
+        x, y = TOPPING_SLOTS[n]
+        img[y, x] = rgba(data.topping_colors[name])
+    if has_ribbon:
+        ribbon = rgba(data.ribbon_colors[profile["ribbon"]])
+        for x, y in RIBBON_PIXELS:
+            img[y, x] = ribbon
+    return img
+
+
+def all_profiles(data: StarData) -> dict[str, dict[str, Any]]:
+    """Every distinct profile the app can render, by sprite key."""
+    profiles = list(data.profiles.values()) + [flavor_profile(data, probe)[0] for probe in FALLBACK_PROBES]
+    return {sprite_key(p): p for p in profiles}
+
+
+def encode_png(img: np.ndarray) -> bytes:
+    """Minimal 8-bit RGBA PNG (filter 0 on every row)."""
+    height, width, _ = img.shape
+    raw = b"".join(b"\x00" + img[y].tobytes() for y in range(height))
+
+    def chunk(kind: bytes, payload: bytes) -> bytes:
+        return struct.pack(">I", len(payload)) + kind + payload + struct.pack(">I", zlib.crc32(kind + payload))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 9)) + chunk(b"IEND", b"")
+
+
+def decode_png(png: bytes) -> np.ndarray:
+    """Inverse of encode_png (8-bit RGBA, filter 0 only)."""
+    pos = 8
+    width = height = 0
+    idat = b""
+    while pos < len(png):
+        (length,) = struct.unpack(">I", png[pos : pos + 4])
+        kind = png[pos + 4 : pos + 8]
+        payload = png[pos + 8 : pos + 8 + length]
+        if kind == b"IHDR":
+            width, height = struct.unpack(">II", payload[:8])
+        elif kind == b"IDAT":
+            idat += payload
+        pos += 12 + length
+    raw = np.frombuffer(zlib.decompress(idat), dtype=np.uint8).reshape(height, 1 + width * 4)
+    if raw[:, 0].any():
+        raise ValueError("only filter type 0 is supported")
+    return raw[:, 1:].reshape(height, width, 4).copy()
+
+
+def render_atlas(data: StarData) -> tuple[np.ndarray, list[str]]:
+    """All sprites left to right in sprite-key order, and that key order."""
+    profiles = all_profiles(data)
+    keys = sorted(profiles)
+    atlas = np.concatenate([render_cone(data, profiles[k]) for k in keys], axis=1)
+    return atlas, keys
+
+
+def render_block(data: StarData) -> str:
+    profiles = all_profiles(data)
+    lines = [
+        BEGIN_MARKER,
+        "# cone_sprite_key(profile) -> base64 9x11 RGBA PNG of create_mini_cone(profile).",
+        "CONE_SPRITES = {",
+    ]
+    for key in sorted(profiles):
+        png = base64.b64encode(encode_png(render_cone(data, profiles[key]))).decode("ascii")
+        lines.append(f"    {json.dumps(key)}: {json.dumps(png)},")
+    lines += ["}", END_MARKER]
+    return "\n".join(lines)
+
+
+def replace_block(source: str, block: str) -> str:
+    start = source.index(BEGIN_MARKER)
+    end = source.index(END_MARKER) + len(END_MARKER)
+    return source[:start] + block + source[end:]
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Render cone sprites into culvers_fotd.star")
+    p.add_argument("--star", type=Path, default=STAR_PATH, help="App source holding the generated table")
+    p.add_argument("--atlas", type=Path, help="Also write every sprite side by side to this PNG")
+    p.add_argument("--check", action="store_true", help="Do not write; exit 1 if the table is out of date")
+    args = p.parse_args()
+
+    source = args.star.read_text(encoding="utf-8")
+    data = StarData(source)
+    updated = replace_block(source, render_block(data))
+    stale = updated != source
+    if stale and not args.check:
+        args.star.write_text(updated, encoding="utf-8")
+
+    atlas, keys = render_atlas(data)
+    if args.atlas:
+        args.atlas.write_bytes(encode_png(atlas))
+        args.atlas.with_suffix(".json").write_text(json.dumps(keys, indent=2) + "\n", encoding="utf-8")
+
+    print(
+        "cones",
+        json.dumps(
+            {
+                "sprites": len(keys),
+                "atlas_bytes": len(encode_png(atlas)),
+                "stale": stale,
+                "written": stale and not args.check,
+            }
+        ),
+    )
+    return 1 if stale and args.check else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
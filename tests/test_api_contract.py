@@ -9,7 +9,10 @@ Run:
     pytest tests/test_api_contract.py -v
 
 These tests make real HTTP requests. They are integration/smoke tests, not
-unit tests. Skip them in offline CI by setting SKIP_LIVE_API=1.
+unit tests. Skip them in offline CI by setting SKIP_LIVE_API=1, or run them
+offline against the local stand-in:
+    python scripts/fake_worker.py --port 8787 &
+    CUSTARD_API_BASE=http://127.0.0.1:8787 pytest tests/test_api_contract.py -v
 """
 
 from __future__ import annotations
@@ -20,7 +23,7 @@ import urllib.request
 
 import pytest
 
-WORKER_BASE = "https://custard.chriskaschner.com"
+WORKER_BASE = os.environ.get("CUSTARD_API_BASE", "https://custard.chriskaschner.com")
 PRIORITY_SLUG = "mt-horeb"
 # Use slug-format query: the Worker's search matches against the slug field directly.
 # "mt horeb" with spaces does not match "mt. horeb" (city name has a period),
@@ -0,0 +1,1541 @@
+"""Offline unit tests for scripts/backfill_custard.py.
+
+The Worker API is replaced with an in-process fake, and every data path is
+redirected into a pytest tmp_path, so these run without network access.
+
+Run:
+    pytest tests/test_backfill_custard.py -v
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import http.server
+import importlib.util
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from typing import ClassVar
+
+import pytest
+
+SCRIPTS = Path(__file__).resolve().parents[1] / "scripts"
+SCRIPT = SCRIPTS / "backfill_custard.py"
+
+
+def _load_module(name: str = "backfill_custard"):
+    spec = importlib.util.spec_from_file_location(name, SCRIPTS / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def bf(tmp_path, monkeypatch):
+    """The backfill module with all of its data paths under tmp_path."""
+    module = _load_module()
+    original_root = module.ROOT
+    for name, value in list(vars(module).items()):
+        if isinstance(value, Path) and value.is_relative_to(original_root):
+            monkeypatch.setattr(module, name, tmp_path / value.relative_to(original_root))
+    module.ensure_dirs()
+    return module
+
+
+def _stores(n: int, state: str = "WI") -> list[dict]:
+    return [
+        {"slug": f"store-{i:03d}", "name": f"Store {i}", "city": "Town", "state": state}
+        for i in range(n)
+    ]
+
+
+def _flavors_for(slug: str) -> dict:
+    return {
+        "name": slug,
+        "flavors": [
+            {"date": "2026-10-17", "title": "Turtle Dove", "description": "d1"},
+            {"date": "2026-10-18", "title": "Mint Explosion", "description": "d2"},
+        ],
+    }
+
+
+def _serve(bf, monkeypatch, handler) -> None:
+    """Answer flavor fetches with handler(slug) instead of the Worker."""
+
+    def fake(path, params=None, validators=None, timeout=30):
+        return 200, {}, handler(params["slug"])
+
+    monkeypatch.setattr(bf, "get_json_conditional", fake)
+
+
+def _count_commits(bf, monkeypatch) -> list[str]:
+    """Collect every COMMIT the stage's connections send to SQLite."""
+    commits: list[str] = []
+    real_init_db = bf.init_db
+
+    def init_db(*args, **kwargs):
+        conn = real_init_db(*args, **kwargs)
+        conn.set_trace_callback(lambda sql: sql == "COMMIT" and commits.append(sql))
+        return conn
+
+    monkeypatch.setattr(bf, "init_db", init_db)
+    return commits
+
+
+def _progress(bf, segment: str = "wi") -> dict:
+    conn = bf.init_db()
+    progress = bf.load_backfill_progress(conn, segment)
+    conn.close()
+    return progress
+
+
+# Rate limiting off in effect, and no retries, unless a test asks for them.
+RATE_ARGS = {"rate": 1000.0, "min_rate": 0.5, "max_rate": 0.0, "retries": 0}
+
+
+def _backfill_args(**overrides) -> argparse.Namespace:
+    values = {
+        **RATE_ARGS,
+        "segment": "wi",
+        "stores_per_run": 50,
+        "sleep_ms": 0,
+        "timeout": 5,
+        "stop_on_error": False,
+        "concurrency": 1,
+        "force": False,
+        "commit_every": 25,
+        "reset": False,
+        "retry_base_minutes": 5.0,
+        "max_attempts": 3,
+        "owner": None,
+        "lease_minutes": 15.0,
+    }
+    values.update(overrides)
+    return argparse.Namespace(**values)
+
+
+# ---------------------------------------------------------------------------
+# Concurrent backfill
+# ---------------------------------------------------------------------------
+
+class TestConcurrentBackfill:
+    def test_checkpoint_advances_over_contiguous_prefix(self, bf):
+        assert bf.advance_checkpoint(0, {0, 1, 3}, 5) == 2
+        assert bf.advance_checkpoint(2, {3}, 5) == 2
+        assert bf.advance_checkpoint(4, {4}, 5) == 5
+
+    def test_out_of_order_results_keep_state_exact(self, bf, monkeypatch):
+        stores = _stores(12)
+        bf.write_json(bf.WI_STORES_PATH, stores)
+        in_flight = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def handler(slug):
+            nonlocal in_flight, peak
+            with lock:
+                in_flight += 1
+                peak = max(peak, in_flight)
+            # Earlier slugs sleep longer so completions arrive reversed.
+            time.sleep(0.002 * (12 - int(slug.split("-")[1])))
+            with lock:
+                in_flight -= 1
+            return _flavors_for(slug)
+
+        _serve(bf, monkeypatch, handler)
+        assert bf.stage_backfill(_backfill_args(concurrency=4, stores_per_run=10)) == 0
+
+        progress = _progress(bf)
+        assert progress["next_index"] == 10
+        assert progress["completed"] == {s["slug"] for s in stores[:10]}
+        assert 1 < peak <= 4
+
+        conn = bf.init_db()
+        assert conn.execute("SELECT COUNT(*) FROM store_flavors").fetchone()[0] == 20
+        assert conn.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0] == 10
+        conn.close()
+
+    def test_stop_on_error_leaves_failed_index_for_retry(self, bf, monkeypatch):
+        stores = _stores(6)
+        bf.write_json(bf.WI_STORES_PATH, stores)
+
+        def handler(slug):
+            if slug == "store-002":
+                raise urllib.error.URLError("boom")
+            return _flavors_for(slug)
+
+        _serve(bf, monkeypatch, handler)
+        assert bf.stage_backfill(_backfill_args(stop_on_error=True)) == 2
+
+        progress = _progress(bf)
+        assert progress["next_index"] == 2
+        assert "store-002" not in progress["completed"]
+
+    def test_summary_counts(self, bf, monkeypatch, capsys):
+        bf.write_json(bf.WI_STORES_PATH, _stores(5))
+        _serve(bf, monkeypatch, _flavors_for)
+        bf.stage_backfill(_backfill_args(concurrency=3))
+
+        line = [l for l in capsys.readouterr().out.splitlines() if l.startswith("backfill ")][-1]
+        summary = json.loads(line.split(" ", 1)[1])
+        assert summary["success_this_run"] == 5
+        assert summary["processed_this_run"] == 5
+        assert summary["done"] is True
+        assert summary["median_flavors"] == 2
+
+
+# ---------------------------------------------------------------------------
+# Retry queue
+# ---------------------------------------------------------------------------
+
+def _retry_rows(bf):
+    conn = bf.init_db()
+    rows = conn.execute(
+        "SELECT store_slug, attempts, last_error, next_eligible_at FROM backfill_retry ORDER BY store_slug"
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+class TestRetryQueue:
+    def _failing(self, bf, monkeypatch, bad: set[str]):
+        def handler(slug):
+            if slug in bad:
+                raise urllib.error.URLError("blip")
+            return _flavors_for(slug)
+
+        _serve(bf, monkeypatch, handler)
+
+    def test_failure_is_queued_and_index_still_advances(self, bf, monkeypatch):
+        bf.write_json(bf.WI_STORES_PATH, _stores(5))
+        self._failing(bf, monkeypatch, {"store-001"})
+        bf.stage_backfill(_backfill_args())
+
+        assert _progress(bf)["next_index"] == 5
+        ((slug, attempts, error, next_at),) = _retry_rows(bf)
+        assert (slug, attempts) == ("store-001", 1)
+        assert "blip" in error and next_at > bf.utc_now()
+
+    def test_due_retries_drain_first_and_clear_on_success(self, bf, monkeypatch, capsys):
+        bf.write_json(bf.WI_STORES_PATH, _stores(4))
+        self._failing(bf, monkeypatch, {"store-001"})
+        bf.stage_backfill(_backfill_args(stores_per_run=2))
+        assert [r[0] for r in _retry_rows(bf)] == ["store-001"]
+
+        fetched = []
+        _serve(bf, monkeypatch, lambda slug: fetched.append(slug) or _flavors_for(slug))
+        later = (datetime.now(UTC) + timedelta(minutes=6)).isoformat()
+        monkeypatch.setattr(bf, "utc_now", lambda: later)
+        capsys.readouterr()
+        bf.stage_backfill(_backfill_args(stores_per_run=2))
+
+        # The retry used one of the two slots, ahead of the new store.
+        assert fetched == ["store-001", "store-002"]
+        assert _retry_rows(bf) == []
+        assert "store-001" in _progress(bf)["completed"]
+        summary = json.loads(capsys.readouterr().out.strip().splitlines()[-1].split(" ", 1)[1])
+        assert summary["recovered_this_run"] == 1 and summary["retry_queue"]["pending"] == 0
+
+    def test_not_retried_before_eligible(self, bf, monkeypatch):
+        bf.write_json(bf.WI_STORES_PATH, _stores(2))
+        self._failing(bf, monkeypatch, {"store-000"})
+        bf.stage_backfill(_backfill_args())
+        fetched = []
+        _serve(bf, monkeypatch, lambda slug: fetched.append(slug) or _flavors_for(slug))
+        bf.stage_backfill(_backfill_args())
+        assert fetched == []
+
+    def test_spacing_doubles_then_parks_dead_letter(self, bf, monkeypatch, capsys):
+        assert bf.retry_delay(1, 5) == timedelta(minutes=5)
+        assert bf.retry_delay(3, 5) == timedelta(minutes=20)
+        assert bf.retry_delay(20, 5) == timedelta(hours=24)
+
+        bf.write_json(bf.WI_STORES_PATH, _stores(1))
+        self._failing(bf, monkeypatch, {"store-000"})
+        clock = datetime.now(UTC)
+        for _ in range(3):
+            monkeypatch.setattr(bf, "utc_now", lambda c=clock: c.isoformat())
+            bf.stage_backfill(_backfill_args())
+            clock += timedelta(days=2)
+        ((_, attempts, _, next_at),) = _retry_rows(bf)
+        assert attempts == 3 and next_at is None
+
+        capsys.readouterr()
+        bf.stage_status(argparse.Namespace())
+        queue = json.loads(capsys.readouterr().out)["backfill"]["wi"]["retry_queue"]
+        assert queue["dead"] == 1 and queue["pending"] == 0
+
+    def test_reset_clears_queue(self, bf, monkeypatch):
+        bf.write_json(bf.WI_STORES_PATH, _stores(2))
+        self._failing(bf, monkeypatch, {"store-000"})
+        bf.stage_backfill(_backfill_args())
+        bf.stage_backfill(_backfill_args(reset=True))
+        # Requeued from scratch by the new pass, not a second attempt.
+        assert [r[:2] for r in _retry_rows(bf)] == [("store-000", 1)]
+
+
+# ---------------------------------------------------------------------------
+# Keep-alive HTTP client
+# ---------------------------------------------------------------------------
+
+class _GzipHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != "/api/v1/flavors":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        slug = urllib.parse.parse_qs(url.query)["slug"][0]
+        body = json.dumps(_flavors_for(slug)).encode("utf-8")
+        gzipped = "gzip" in self.headers.get("Accept-Encoding", "")
+        if gzipped:
+            body = gzip.compress(body)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_api():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _GzipHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class TestHttpClient:
+    def test_reuses_connection_and_decodes_gzip(self, bf, local_api):
+        client = bf.HttpClient(local_api)
+        for slug in ("a", "b", "c"):
+            payload = client.get_json("/api/v1/flavors", {"slug": slug})
+            assert payload["name"] == slug
+        summary = client.timing_summary()
+        assert summary["requests"] == 3
+        assert summary["connections_opened"] == 1
+        assert summary["p50_ms"] is not None
+        client.close()
+
+    def test_timing_sample_is_bounded(self, bf, local_api):
+        client = bf.HttpClient(local_api)
+        client.max_timings = 5
+        for n in range(20):
+            client.get_json("/api/v1/flavors", {"slug": f"s{n}"})
+        summary = client.timing_summary()
+        assert summary["requests"] == 20 and len(client.timings_ms) == 5
+        assert summary["max_ms"] >= summary["p99_ms"]
+        client.close()
+
+    def test_http_error_status_raises(self, bf, local_api):
+        client = bf.HttpClient(local_api)
+        with pytest.raises(urllib.error.HTTPError) as exc:
+            client.get_json("/missing")
+        assert exc.value.code == 404
+        client.close()
+
+    def test_get_json_follows_api_base(self, bf, local_api, monkeypatch):
+        monkeypatch.setattr(bf, "API_BASE", local_api)
+        assert bf.get_json("/api/v1/flavors", {"slug": "x"})["name"] == "x"
+        assert bf.get_client().base_url == local_api
+        bf.get_client().close()
+
+
+# ---------------------------------------------------------------------------
+# Conditional fetches
+# ---------------------------------------------------------------------------
+
+class TestConditionalFetch:
+    def _run_twice(self, bf, monkeypatch, fake):
+        bf.write_json(bf.WI_STORES_PATH, _stores(3))
+        monkeypatch.setattr(bf, "get_json_conditional", fake)
+        bf.stage_backfill(_backfill_args())
+        bf.stage_backfill(_backfill_args(reset=True))
+
+    def test_same_payload_skips_all_writes(self, bf, monkeypatch):
+        self._run_twice(bf, monkeypatch, lambda path, params=None, validators=None, timeout=30: (
+            200, {}, _flavors_for(params["slug"])
+        ))
+        conn = bf.init_db()
+        assert conn.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0] == 3
+        checked = conn.execute("SELECT COUNT(*) FROM store_validators WHERE checked_at > changed_at").fetchone()[0]
+        assert checked == 3
+        conn.close()
+        assert len(bf.SNAPSHOT_LOG.read_text().splitlines()) == 3
+
+    def test_etag_sent_and_304_honored(self, bf, monkeypatch):
+        sent = []
+
+        def fake(path, params=None, validators=None, timeout=30):
+            sent.append(validators)
+            if validators and validators.get("etag") == '"v1"':
+                return 304, {}, None
+            return 200, {"etag": '"v1"'}, _flavors_for(params["slug"])
+
+        self._run_twice(bf, monkeypatch, fake)
+        assert sent[:3] == [None, None, None]
+        assert all(v["etag"] == '"v1"' for v in sent[3:])
+        conn = bf.init_db()
+        assert conn.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0] == 3
+        conn.close()
+
+    def test_changed_payload_is_written(self, bf, monkeypatch):
+        calls = {"n": 0}
+
+        def fake(path, params=None, validators=None, timeout=30):
+            calls["n"] += 1
+            payload = _flavors_for(params["slug"])
+            if calls["n"] > 3:
+                payload["flavors"][0]["title"] = "Butter Pecan"
+            return 200, {}, payload
+
+        self._run_twice(bf, monkeypatch, fake)
+        conn = bf.init_db()
+        assert conn.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0] == 6
+        titles = {r[0] for r in conn.execute("SELECT title FROM store_flavors WHERE flavor_date='2026-10-17'")}
+        assert titles == {"Butter Pecan"}
+        conn.close()
+
+
+# ---------------------------------------------------------------------------
+# Batched WAL writes
+# ---------------------------------------------------------------------------
+
+class TestBatchedWrites:
+    def test_init_db_enables_wal(self, bf):
+        conn = bf.init_db()
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        conn.close()
+
+    def test_crash_keeps_last_batch_checkpoint(self, bf, monkeypatch):
+        bf.write_json(bf.WI_STORES_PATH, _stores(8))
+
+        def handler(slug):
+            if slug == "store-005":
+                raise KeyboardInterrupt
+            return _flavors_for(slug)
+
+        _serve(bf, monkeypatch, handler)
+        with pytest.raises(KeyboardInterrupt):
+            bf.stage_backfill(_backfill_args(commit_every=2))
+
+        progress = _progress(bf)
+        assert progress["next_index"] == 4
+        assert len(progress["completed"]) == 4
+        conn = bf.init_db()
+        assert conn.execute("SELECT COUNT(DISTINCT store_slug) FROM store_flavors").fetchone()[0] == 4
+        conn.close()
+
+
+# ---------------------------------------------------------------------------
+# Content-addressed snapshot payloads
+# ---------------------------------------------------------------------------
+
+class TestSnapshotBlobs:
+    def test_identical_payloads_stored_once(self, bf, monkeypatch):
+        bf.write_json(bf.WI_STORES_PATH, _stores(2))
+        _serve(bf, monkeypatch, lambda slug: _flavors_for("same"))
+        bf.stage_backfill(_backfill_args())
+        bf.stage_backfill(_backfill_args(force=True, reset=True))
+
+        conn = bf.init_db()
+        assert conn.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0] == 4
+        assert conn.execute("SELECT COUNT(*) FROM snapshot_blobs").fetchone()[0] == 1
+        rows = bf.read_snapshot_payloads(conn, slug="store-001")
+        assert len(rows) == 2
+        assert json.loads(rows[0]["raw_json"]) == _flavors_for("same")
+        conn.close()
+
+    def test_migrates_inline_raw_json(self, bf):
+        legacy = sqlite3.connect(bf.DB_PATH)
+        legacy.execute(
+            """
+            CREATE TABLE snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, fetched_at TEXT, segment TEXT, store_slug TEXT,
+                flavor_count INTEGER, min_date TEXT, max_date TEXT, raw_json TEXT
+            )
+            """
+        )
+        raw = json.dumps(_flavors_for("old"), separators=(",", ":"))
+        for _ in range(3):
+            legacy.execute("INSERT INTO snapshots(store_slug, raw_json) VALUES('old', ?)", (raw,))
+        legacy.commit()
+        legacy.close()
+
+        conn = bf.init_db()
+        assert conn.execute("SELECT COUNT(*) FROM snapshots WHERE raw_json IS NOT NULL").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM snapshot_blobs").fetchone()[0] == 1
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == bf.SCHEMA_VERSION
+        assert [r["raw_json"] for r in bf.read_snapshot_payloads(conn)] == [raw] * 3
+        conn.close()
+
+
+class TestCompaction:
+    FETCHES = (
+        "2026-04-02T06:00:00+00:00", "2026-04-28T06:00:00+00:00",  # monthly: keep the 28th
+        "2026-09-20T06:00:00+00:00", "2026-09-20T18:00:00+00:00",  # daily: keep 18:00
+        "2026-09-21T06:00:00+00:00",
+        "2026-10-10T06:00:00+00:00", "2026-10-10T18:00:00+00:00",  # last 14 days: keep all
+    )
+
+    def _fill(self, bf):
+        conn = bf.init_db()
+        store = {"slug": "mt-horeb", "name": "Mt. Horeb", "state": "WI"}
+        for n, seen_at in enumerate(self.FETCHES):
+            title = "Old Flavor" if n == 0 else f"Flavor {n % 3}"
+            payload = {"flavors": [{"date": "2026-10-17", "title": title}]}
+            bf.record_store_payload(conn, "wi", store, payload, seen_at)
+        conn.commit()
+        return conn
+
+    def test_retention_policy_and_archive(self, bf):
+        conn = self._fill(bf)
+        dry = bf.compact_snapshots(conn, bf.ARCHIVE_DIR, "2026-10-17", dry_run=True)
+        assert dry["pruned"] == 2 and not bf.ARCHIVE_DIR.exists()
+
+        summary = bf.compact_snapshots(conn, bf.ARCHIVE_DIR, "2026-10-17")
+        assert (summary["keep_all_since"], summary["daily_since"]) == ("2026-10-03", "2026-07-19")
+        assert summary["pruned"] == 2 and summary["archive_files"] == 2
+        kept = [r["fetched_at"] for r in reversed(bf.read_snapshot_payloads(conn))]
+        assert kept == [self.FETCHES[i] for i in (1, 3, 4, 5, 6)]
+        # Fetch 2's payload is still referenced by fetch 5, so only fetch 0's blob goes.
+        assert summary["blobs_deleted"] == 1
+        assert conn.execute("SELECT COUNT(*) FROM snapshot_blobs").fetchone()[0] == 3
+
+        with gzip.open(bf.ARCHIVE_DIR / "snapshots" / "2026-04" / "2026-04-02.ndjson.gz", "rt") as f:
+            (record,) = [json.loads(line) for line in f]
+        assert record["fetched_at"] == self.FETCHES[0]
+        assert json.loads(record["raw_json"])["flavors"][0]["title"] == "Old Flavor"
+        assert bf.compact_snapshots(conn, bf.ARCHIVE_DIR, "2026-10-17")["pruned"] == 0
+        conn.close()
+
+    def test_cli_vacuums_and_archives_rotated_log(self, bf, capsys):
+        # A database created before auto_vacuum was set is converted once.
+        legacy = sqlite3.connect(bf.DB_PATH)
+        legacy.execute("CREATE TABLE legacy (x)")
+        legacy.close()
+        conn = self._fill(bf)
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+        conn.execute("CREATE TABLE filler (data BLOB)")
+        conn.executemany("INSERT INTO filler VALUES (?)", [(os.urandom(4000),) for _ in range(200)])
+        conn.commit()
+        conn.execute("DROP TABLE filler")
+        conn.commit()
+        conn.close()
+        bf.get_exporter().close()
+
+        rotated = bf.SNAPSHOT_LOG.with_name("snapshot_runs.20260101T000000000000.ndjson")
+        rotated.write_text('{"fetched_at":"2026-01-01T05:00:00+00:00"}\n{"fetched_at":"2026-01-02T05:00:00+00:00"}\n')
+        bf.SNAPSHOT_LOG.write_text('{"fetched_at":"2026-10-17T05:00:00+00:00"}\n')
+
+        args = bf.build_parser().parse_args(["compact", "--date", "2026-10-17"])
+        assert bf.stage_compact(args) == 0
+        out, err = capsys.readouterr()
+        summary = json.loads(out.strip().splitlines()[-1].split(" ", 1)[1])
+        assert "one-time full VACUUM" in err
+        assert summary["pruned"] == 2 and summary["snapshots_left"] == 5
+        assert (summary["snapshot_log"]["segments"], summary["snapshot_log"]["records"]) == (1, 2)
+        assert summary["db_bytes"]["after"] < summary["db_bytes"]["before"]
+        assert not rotated.exists() and bf.SNAPSHOT_LOG.exists()
+        assert (bf.ARCHIVE_DIR / "snapshot_runs" / "2026-01" / "2026-01-02.ndjson.gz").exists()
+
+        conn = bf.init_db()
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+        conn.close()
+        assert bf.stage_compact(args) == 0
+        summary = json.loads(capsys.readouterr()[0].strip().splitlines()[-1].split(" ", 1)[1])
+        assert summary["vacuum"] == {"converted": False, "pages_freed": 0}
+
+
+# ---------------------------------------------------------------------------
+# Adaptive discovery
+# ---------------------------------------------------------------------------
+
+def _catalog(n: int = 300) -> list[dict]:
+    words = ["mad", "mil", "ver", "osh", "gre", "app", "fon", "kau", "wau", "lac", "bel", "jan"]
+    return [
+        {"slug": f"{words[i % len(words)]}{i:03d}", "name": f"Store {i}", "city": "Town",
+         "state": "WI" if i % 3 == 0 else "IL"}
+        for i in range(n)
+    ]
+
+
+def _fake_search(catalog: list[dict], cap: int):
+    calls = []
+
+    def fake_get_json(path, params=None, timeout=30):
+        calls.append(params["q"])
+        hits = [s for s in catalog if params["q"] in s["slug"]]
+        return {"stores": hits[:cap]}
+
+    return fake_get_json, calls
+
+
+def _discover_args(**overrides) -> argparse.Namespace:
+    values = {
+        **RATE_ARGS,
+        "strategy": "adaptive",
+        "tokens_per_run": 5000,
+        "sleep_ms": 0,
+        "timeout": 5,
+        "max_prefix_len": 3,
+        "page_limit": 0,
+        "patience": 6,
+        "reset": False,
+    }
+    values.update(overrides)
+    return argparse.Namespace(**values)
+
+
+class TestAdaptiveDiscovery:
+    def test_plan_only_expands_truncated_branches(self, bf):
+        results = {"a": {"size": 20, "new": 20}, "b": {"size": 3, "new": 3}, "cd": {"size": 20, "new": 0}}
+        children = bf.plan_next_level(results, 20, 3, ["xay abc", "ab"])
+        assert children[:2] == ["ab", "ay"] and len(children) == len(bf.DISCOVERY_CHARS)
+
+    def test_infer_page_limit(self, bf):
+        assert bf.infer_page_limit([20, 3, 20, 7]) == 20
+        assert bf.infer_page_limit([20, 3, 7]) is None
+
+    def test_finds_every_store_with_fewer_requests(self, bf, monkeypatch):
+        catalog = _catalog()
+        fake, calls = _fake_search(catalog, cap=25)
+        monkeypatch.setattr(bf, "get_json", fake)
+
+        assert bf.stage_discover(_discover_args()) == 0
+        conn = bf.init_db()
+        assert bf.load_discover_progress(conn, "adaptive")["done"] is True
+        assert set(bf.discovered_stores_map(conn, "adaptive")) == {s["slug"] for s in catalog}
+        conn.close()
+        assert len(calls) < len(bf.all_discovery_tokens()) // 2
+        assert len(bf.read_json(bf.WI_STORES_PATH, [])) == 100
+
+    def test_resumes_across_runs(self, bf, monkeypatch):
+        fake, calls = _fake_search(_catalog(), cap=25)
+        monkeypatch.setattr(bf, "get_json", fake)
+        for _ in range(50):
+            bf.stage_discover(_discover_args(tokens_per_run=40))
+            conn = bf.init_db()
+            done = bf.load_discover_progress(conn, "adaptive")["done"]
+            conn.close()
+            if done:
+                break
+        assert len(calls) == len(set(calls))
+        assert len(bf.read_json(bf.STORES_PATH, [])) == 300
+
+
+# ---------------------------------------------------------------------------
+# Staleness-driven refresh
+# ---------------------------------------------------------------------------
+
+class TestRefresh:
+    NOW = "2026-10-17T12:00:00+00:00"
+
+    def _seed(self, bf):
+        conn = bf.init_db()
+        for slug, checked, max_date in [
+            ("running-dry", "2026-10-17T10:00:00+00:00", "2026-10-17"),
+            ("published", "2026-10-17T02:00:00+00:00", "2026-11-16"),
+            ("just-checked", "2026-10-17T11:55:00+00:00", "2026-10-17"),
+        ]:
+            bf.upsert_store(conn, {"slug": slug, "state": "WI"}, checked)
+            conn.execute("INSERT INTO snapshots(store_slug, max_date) VALUES(?, ?)", (slug, max_date))
+        conn.commit()
+        bf.write_json(bf.WI_STORES_PATH, [{"slug": "brand-new", "state": "WI"}])
+        return conn
+
+    def test_ranking_prefers_new_then_running_dry(self, bf):
+        conn = self._seed(bf)
+        # Discovered but not yet fetched is still "new", and listed once.
+        bf.record_discovered(conn, "sweep", [{"slug": "brand-new", "state": "WI"}], self.NOW)
+        ranked = bf.refresh_candidates(conn, 10, min_age_minutes=60, now=self.NOW)
+        assert [c["slug"] for c in ranked] == ["brand-new", "running-dry", "published"]
+        assert ranked[1]["horizon_days"] == 0
+        conn.close()
+
+    def test_ranking_uses_index(self, bf):
+        conn = bf.init_db()
+        plan = " ".join(str(r) for r in conn.execute("EXPLAIN QUERY PLAN " + bf.REFRESH_RANKING_SQL,
+                                                     {"now": self.NOW, "min_age_minutes": 0, "limit": 5}))
+        assert "idx_snapshots_store" in plan
+        conn.close()
+
+    def test_refresh_fetches_top_k(self, bf, monkeypatch):
+        self._seed(bf).close()
+        monkeypatch.setattr(bf, "utc_now", lambda: self.NOW)
+        fetched = []
+        _serve(bf, monkeypatch, lambda slug: fetched.append(slug) or _flavors_for(slug))
+        args = argparse.Namespace(limit=2, min_age_minutes=60, concurrency=2, sleep_ms=0, timeout=5,
+                                  force=False, commit_every=25, dry_run=False, **RATE_ARGS)
+        assert bf.stage_refresh(args) == 0
+        assert sorted(fetched) == ["brand-new", "running-dry"]
+
+
+# ---------------------------------------------------------------------------
+# Flavor search
+# ---------------------------------------------------------------------------
+
+class TestFlavorQuery:
+    def _seed(self, bf):
+        conn = bf.init_db()
+        rows = [
+            ("mt-horeb", "WI", "2026-10-17", "Turtle Dove"),
+            ("mt-horeb", "WI", "2026-10-18", "Mint Explosion"),
+            ("kopps-greenfield", "WI", "2026-10-17", "Turtle Dove"),
+            ("naperville", "IL", "2026-10-19", "Turtle Dove"),
+            ("naperville", "IL", "2026-10-20", "Devil’s Food Cake"),
+        ]
+        for slug, state, date, title in rows:
+            bf.upsert_store(conn, {"slug": slug, "name": slug, "state": state}, "t")
+            bf.upsert_flavor(conn, slug, {"date": date, "title": title, "description": "rich"}, "t")
+        conn.commit()
+        return conn
+
+    def test_full_text_with_state_and_brand(self, bf):
+        conn = self._seed(bf)
+        assert len(bf.query_flavors(conn, text="turtle")) == 3
+        assert [r["slug"] for r in bf.query_flavors(conn, text="turtle dove", state="wi", brand="culvers")] == [
+            "mt-horeb"
+        ]
+        conn.close()
+
+    def test_exact_title_latest_and_date_range(self, bf):
+        conn = self._seed(bf)
+        latest = bf.query_flavors(conn, title="turtle dove", latest=True, limit=1)
+        assert latest[0]["date"] == "2026-10-19"
+        in_range = bf.query_flavors(conn, title="Turtle Dove", date_from="2026-10-18", date_to="2026-10-31")
+        assert [r["slug"] for r in in_range] == ["naperville"]
+        assert bf.query_flavors(conn, title="devil's food cake")[0]["slug"] == "naperville"
+        conn.close()
+
+    def test_fts_follows_title_updates(self, bf):
+        conn = self._seed(bf)
+        bf.upsert_flavor(conn, "mt-horeb", {"date": "2026-10-18", "title": "Butter Pecan"}, "t2")
+        conn.commit()
+        assert bf.query_flavors(conn, text="mint") == []
+        assert bf.query_flavors(conn, text="pecan")[0]["slug"] == "mt-horeb"
+        assert bf.query_flavors(conn, text='"unbalanced') == []
+        conn.close()
+
+    def test_title_lookup_uses_index(self, bf):
+        conn = bf.init_db()
+        plan = " ".join(
+            str(r) for r in conn.execute("EXPLAIN QUERY PLAN SELECT * FROM store_flavors WHERE title_norm = 'x'")
+        )
+        assert "idx_store_flavors_title" in plan
+        conn.close()
+
+
+class TestStoreSearch:
+    STORES = (
+        {"slug": "mt-horeb", "name": "Mt. Horeb", "city": "Mt. Horeb", "state": "WI"},
+        {"slug": "madison-todd-dr", "name": "Madison Todd Dr", "city": "Madison", "state": "WI"},
+        {"slug": "lake-madison", "name": "Lake Madison", "city": "Chester", "state": "SD"},
+        {"slug": "kopps-greenfield", "name": "Kopp's Greenfield", "city": "Greenfield", "state": "WI"},
+        {"slug": "greenfield-in", "name": "Greenfield", "city": "Greenfield", "state": "IN"},
+        {"slug": "oshkosh-100", "name": "Oshkosh 100% Club", "city": "Oshkosh", "state": "WI"},
+    )
+
+    def _db(self, bf):
+        conn = bf.init_db()
+        for store in self.STORES:
+            bf.upsert_store(conn, store, "2026-10-17T06:00:00+00:00")
+        conn.commit()
+        return conn
+
+    def test_ranked_substring_matches(self, bf):
+        conn = self._db(bf)
+        assert [r["slug"] for r in bf.search_stores(conn, "greenfield")] == ["greenfield-in", "kopps-greenfield"]
+        # Prefixes before word starts before other substrings.
+        assert [(r["slug"], r["rank"]) for r in bf.search_stores(conn, "MAD")] == [
+            ("madison-todd-dr", 1), ("lake-madison", 2),
+        ]
+        assert [r["slug"] for r in bf.search_stores(conn, "madison", state="sd")] == ["lake-madison"]
+        assert [r["brand"] for r in bf.search_stores(conn, "green", brand="kopps")] == ["kopps"]
+        # Two characters scan; LIKE wildcards in the query are literal.
+        assert [r["slug"] for r in bf.search_stores(conn, "mt")] == ["mt-horeb"]
+        assert [r["slug"] for r in bf.search_stores(conn, "0%")] == ["oshkosh-100"]
+        assert bf.search_stores(conn, "o_h") == []
+
+        bf.upsert_store(conn, {**self.STORES[0], "name": "Mount Horeb"}, "2026-10-18T06:00:00+00:00")
+        conn.commit()
+        assert [r["name"] for r in bf.search_stores(conn, "mount")] == ["Mount Horeb"]
+        assert bf.search_stores(conn, "mt. h") == [
+            {"slug": "mt-horeb", "name": "Mount Horeb", "city": "Mt. Horeb", "state": "WI", "brand": "culvers", "rank": 1}
+        ]
+        conn.close()
+
+    def test_without_trigram_scans_with_like(self, bf, monkeypatch):
+        with monkeypatch.context() as m:
+            m.setattr(bf, "trigram_supported", lambda conn: False)
+            conn = self._db(bf)
+            assert not bf.store_fts_enabled(conn)
+            assert [r["slug"] for r in bf.search_stores(conn, "greenfield")] == ["greenfield-in", "kopps-greenfield"]
+            assert [r["slug"] for r in bf.search_stores(conn, "madison", state="sd")] == ["lake-madison"]
+            conn.close()
+
+        # Back on a SQLite with trigram, the index is rebuilt rather than left empty.
+        conn = bf.init_db()
+        assert bf.store_fts_enabled(conn)
+        assert [r["slug"] for r in bf.search_stores(conn, "horeb")] == ["mt-horeb"]
+        conn.close()
+
+    def test_discovered_stores_are_searchable(self, bf):
+        conn = bf.init_db()
+        bf.record_discovered(conn, "sweep", [self.STORES[3]], "2026-10-17T06:00:00+00:00")
+        conn.commit()
+        assert [r["slug"] for r in bf.search_stores(conn, "kopp")] == ["kopps-greenfield"]
+        assert conn.execute("SELECT last_seen_at FROM stores").fetchall() == [(None,)]
+
+        # A fetch takes over the row; later discovery renames don't overwrite it.
+        bf.upsert_store(conn, self.STORES[3], "2026-10-17T07:00:00+00:00")
+        bf.record_discovered(conn, "sweep", [{**self.STORES[3], "name": "Kopp's"}], "2026-10-17T08:00:00+00:00")
+        assert conn.execute("SELECT name, first_seen_at FROM stores").fetchall() == [
+            ("Kopp's Greenfield", "2026-10-17T06:00:00+00:00")
+        ]
+        conn.close()
+
+    def test_migration_indexes_existing_stores_and_cli(self, bf, capsys):
+        conn = self._db(bf)
+        conn.executescript(
+            """
+            DROP TRIGGER store_fts_ai; DROP TRIGGER store_fts_ad; DROP TRIGGER store_fts_au;
+            DROP TABLE store_fts; PRAGMA user_version=3;
+            """
+        )
+        conn.close()
+        assert bf.stage_search(bf.build_parser().parse_args(["search", "kopp's", "--state", "WI"])) == 0
+        out, err = capsys.readouterr()
+        assert [json.loads(line)["slug"] for line in out.splitlines()] == ["kopps-greenfield"]
+        assert json.loads(err.split(" ", 1)[1])["rows"] == 1
+
+
+class TestFlavorStats:
+    def _seed(self, bf):
+        conn = bf.init_db()
+        rows = [
+            ("mt-horeb", "WI", "2026-10-01", "Turtle Dove"),
+            ("mt-horeb", "WI", "2026-10-08", "Turtle Dove"),
+            ("mt-horeb", "WI", "2026-10-22", "Turtle Dove"),
+            ("mt-horeb", "WI", "2026-10-09", "Mint Explosion"),
+            ("naperville", "IL", "2026-10-05", "Turtle Dove"),
+        ]
+        for slug, state, date, title in rows:
+            bf.upsert_store(conn, {"slug": slug, "name": slug, "state": state}, "t")
+            bf.upsert_flavor(conn, slug, {"date": date, "title": title}, "t")
+        conn.commit()
+        return conn
+
+    def _aggregates(self, conn):
+        return (
+            conn.execute("SELECT * FROM flavor_store_stats ORDER BY 1, 2").fetchall(),
+            conn.execute("SELECT * FROM flavor_stats ORDER BY 1").fetchall(),
+        )
+
+    def test_counts_follow_upserts(self, bf):
+        conn = self._seed(bf)
+        detail = bf.flavor_detail(conn, "turtle dove", "2026-10-17", 10)
+        assert (detail["appearances"], detail["stores"]) == (4, 2)
+        assert (detail["first_date"], detail["last_date"]) == ("2026-10-01", "2026-10-22")
+        assert (detail["last_seen"], detail["next_scheduled"]) == ("2026-10-08", "2026-10-22")
+        assert detail["by_state"][0] == {"state": "WI", "stores": 1, "appearances": 3}
+        assert detail["top_stores"][0]["avg_gap_days"] == 10.5
+
+        # Re-fetching the same day is not a new appearance.
+        bf.upsert_flavor(conn, "mt-horeb", {"date": "2026-10-08", "title": "Turtle Dove"}, "t2")
+        conn.commit()
+        assert bf.flavor_detail(conn, "Turtle Dove", "2026-10-17", 10)["appearances"] == 4
+        conn.close()
+
+    def test_title_change_and_delete_move_counts(self, bf):
+        conn = self._seed(bf)
+        bf.upsert_flavor(conn, "mt-horeb", {"date": "2026-10-22", "title": "Mint Explosion"}, "t2")
+        conn.execute("DELETE FROM store_flavors WHERE store_slug = 'naperville'")
+        conn.commit()
+        rotation = {r["title"]: r for r in bf.store_rotation(conn, "mt-horeb", "2026-10-17", 10)}
+        assert rotation["Turtle Dove"]["appearances"] == 2
+        assert rotation["Turtle Dove"]["days_since"] == 9
+        assert rotation["Mint Explosion"]["next_scheduled"] == "2026-10-22"
+        turtle = bf.flavor_detail(conn, "Turtle Dove", "2026-10-17", 10)
+        assert (turtle["stores"], turtle["first_date"], turtle["last_date"]) == (1, "2026-10-01", "2026-10-08")
+
+        incremental = self._aggregates(conn)
+        bf.rebuild_flavor_stats(conn)
+        assert self._aggregates(conn) == incremental
+        conn.close()
+
+    def test_migration_builds_aggregates_for_existing_rows(self, bf):
+        conn = self._seed(bf)
+        incremental = self._aggregates(conn)
+        conn.execute("DELETE FROM flavor_store_stats")
+        conn.execute("DELETE FROM flavor_stats")
+        conn.execute("PRAGMA user_version=2")
+        conn.commit()
+        conn.close()
+        conn = bf.init_db()
+        assert self._aggregates(conn) == incremental
+        conn.close()
+
+    def test_stats_cli(self, bf, capsys):
+        self._seed(bf).close()
+        args = bf.build_parser().parse_args(["stats", "--date", "2026-10-17", "--limit", "1"])
+        assert bf.stage_stats(args) == 0
+        overview = json.loads(capsys.readouterr().out)
+        assert overview["flavors"] == 2 and overview["store_days"] == 5
+        assert overview["most_common"][0]["title"] == "Turtle Dove"
+        assert overview["rarest"][0]["title"] == "Mint Explosion"
+
+        args = bf.build_parser().parse_args(["stats", "--flavor", "Butter Pecan"])
+        assert bf.stage_stats(args) == 1
+
+
+class TestFlavorChanges:
+    STORE: ClassVar[dict[str, str]] = {"slug": "mt-horeb", "name": "Mt. Horeb", "state": "WI"}
+
+    def _fetch(self, bf, conn, titles, seen_at):
+        flavors = [{"date": date, "title": title} for date, title in titles.items()]
+        result = bf.record_store_payload(conn, "wi", self.STORE, {"flavors": flavors}, seen_at)
+        conn.commit()
+        return result["changes"]
+
+    def test_logs_only_real_deltas(self, bf):
+        conn = bf.init_db()
+        first = {"2026-10-17": "Turtle Dove", "2026-10-18": "Mint Explosion", "2026-10-19": "Butter Pecan"}
+        assert self._fetch(bf, conn, first, "2026-10-17T06:00:00+00:00") == 3
+        assert self._fetch(bf, conn, first, "2026-10-17T07:00:00+00:00") == 0
+        # Curly vs straight apostrophe is the same flavor.
+        assert self._fetch(bf, conn, {**first, "2026-10-17": "turtle dove"}, "2026-10-17T07:30:00+00:00") == 0
+
+        second = {"2026-10-17": "Turtle Dove", "2026-10-18": "Really Reese’s", "2026-10-20": "Oreo Overload"}
+        assert self._fetch(bf, conn, second, "2026-10-17T08:00:00+00:00") == 3
+        # The 17th is outside this payload's range: history, not a removal.
+        third = {"2026-10-18": "Really Reese's", "2026-10-20": "Oreo Overload"}
+        assert self._fetch(bf, conn, third, "2026-10-17T09:00:00+00:00") == 0
+
+        since = bf.flavor_changes(conn, since="2026-10-17T08:00")
+        assert [(c["date"], c["kind"], c["old_title"], c["new_title"]) for c in since] == [
+            ("2026-10-18", "changed", "Mint Explosion", "Really Reese’s"),
+            ("2026-10-20", "added", None, "Oreo Overload"),
+            ("2026-10-19", "removed", "Butter Pecan", None),
+        ]
+        assert [c["date"] for c in bf.flavor_changes(conn, kinds=["removed"])] == ["2026-10-19"]
+        dates = [r[0] for r in conn.execute("SELECT flavor_date FROM store_flavors ORDER BY 1")]
+        assert dates == ["2026-10-17", "2026-10-18", "2026-10-20"]
+        assert bf.flavor_changes(conn, after_id=since[-1]["id"]) == []
+        conn.close()
+
+    def test_changes_cli(self, bf, capsys):
+        conn = bf.init_db()
+        self._fetch(bf, conn, {"2026-10-17": "Turtle Dove"}, "2026-10-17T06:00:00+00:00")
+        self._fetch(bf, conn, {"2026-10-17": "Mint Explosion"}, "2026-10-17T07:00:00+00:00")
+        conn.close()
+        capsys.readouterr()
+        args = bf.build_parser().parse_args(["changes", "--since", "2026-10-17T06:30", "--store", "mt-horeb"])
+        assert bf.stage_changes(args) == 0
+        out, err = capsys.readouterr()
+        rows = [json.loads(line) for line in out.splitlines()]
+        assert [(r["kind"], r["new_title"]) for r in rows] == [("changed", "Mint Explosion")]
+        assert json.loads(err.strip().split(" ", 1)[1])["last_id"] == rows[-1]["id"]
+
+
+# ---------------------------------------------------------------------------
+# SQLite checkpoints
+# ---------------------------------------------------------------------------
+
+class TestSqliteCheckpoints:
+    def test_completion_marks_commit_with_store_rows(self, bf, monkeypatch):
+        bf.write_json(bf.WI_STORES_PATH, _stores(6))
+
+        def handler(slug):
+            if slug == "store-003":
+                raise KeyboardInterrupt
+            return _flavors_for(slug)
+
+        _serve(bf, monkeypatch, handler)
+        with pytest.raises(KeyboardInterrupt):
+            bf.stage_backfill(_backfill_args(commit_every=1))
+        assert _progress(bf)["completed"] == {"store-000", "store-001", "store-002"}
+
+        fetched = []
+        _serve(bf, monkeypatch, lambda slug: fetched.append(slug) or _flavors_for(slug))
+        bf.stage_backfill(_backfill_args())
+        assert fetched == ["store-003", "store-004", "store-005"]
+
+    def test_sweep_discover_checkpoints_each_token(self, bf, monkeypatch):
+        fake, calls = _fake_search(_catalog(40), cap=100)
+        monkeypatch.setattr(bf, "get_json", fake)
+        bf.stage_discover(_discover_args(strategy="sweep", tokens_per_run=10))
+        bf.stage_discover(_discover_args(strategy="sweep", tokens_per_run=10))
+        assert calls == bf.all_discovery_tokens()[:20]
+        conn = bf.init_db()
+        assert bf.load_discover_progress(conn, "sweep")["next_index"] == 20
+        conn.close()
+
+    def test_imports_legacy_json_state(self, bf):
+        bf.write_json(bf.WI_STATE, {"next_index": 7, "completed_slugs": ["a", "b"], "started_at": "s"})
+        bf.write_json(
+            bf.DISCOVER_STATE,
+            {"next_index": 12, "stores": {"a": {"slug": "a", "name": "A", "city": "", "state": "WI"}}},
+        )
+        conn = bf.init_db()
+        progress = bf.load_backfill_progress(conn, "wi")
+        assert progress["next_index"] == 7 and progress["completed"] == {"a", "b"}
+        assert bf.load_discover_progress(conn, "sweep")["next_index"] == 12
+        assert list(bf.discovered_stores_map(conn)) == ["a"]
+        conn.close()
+        assert not bf.WI_STATE.exists()
+        assert bf.WI_STATE.with_name(bf.WI_STATE.name + ".migrated").exists()
+
+
+# ---------------------------------------------------------------------------
+# Exports
+# ---------------------------------------------------------------------------
+
+class TestExporter:
+    def _calendar(self, title="Turtle Dove", fetched_at="t1"):
+        return {"fetched_at": fetched_at, "segment": "wi", "store": {"slug": "a"}, "flavors": [{"title": title}]}
+
+    def test_calendar_rewritten_only_on_change(self, bf, tmp_path):
+        exporter = bf.Exporter(tmp_path, tmp_path / "log.ndjson")
+        assert exporter.write_calendar("a", self._calendar()) is True
+        assert exporter.write_calendar("a", self._calendar(fetched_at="t2")) is False
+        assert exporter.write_calendar("a", self._calendar(title="Mint")) is True
+        assert json.loads((tmp_path / "a.json").read_text())["flavors"] == [{"title": "Mint"}]
+        assert not list(tmp_path.glob(".*.tmp"))
+
+    def test_log_rotates_and_compresses(self, bf, tmp_path):
+        log = tmp_path / "runs.ndjson"
+        exporter = bf.Exporter(tmp_path, log, max_log_bytes=200)
+        for i in range(20):
+            exporter.log_snapshot({"store_slug": f"s{i}", "flavor_count": i})
+        exporter.close()
+        rotated = sorted(tmp_path.glob("runs.*.ndjson.gz"))
+        assert rotated
+        lines = [l for p in rotated for l in gzip.decompress(p.read_bytes()).decode().splitlines()]
+        lines += log.read_text().splitlines()
+        assert [json.loads(l)["flavor_count"] for l in lines] == list(range(20))
+
+    def test_pack_roundtrip(self, bf, tmp_path):
+        cal_dir = tmp_path / "cals"
+        cal_dir.mkdir()
+        for slug in ("a", "b", "c"):
+            (cal_dir / f"{slug}.json").write_text(json.dumps({"store": {"slug": slug}, "flavors": []}))
+        pack = tmp_path / "cals.pack"
+        assert bf.write_calendar_pack(cal_dir, pack) == 3
+        assert bf.read_packed_calendar(pack, "b") == {"store": {"slug": "b"}, "flavors": []}
+        assert bf.read_packed_calendar(pack, "zzz") is None
+
+
+# ---------------------------------------------------------------------------
+# Fake Worker
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def fake_worker(bf, monkeypatch):
+    worker = _load_module("fake_worker").FakeWorker(stores=120, page_limit=20).start()
+    monkeypatch.setattr(bf, "API_BASE", worker.url)
+    yield worker
+    bf.reset_client()
+    worker.stop()
+
+
+class TestFakeWorker:
+    def test_serves_contract_shapes_with_etags(self, bf, fake_worker):
+        status, headers, payload = bf.get_json_conditional("/api/v1/flavors", {"slug": "mt-horeb"})
+        assert status == 200 and headers["api-version"] == "1"
+        assert payload["flavors"] and all(len(f["date"]) == 10 for f in payload["flavors"])
+        status, _, payload = bf.get_json_conditional(
+            "/api/v1/flavors", {"slug": "mt-horeb"}, validators={"etag": headers["etag"]}
+        )
+        assert status == 304 and payload is None
+        stores = bf.get_json("/api/v1/stores", {"q": "a"})["stores"]
+        assert len(stores) == 20
+
+    def test_injects_rate_limits(self, bf, fake_worker, monkeypatch):
+        monkeypatch.setattr(bf, "_retry", bf.RetryPolicy(retries=0))
+        fake_worker.rate_limit_rate = 1.0
+        with pytest.raises(urllib.error.HTTPError) as exc:
+            bf.get_json("/api/v1/stores", {"q": "mt"})
+        assert exc.value.code == 429
+        assert exc.value.headers["Retry-After"] == "1"
+
+    def test_discover_and_backfill_end_to_end(self, bf, fake_worker, capsys):
+        assert bf.stage_discover(_discover_args(tokens_per_run=10_000)) == 0
+        wi = json.loads(bf.WI_STORES_PATH.read_text())
+        rest = json.loads(bf.REST_STORES_PATH.read_text())
+        assert len(wi) + len(rest) > 100
+        assert bf.stage_backfill(_backfill_args(segment="wi", stores_per_run=1000, concurrency=4)) == 0
+        conn = sqlite3.connect(bf.DB_PATH)
+        assert conn.execute("SELECT COUNT(DISTINCT store_slug) FROM store_flavors").fetchone()[0] == len(wi)
+        conn.close()
+
+    def test_backfill_keeps_connections_across_lease_chunks(self, bf, fake_worker):
+        bf.WI_STORES_PATH.write_text(json.dumps(fake_worker.stores[:60]))
+        bf.get_client().get_json("/api/v1/stores", {"q": "a"})
+        # 60 stores in chunks of 16: one pool, so one connection per thread.
+        assert bf.stage_backfill(_backfill_args(stores_per_run=60, concurrency=4, commit_every=5)) == 0
+        assert bf.get_client().connections <= 1 + 4
+        # A later run's threads close the finished pool's connections.
+        assert bf.stage_backfill(_backfill_args(stores_per_run=60, concurrency=4, reset=True, force=True)) == 0
+        assert bf.get_client().connections <= 1 + 8
+        assert len(bf.get_client()._open) <= 1 + 4
+
+
+class TestPipeline:
+    def _run(self, bf, capsys, *extra: str) -> tuple[dict, list[str]]:
+        argv = ["pipeline", "--tokens-per-run", "10000", "--concurrency", "4", "--rate", "1000", "--retries", "0"]
+        assert bf.stage_pipeline(bf.build_parser().parse_args([*argv, *extra])) == 0
+        lines = capsys.readouterr().out.strip().splitlines()
+        return json.loads(lines[-1].split(" ", 1)[1]), [line for line in lines if line.startswith("ok ")]
+
+    def test_backfills_stores_as_discovery_finds_them(self, bf, fake_worker, capsys):
+        summary, fetched = self._run(bf, capsys)
+        assert summary["stores_seen"] == len(fake_worker.stores)
+        assert summary["queue_remaining"] == 0 and summary["first_store_seconds"] is not None
+        assert fetched[0].startswith("ok segment=wi ")
+        conn = bf.init_db()
+        completed = dict(conn.execute("SELECT segment, COUNT(*) FROM backfill_completed GROUP BY segment"))
+        wi = sum(1 for store in fake_worker.stores if store["state"] == "WI")
+        assert completed == {"wi": wi, "rest": len(fake_worker.stores) - wi}
+        assert conn.execute("SELECT COUNT(*) FROM backfill_leases").fetchone()[0] == 0
+        conn.close()
+        assert bf.stage_status(argparse.Namespace()) == 0
+        status = json.loads(capsys.readouterr().out)
+        assert {segment: status["backfill"][segment]["completed"] for segment in completed} == completed
+
+        # Discovery's checkpoint is done and backfill has nothing left to fetch.
+        assert bf.stage_discover(_discover_args(tokens_per_run=10_000)) == 0
+        assert bf.stage_backfill(_backfill_args(segment="wi", stores_per_run=1000)) == 0
+        assert not [line for line in capsys.readouterr().out.splitlines() if line.startswith("ok ")]
+
+    def test_commits_once_per_batch(self, bf, fake_worker, monkeypatch, capsys):
+        commits = _count_commits(bf, monkeypatch)
+        _, fetched = self._run(bf, capsys, "--commit-every", "25")
+        assert len(fetched) == len(fake_worker.stores)
+        # Lease claims and discovery checkpoints ride in the store batches.
+        assert len(commits) <= len(fake_worker.stores) // 25 + 2
+
+    def test_queue_is_bounded(self, bf, fake_worker, capsys):
+        summary, fetched = self._run(bf, capsys, "--queue-size", "5")
+        assert len(fetched) == len(fake_worker.stores)
+        # A full queue holds discovery back; one search page can still land on it.
+        assert summary["queue_high_water"] < 5 + fake_worker.page_limit
+
+    def test_rerun_skips_completed_stores(self, bf, fake_worker, capsys):
+        self._run(bf, capsys)
+        summary, fetched = self._run(bf, capsys, "--reset")
+        assert fetched == []
+        assert summary["stores_seen"] == len(fake_worker.stores)
+
+
+# ---------------------------------------------------------------------------
+# Rate limiting
+# ---------------------------------------------------------------------------
+
+class TestRateLimiter:
+    def test_parse_retry_after(self, bf):
+        assert bf.parse_retry_after("3") == 3.0
+        assert bf.parse_retry_after("Thu, 01 Jan 1970 00:00:10 GMT", now=4.0) == 6.0
+        assert bf.parse_retry_after("soon") is None
+        assert bf.parse_retry_after(None) is None
+
+    def test_aimd_adjusts_rate(self, bf):
+        limiter = bf.RateLimiter(rate=4.0, min_rate=1.0, max_rate=10.0)
+        for _ in range(3):
+            limiter.on_success()
+        assert limiter.rate == 7.0
+        limiter.on_throttle()
+        limiter.on_throttle()  # same burst: cut once
+        assert limiter.rate == 3.5 and limiter.throttled == 2
+        limiter.on_success()
+        assert limiter.rate == pytest.approx(3.5 + 1 / 3.5)
+        for _ in range(100):
+            limiter.on_success()
+        assert limiter.rate == 10.0
+
+    def test_retry_after_pauses_bucket(self, bf):
+        limiter = bf.RateLimiter(rate=1000.0)
+        limiter.on_throttle(retry_after=0.2)
+        started = time.monotonic()
+        limiter.acquire()
+        assert time.monotonic() - started >= 0.19
+
+    def test_retries_transient_errors_only(self, bf):
+        policy = bf.RetryPolicy(retries=3, base_delay=0.001)
+        limiter = bf.RateLimiter(rate=1000.0)
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise urllib.error.HTTPError("u", 503, "busy", {}, None)
+            return "ok"
+
+        assert policy.call(limiter, flaky) == "ok"
+        assert policy.summary() == {"retries": 2, "gave_up": 0}
+
+        def missing():
+            raise urllib.error.HTTPError("u", 404, "nope", {}, None)
+
+        with pytest.raises(urllib.error.HTTPError):
+            policy.call(limiter, missing)
+        assert policy.summary()["retries"] == 2
+
+    def test_backfill_rides_out_429s(self, bf, fake_worker, monkeypatch, capsys):
+        monkeypatch.setattr(bf.RetryPolicy, "backoff", lambda self, attempt, retry_after=None: 0.0)
+        bf.WI_STORES_PATH.write_text(json.dumps(fake_worker.stores[:40]))
+        fake_worker.rate_limit_rate = 0.25
+        fake_worker.retry_after = 0
+        assert bf.stage_backfill(_backfill_args(stores_per_run=40, concurrency=4, retries=8)) == 0
+        summary = json.loads(capsys.readouterr().out.strip().splitlines()[-1].split(" ", 1)[1])
+        assert summary["failures_this_run"] == 0 and summary["success_this_run"] == 40
+        assert summary["rate_limit"]["throttled"] > 0
+        assert summary["rate_limit"]["retries"] == summary["rate_limit"]["throttled"]
+
+
+# ---------------------------------------------------------------------------
+# Leases
+# ---------------------------------------------------------------------------
+
+WORKER_SCRIPT = """
+import sys
+from pathlib import Path
+sys.path.insert(0, sys.argv[1])
+import backfill_custard as bf
+bf.use_data_dir(Path(sys.argv[2]))
+bf.API_BASE = sys.argv[3]
+sys.argv = ["backfill_custard.py", "--no-metrics", *sys.argv[4:]]
+raise SystemExit(bf.main())
+"""
+
+
+class TestLeases:
+    NOW = datetime(2026, 10, 17, 12, tzinfo=UTC)
+
+    def test_claims_commit_with_the_batch(self, bf, monkeypatch):
+        bf.write_json(bf.WI_STORES_PATH, _stores(60))
+        _serve(bf, monkeypatch, _flavors_for)
+        commits = _count_commits(bf, monkeypatch)
+        # Four lease chunks of 16, six batches of 10 and the final checkpoint.
+        bf.stage_backfill(_backfill_args(stores_per_run=60, concurrency=4, commit_every=10))
+        assert _progress(bf)["next_index"] == 60
+        assert len(commits) <= 60 // 10 + 1
+
+    def test_claims_exclude_other_owners_until_expiry(self, bf):
+        conn = bf.init_db()
+        lease = timedelta(minutes=10)
+        assert bf.claim_stores(conn, "wi", ["a", "b"], "w1", self.NOW, lease) == {"a", "b"}
+        assert bf.claim_stores(conn, "wi", ["a", "b", "c"], "w2", self.NOW, lease) == {"c"}
+        assert bf.claim_stores(conn, "wi", ["a"], "w1", self.NOW, lease) == {"a"}
+
+        bf.mark_backfill_completed(conn, "wi", "b", "t")
+        bf.release_lease(conn, "wi", "w1", "b")
+        later = self.NOW + timedelta(minutes=11)
+        assert bf.claim_stores(conn, "wi", ["a", "b"], "w2", later, lease) == {"a"}
+        assert bf.lease_summary(conn, "wi", later.isoformat()) == {"active": 1, "expired": 1, "owners": 1}
+        conn.close()
+
+    def test_backfill_skips_leased_stores_and_reclaims_expired(self, bf, monkeypatch, capsys):
+        bf.write_json(bf.WI_STORES_PATH, _stores(6))
+        conn = bf.init_db()
+        bf.claim_stores(conn, "wi", ["store-002"], "crashed", datetime.now(UTC), timedelta(minutes=10))
+        conn.commit()
+        conn.close()
+
+        fetched = []
+        _serve(bf, monkeypatch, lambda slug: fetched.append(slug) or _flavors_for(slug))
+        bf.stage_backfill(_backfill_args(owner="me"))
+        assert "store-002" not in fetched and len(fetched) == 5
+        summary = json.loads(capsys.readouterr().out.strip().splitlines()[-1].split(" ", 1)[1])
+        assert summary["next_index"] == 2 and summary["leases"] == {"active": 1, "expired": 0, "owners": 1}
+
+        conn = bf.init_db()
+        conn.execute("UPDATE backfill_leases SET expires_at = '2000-01-01T00:00:00+00:00'")
+        conn.commit()
+        conn.close()
+        fetched.clear()
+        bf.stage_backfill(_backfill_args(owner="me"))
+        assert fetched == ["store-002"]
+        assert _progress(bf)["next_index"] == 6
+
+    def test_interrupted_run_returns_its_leases(self, bf, monkeypatch):
+        bf.write_json(bf.WI_STORES_PATH, _stores(3))
+
+        def handler(slug):
+            raise KeyboardInterrupt
+
+        _serve(bf, monkeypatch, handler)
+        with pytest.raises(KeyboardInterrupt):
+            bf.stage_backfill(_backfill_args(owner="me"))
+        conn = bf.init_db()
+        assert conn.execute("SELECT COUNT(*) FROM backfill_leases").fetchone()[0] == 0
+        conn.close()
+
+    def test_parallel_processes_split_a_segment(self, bf, fake_worker, tmp_path):
+        bf.WI_STORES_PATH.write_text(json.dumps(fake_worker.stores[:60]))
+        bf.init_db().close()
+        argv = ["backfill", "--segment", "wi", "--stores-per-run", "60", "--concurrency", "2", "--rate", "1000",
+                "--commit-every", "5"]
+        data_dir = bf.DATA_DIR
+        workers = [
+            subprocess.Popen(
+                [sys.executable, "-c", WORKER_SCRIPT, str(SCRIPTS), str(data_dir), fake_worker.url, *argv,
+                 "--owner", f"w{n}"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+            for n in range(2)
+        ]
+        summaries = []
+        for proc in workers:
+            out, err = proc.communicate(timeout=60)
+            assert proc.returncode == 0, err
+            summaries.append(json.loads(out.strip().splitlines()[-1].split(" ", 1)[1]))
+
+        assert sum(s["success_this_run"] for s in summaries) == 60
+        conn = sqlite3.connect(bf.DB_PATH)
+        assert conn.execute("SELECT COUNT(*) FROM backfill_completed").fetchone()[0] == 60
+        assert conn.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0] == 60
+        conn.close()
+
+
+# ---------------------------------------------------------------------------
+# Daemon
+# ---------------------------------------------------------------------------
+
+class TestDaemon:
+    ARGV = ("daemon", "--port", "-1", "--rate", "1000", "--retries", "0")
+
+    def _run(self, bf, *extra):
+        args = bf.build_parser().parse_args([*self.ARGV, *extra])
+        return bf.stage_daemon(args)
+
+    def test_once_runs_each_task_on_one_connection(self, bf, fake_worker, monkeypatch, capsys):
+        opened = []
+        real_connect = bf.sqlite3.connect
+        monkeypatch.setattr(bf.sqlite3, "connect", lambda *a, **k: opened.append(1) or real_connect(*a, **k))
+
+        # Fresh deployment: nothing to backfill until discovery has run.
+        assert self._run(bf, "--once") == 0
+        tasks = json.loads(capsys.readouterr().out.strip().splitlines()[-1].split(" ", 1)[1])["tasks"]
+        assert tasks["discover"]["runs"] == 1 and tasks["backfill_wi"]["skipped"] == 1
+        assert len(opened) == 1
+
+        assert self._run(bf, "--once", "--backfill-stores", "500") == 0
+        lines = capsys.readouterr().out.strip().splitlines()
+        tasks = json.loads(lines[-1].split(" ", 1)[1])["tasks"]
+        assert all(t["runs"] == 1 and t["last_rc"] == 0 for name, t in tasks.items() if name != "refresh")
+        # The finished sweep was started over.
+        assert any(line.startswith("discover ") and '"requests_this_run": 0' not in line for line in lines)
+        conn = sqlite3.connect(bf.DB_PATH)
+        assert conn.execute("SELECT COUNT(*) FROM backfill_completed").fetchone()[0] == 120
+        conn.close()
+
+    def test_scheduled_runs_share_warm_connections(self, bf, fake_worker, capsys):
+        bf.WI_STORES_PATH.write_text(json.dumps([s for s in fake_worker.stores if s["state"] == "WI"][:20]))
+        bf.REST_STORES_PATH.write_text(json.dumps([s for s in fake_worker.stores if s["state"] != "WI"][:20]))
+        argv = ["--once", "--refresh-minutes", "0", "--discover-hours", "0", "--concurrency", "4"]
+        assert self._run(bf, *argv) == 0
+        runs = [json.loads(line.split(" ", 1)[1]) for line in capsys.readouterr().out.splitlines()
+                if line.startswith("backfill ")]
+        # The second run fetched on the first run's threads and connections.
+        assert [run["success_this_run"] for run in runs] == [20, 20]
+        assert runs[-1]["http"]["requests"] == 40 and runs[-1]["http"]["connections_opened"] <= 4
+
+    def test_sigterm_stops_backfill_at_a_checkpoint(self, bf, monkeypatch):
+        bf.write_json(bf.WI_STORES_PATH, _stores(10))
+        fetched = []
+
+        def handler(slug):
+            fetched.append(slug)
+            if len(fetched) == 3:
+                os.kill(os.getpid(), signal.SIGTERM)
+            return _flavors_for(slug)
+
+        _serve(bf, monkeypatch, handler)
+        assert self._run(bf, "--refresh-minutes", "0", "--discover-hours", "0", "--concurrency", "1") == 0
+        assert fetched == ["store-000", "store-001", "store-002"]
+        assert _progress(bf)["next_index"] == 3
+        assert signal.getsignal(signal.SIGTERM) is signal.SIG_DFL
+
+    def test_shutdown_cuts_rate_limit_and_backoff_waits(self, bf):
+        limiter = bf.RateLimiter(rate=1000.0)
+        limiter.on_throttle(retry_after=30)
+        policy = bf.RetryPolicy(retries=3, base_delay=30.0, max_delay=30.0)
+
+        def unavailable():
+            raise urllib.error.URLError("down")
+
+        threading.Timer(0.1, bf.SHUTDOWN.set).start()
+        started = time.monotonic()
+        with pytest.raises(urllib.error.URLError, match="shutting down"):
+            limiter.acquire()
+        with pytest.raises(urllib.error.URLError, match="down"):
+            policy.call(bf.RateLimiter(rate=1000.0), unavailable)
+        assert time.monotonic() - started < 5
+        assert policy.summary()["retries"] == 1
+
+    def test_health_and_metrics_endpoints(self, bf):
+        daemon = bf.Daemon([bf.ScheduledTask("noop", 60.0, 0, lambda: ["status"])])
+        daemon.run(once=True)
+        server = bf.serve_daemon_http(daemon, "127.0.0.1", 0)
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            health = json.loads(urllib.request.urlopen(base + "/healthz").read())
+            assert health["status"] == "ok" and health["tasks"]["noop"]["runs"] == 1
+            metrics = urllib.request.urlopen(base + "/metrics").read().decode()
+            assert 'custard_backfill_daemon_task_runs_total{stage="",rc="0",task="noop"} 1.0' in metrics
+            bf.SHUTDOWN.set()
+            with pytest.raises(urllib.error.HTTPError) as err:
+                urllib.request.urlopen(base + "/healthz")
+            assert err.value.code == 503
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+# ---------------------------------------------------------------------------
+# Metrics and profiling
+# ---------------------------------------------------------------------------
+
+class TestMetrics:
+    def test_histogram_and_prometheus_text(self, bf):
+        metrics = bf.Metrics()
+        metrics.reset("backfill")
+        for seconds in (0.003, 0.004, 0.2, 99.0):
+            metrics.observe("db_write_seconds", seconds, op="commit")
+        metrics.inc("http_wire_bytes_total", 512, endpoint="/api/v1/flavors")
+        snapshot = metrics.snapshot()
+        hist = snapshot["histograms"][0]
+        assert (hist["count"], hist["buckets"]["0.005"], hist["buckets"]["0.25"], hist["buckets"]["+Inf"]) == (4, 2, 1, 1)
+        assert snapshot["counters"] == [
+            {"name": "http_wire_bytes_total", "labels": {"endpoint": "/api/v1/flavors"}, "value": 512.0}
+        ]
+        text = metrics.prometheus(snapshot)
+        assert 'custard_backfill_db_write_seconds_bucket{stage="backfill",op="commit",le="0.25"} 3.0' in text
+        assert 'custard_backfill_db_write_seconds_bucket{stage="backfill",op="commit",le="+Inf"} 4.0' in text
+        assert "# TYPE custard_backfill_http_wire_bytes_total counter" in text
+
+    def test_cli_run_writes_metrics_and_profile(self, bf, fake_worker, monkeypatch, capsys):
+        bf.WI_STORES_PATH.write_text(json.dumps(fake_worker.stores[:5]))
+        argv = ["backfill_custard.py", "--profile", "backfill", "--segment", "wi", "--rate", "1000", "--retries", "0"]
+        monkeypatch.setattr(sys, "argv", argv)
+        assert bf.main() == 0
+        assert json.loads(capsys.readouterr().err.strip().splitlines()[-1].split(" ", 1)[1])["peak_bytes"] > 0
+
+        (record,) = [json.loads(line) for line in (bf.METRICS_DIR / "metrics.ndjson").read_text().splitlines()]
+        assert record["stage"] == "backfill"
+        counters = {(c["name"], c["labels"].get("status")): c["value"] for c in record["counters"]}
+        assert counters[("http_responses_total", "200")] == 5
+        assert counters[("http_wire_bytes_total", None)] > 0
+        ops = {h["labels"].get("op") or h["labels"].get("kind"): h["count"] for h in record["histograms"]}
+        assert ops["store_payload"] == 5 and ops["calendar"] == 5 and ops["commit"] >= 1
+        assert (bf.METRICS_DIR / "custard_backfill_backfill.prom").exists()
+        assert {p.suffix for p in bf.PROFILE_DIR.iterdir()} == {".pstats", ".txt"}
+
+
+# ---------------------------------------------------------------------------
+# Static export
+# ---------------------------------------------------------------------------
+
+class TestStaticExport:
+    TODAY = "2026-10-17"
+
+    def _record(self, conn, bf, slug, titles):
+        payload = {
+            "name": slug.title(),
+            "flavors": [
+                {"date": f"2026-10-{16 + i:02d}", "title": title, "description": "d"} for i, title in enumerate(titles)
+            ],
+        }
+        bf.record_store_payload(conn, "wi", {"slug": slug, "name": slug, "state": "WI"}, payload, bf.utc_now())
+        conn.commit()
+
+    def _export(self, bf, capsys, *extra):
+        capsys.readouterr()
+        args = bf.build_parser().parse_args(["export", "--date", self.TODAY, "--days", "2", *extra])
+        assert bf.stage_export(args) == 0
+        return json.loads(capsys.readouterr().out.strip().split(" ", 1)[1])
+
+    def _manifest(self, bf):
+        return json.loads((bf.EXPORT_DIR / "manifest.json").read_text())
+
+    def test_shards_are_trimmed_and_grouped_by_prefix(self, bf, capsys):
+        conn = bf.init_db()
+        for slug in ("mt-horeb", "madison", "kopps-greenfield"):
+            self._record(conn, bf, slug, ["Past", "Today", "Tomorrow", "Day After", "Too Far"])
+        conn.close()
+
+        summary = self._export(bf, capsys)
+        assert summary["shards"] == 3 and summary["stores_indexed"] == 3
+        manifest = self._manifest(bf)
+        assert sorted(manifest["shards"]) == ["ko", "ma", "mt"]
+        shard = json.loads((bf.EXPORT_DIR / manifest["shards"]["mt"]["file"]).read_text())
+        flavors = shard["stores"]["mt-horeb"]["flavors"]
+        assert [f["title"] for f in flavors] == ["Today", "Tomorrow", "Day After"]
+        assert shard["stores"]["mt-horeb"]["brand"] == "culvers"
+        index = json.loads((bf.EXPORT_DIR / manifest["stores_index"]["file"]).read_text())
+        assert [row[0] for row in index["stores"]] == ["kopps-greenfield", "madison", "mt-horeb"]
+        assert index["stores"][0][4] == "kopps"
+
+    def test_only_changed_shards_are_rewritten(self, bf, capsys):
+        conn = bf.init_db()
+        for slug in ("mt-horeb", "kopps-greenfield"):
+            self._record(conn, bf, slug, ["Past", "Today", "Tomorrow"])
+        self._export(bf, capsys)
+        before = self._manifest(bf)
+
+        summary = self._export(bf, capsys)
+        assert (summary["shards_written"], summary["full_rebuild"]) == (0, False)
+
+        self._record(conn, bf, "mt-horeb", ["Past", "Today", "Changed"])
+        summary = self._export(bf, capsys)
+        after = self._manifest(bf)
+        assert summary["shards_written"] == 1 and summary["files_removed"] == 0
+        assert after["shards"]["ko"] == before["shards"]["ko"]
+        assert after["shards"]["mt"]["file"] != before["shards"]["mt"]["file"]
+        # Clients still holding manifest N-1 can fetch its files after export N.
+        assert after["retained"] == [before["shards"]["mt"]["file"]]
+        assert all((bf.EXPORT_DIR / m["file"]).exists() for m in [before["stores_index"], *before["shards"].values()])
+
+        # An unchanged export keeps N-1; the next generation drops it.
+        assert self._export(bf, capsys)["files_removed"] == 0
+        self._record(conn, bf, "mt-horeb", ["Past", "Today", "Changed Again"])
+        conn.close()
+        summary = self._export(bf, capsys)
+        assert summary["files_removed"] == 1
+        assert not (bf.EXPORT_DIR / before["shards"]["mt"]["file"]).exists()
+        assert (bf.EXPORT_DIR / after["shards"]["mt"]["file"]).exists()
+
+    def test_new_day_rebuilds_everything(self, bf, capsys):
+        conn = bf.init_db()
+        self._record(conn, bf, "mt-horeb", ["Past", "Today", "Tomorrow"])
+        conn.close()
+        self._export(bf, capsys)
+        self.TODAY = "2026-10-18"
+        summary = self._export(bf, capsys)
+        assert summary["full_rebuild"] is True and summary["shards_written"] == 1
@@ -0,0 +1,92 @@
+"""Offline tests for scripts/flavor_matrix.py.
+
+Run:
+    pytest tests/test_flavor_matrix.py -v
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+SCRIPTS = Path(__file__).resolve().parents[1] / "scripts"
+sys.path.insert(0, str(SCRIPTS))
+
+import backfill_custard as bf
+import flavor_matrix as fm
+
+SEEN_AT = "2026-10-17T06:00:00+00:00"
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    """A backfill database under tmp_path with three stores."""
+    original_root = bf.ROOT
+    for name, value in list(vars(bf).items()):
+        if isinstance(value, Path) and value.is_relative_to(original_root):
+            monkeypatch.setattr(bf, name, tmp_path / value.relative_to(original_root))
+    bf.ensure_dirs()
+    monkeypatch.setattr(bf, "_exporter", None)
+    db = bf.init_db()
+    _fetch(db, "mt-horeb", "WI", {"2026-10-17": "Mint Explosion", "2026-10-18": "Turtle Dove"})
+    _fetch(db, "kopps-glendale", "WI", {"2026-10-17": "Butter Pecan", "2026-10-19": "Andes Mint Avalanche"})
+    _fetch(db, "rockford", "IL", {"2026-10-18": "Mint Explosion"})
+    yield db
+    db.close()
+    bf.get_exporter().close()
+
+
+def _fetch(db, slug: str, state: str, titles: dict[str, str]) -> None:
+    flavors = [{"date": d, "title": t} for d, t in titles.items()]
+    bf.record_store_payload(db, "wi", {"slug": slug, "state": state}, {"flavors": flavors}, SEEN_AT)
+    db.commit()
+
+
+class TestBuild:
+    def test_full_build_and_queries(self, conn, tmp_path):
+        summary = fm.update_matrix(conn, tmp_path / "matrix")
+        assert summary == {"mode": "full", "cells": 5, "start": "2026-10-17", "days": 3, "stores": 3, "flavors": 4}
+
+        m = fm.FlavorMatrix(tmp_path / "matrix")
+        assert isinstance(m.ids, np.memmap)
+        assert m.slugs.tolist() == ["kopps-glendale", "mt-horeb", "rockford"]
+        assert m.brands.tolist() == [fm.BRANDS.index("kopps"), 0, 0]
+        assert m.ids[1].tolist() == [m.norms.tolist().index("mint explosion"), m.norms.tolist().index("turtle dove"), 0]
+
+        wi_mint = m.serving("MINT", "2026-10-17", "2026-10-23", state="WI")
+        assert [(r["slug"], r["date"], r["title"]) for r in wi_mint] == [
+            ("kopps-glendale", "2026-10-19", "Andes Mint Avalanche"),
+            ("mt-horeb", "2026-10-17", "Mint Explosion"),
+        ]
+        assert m.serving("mint", "2026-10-18", "2026-10-18", brand="kopps") == []
+        assert m.frequency()[0] == ("Mint Explosion", 2)
+        assert m.frequency(first="2026-10-19") == [("Andes Mint Avalanche", 1)]
+
+    def test_incremental_update_in_place(self, conn, tmp_path):
+        out = tmp_path / "matrix"
+        fm.update_matrix(conn, out)
+        inode = (out / "ids.npy").stat().st_ino
+        assert fm.update_matrix(conn, out)["mode"] == "unchanged"
+
+        _fetch(conn, "mt-horeb", "WI", {"2026-10-17": "Mint Explosion", "2026-10-18": "Really Reese’s"})
+        summary = fm.update_matrix(conn, out)
+        assert (summary["mode"], summary["cells"], summary["flavors"]) == ("incremental", 1, 5)
+        assert (out / "ids.npy").stat().st_ino == inode
+
+        # A new store and a date past the allocated columns grow the arrays.
+        _fetch(conn, "madison", "WI", {"2026-10-17": "Turtle Dove", "2027-01-30": "Turtle Dove"})
+        summary = fm.update_matrix(conn, out)
+        assert (summary["stores"], summary["days"]) == (4, 106)
+
+        m = fm.FlavorMatrix(out)
+        fm.build_matrix(conn, tmp_path / "rebuilt")
+        rebuilt = fm.FlavorMatrix(tmp_path / "rebuilt")
+        for slug in m.slugs.tolist():
+            row, other = m.slugs.tolist().index(slug), rebuilt.slugs.tolist().index(slug)
+            assert m.titles[m.ids[row]].tolist() == rebuilt.titles[rebuilt.ids[other]].tolist()
+        assert json.loads((out / "meta.json").read_text())["changes_cursor"] == fm._changes_cursor(conn)
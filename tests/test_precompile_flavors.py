@@ -0,0 +1,101 @@
+"""Offline tests for scripts/precompile_flavors.py.
+
+Run:
+    pytest tests/test_precompile_flavors.py -v
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import json
+import re
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+SCRIPT = Path(__file__).resolve().parents[1] / "scripts" / "precompile_flavors.py"
+
+
+@pytest.fixture(scope="module")
+def pc():
+    spec = importlib.util.spec_from_file_location("precompile_flavors", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["precompile_flavors"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="module")
+def data(pc):
+    return pc.StarData(pc.STAR_PATH.read_text(encoding="utf-8"))
+
+
+class TestStarData:
+    def test_reads_literals_from_app(self, data):
+        assert data.profiles["turtle"]["ribbon"] == "caramel"
+        assert data.abbr_map["Chocolate"] == "Choc"
+        assert "Avlnc" in data.base_nouns
+        assert data.demo_titles == ["Chocolate Caramel Twist", "Mint Explosion", "Turtle Dove"]
+
+
+class TestPort:
+    @pytest.mark.parametrize(
+        "title, lines",
+        [
+            ("Mint Explosion", ["Mint", "Expl"]),
+            ("Turtle Dove", ["Turtl", "Dove"]),
+            ("OREO Cookie Cheesecake", ["Oreo", "Chees"]),
+            ("Turtle", ["Turtl"]),
+            ("Crazy for Cookie Dough", ["Cook", "Dough"]),
+            ("Lemon Berry Layer Cake", ["Berry", "Cake"]),
+            ("Pumpkin Pecan", ["Pumpk", "Pecan"]),
+            ("Blackberry", ["Black"]),
+            ("", ["???"]),
+        ],
+    )
+    def test_display_lines(self, pc, data, title, lines):
+        assert pc.display_lines(data, title) == lines
+
+    def test_profile_match_kinds(self, pc, data):
+        assert pc.flavor_profile(data, "Really Reese’s")[1:] == ("exact", "really reese's")
+        profile, kind, key = pc.flavor_profile(data, "Mint Chip")
+        assert (profile["base"], kind, key) == ("mint", "keyword", None)
+        assert pc.flavor_profile(data, "Blackberry Cobbler")[1] == "generic"
+
+
+class TestGeneratedTable:
+    def test_check_and_write(self, pc, tmp_path, monkeypatch, capsys):
+        star = tmp_path / "app.star"
+        star.write_text(pc.STAR_PATH.read_text(encoding="utf-8"), encoding="utf-8")
+        db = tmp_path / "flavors.sqlite"
+        conn = sqlite3.connect(db)
+        conn.execute("CREATE TABLE store_flavors (title TEXT)")
+        conn.executemany("INSERT INTO store_flavors VALUES (?)", [("Butter Pecan",), ("Blackberry Cobbler",)])
+        conn.commit()
+        conn.close()
+
+        argv = ["precompile_flavors.py", "--star", str(star), "--db", str(db)]
+        monkeypatch.setattr(sys, "argv", argv + ["--check"])
+        assert pc.main() == 1
+        monkeypatch.setattr(sys, "argv", argv)
+        assert pc.main() == 0
+        out, err = capsys.readouterr()
+        summary = json.loads(out.splitlines()[-1].split(" ", 1)[1])
+        assert summary["titles"] == 5 and summary["generic"] == 1
+        assert "generic profile: Blackberry Cobbler" in err
+
+        source = star.read_text(encoding="utf-8")
+        assert '"Butter Pecan": {"lines": ["Buttr", "Pecan"], "profile": FLAVOR_PROFILES["butter pecan"]},' in source
+        assert '"Blackberry Cobbler": {"lines": ["Black", "Cobbl"], "profile": {"base": "vanilla"' in source
+        monkeypatch.setattr(sys, "argv", argv + ["--check"])
+        assert pc.main() == 0
+
+    def test_committed_table_matches_port(self, pc, data):
+        source = pc.STAR_PATH.read_text(encoding="utf-8")
+        block = source[source.index(pc.BEGIN_MARKER) : source.index(pc.END_MARKER)]
+        entries = re.findall(r'^    (".*?"): \{"lines": (\[.*?\]), ', block, re.MULTILINE)
+        assert entries
+        for title, lines in entries:
+            assert json.loads(lines) == pc.display_lines(data, json.loads(title))
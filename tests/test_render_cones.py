@@ -0,0 +1,95 @@
+"""Golden-image tests for scripts/render_cones.py.
+
+The cone atlas in tests/golden/ is compared pixel for pixel, so any change
+to cone geometry, palettes or profiles shows up here without Pixlet. After
+an intended change, regenerate it with:
+    python scripts/render_cones.py --atlas tests/golden/cone_atlas.png
+
+Run:
+    pytest tests/test_render_cones.py -v
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import re
+import sys
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+SCRIPTS = Path(__file__).resolve().parents[1] / "scripts"
+GOLDEN = Path(__file__).resolve().parent / "golden"
+sys.path.insert(0, str(SCRIPTS))
+
+import render_cones as rc
+
+
+@pytest.fixture(scope="module")
+def data():
+    return rc.StarData(rc.STAR_PATH.read_text(encoding="utf-8"))
+
+
+def _hex(pixel) -> str:
+    return "#{:02X}{:02X}{:02X}".format(*pixel[:3])
+
+
+class TestRenderCone:
+    def test_turtle_dove_geometry(self, data):
+        img = rc.render_cone(data, data.profiles["turtle dove"])
+        assert img.shape == (11, 9, 4)
+        # Transparent corners, and the scoop's narrower first row.
+        assert img[0, 0, 3] == 0 and img[0, 1, 3] == 0 and img[10, 0, 3] == 0
+        assert _hex(img[0, 2]) == data.base_colors["vanilla"]
+        # Ribbon diagonal, toppings in T1/T2, checkerboard cone and tip.
+        assert [_hex(img[y, x]) for x, y in rc.RIBBON_PIXELS] == [data.ribbon_colors["marshmallow"]] * 3
+        assert _hex(img[1, 2]) == data.topping_colors["pecan"]
+        assert _hex(img[1, 6]) == data.topping_colors["dove"]
+        assert [_hex(img[6, x]) for x in range(2, 7)] == [rc.CONE_LIGHT, rc.CONE_DARK] * 2 + [rc.CONE_LIGHT]
+        assert _hex(img[10, 4]) == rc.CONE_DARK
+        assert int((img[..., 3] > 0).sum()) == 5 + 35 + 5 + 5 + 3 + 3 + 1
+
+    def test_ribbon_wins_over_fourth_topping(self, data):
+        profile = {"base": "vanilla", "ribbon": "fudge", "toppings": ["oreo", "dove", "pecan", "salt"],
+                   "density": "explosion"}
+        img = rc.render_cone(data, profile)
+        assert _hex(img[2, 5]) == data.ribbon_colors["fudge"]
+        img = rc.render_cone(data, {**profile, "ribbon": None})
+        assert _hex(img[2, 5]) == data.topping_colors["salt"]
+
+    def test_density_rules(self, data):
+        assert rc.topping_slots({"toppings": ["a", "b"], "density": "double"}) == ["a", "a", "b"]
+        assert rc.topping_slots({"toppings": ["a", "b"], "density": "overload"}) == ["a", "a"]
+        assert rc.topping_slots({"toppings": ["a"], "density": "pure"}) == []
+
+
+class TestAtlas:
+    def test_matches_golden(self, data):
+        atlas, keys = rc.render_atlas(data)
+        assert keys == json.loads((GOLDEN / "cone_atlas.json").read_text())
+        golden = rc.decode_png((GOLDEN / "cone_atlas.png").read_bytes())
+        assert golden.shape == atlas.shape
+        diff = np.argwhere((golden != atlas).any(axis=2))
+        assert diff.size == 0, f"{len(diff)} pixels differ, first at (y, x)={tuple(diff[0])}"
+
+    def test_covers_every_profile(self, data):
+        keys = set(rc.render_atlas(data)[1])
+        assert {rc.sprite_key(p) for p in data.profiles.values()} <= keys
+
+    def test_png_round_trip(self, data):
+        img = rc.render_cone(data, data.profiles["mint explosion"])
+        assert (rc.decode_png(rc.encode_png(img)) == img).all()
+
+
+class TestGeneratedTable:
+    def test_committed_sprites_match_renderer(self, data):
+        source = rc.STAR_PATH.read_text(encoding="utf-8")
+        block = source[source.index(rc.BEGIN_MARKER) : source.index(rc.END_MARKER)]
+        sprites = dict(re.findall(r'^    "(.*?)": "(.*?)",$', block, re.MULTILINE))
+        profiles = rc.all_profiles(data)
+        assert set(sprites) == set(profiles)
+        for key, src in sprites.items():
+            assert (rc.decode_png(base64.b64decode(src)) == rc.render_cone(data, profiles[key])).all()